@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ChoujiangConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'choujiang'
+
+    def ready(self):
+        # 注册信号处理器（奖品、参与条件变化时使抽奖渲染缓存失效）
+        from choujiang import signals  # noqa: F401
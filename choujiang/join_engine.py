@@ -0,0 +1,141 @@
+"""
+抽奖参与引擎
+
+在一个短事务内完成参与资格检查、积分扣除、参与记录和积分变动记录：
+- 积分扣除使用条件更新 UPDATE users SET points = points - X WHERE id = ? AND points >= X，
+  并发点击时不会重复扣分，也不会覆盖其他地方写入的积分
+- 重复参与依赖 Participant 的 unique_together 约束判断
+- 事务内以行锁重新确认抽奖仍为 ACTIVE，并从数据库读取成员是否仍在群组中，与开奖器认领抽奖互斥
+- 结果以状态码返回，调用方根据状态码回复用户，不抛出异常
+"""
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from jifen.leaderboard import apply_points_delta
+from jifen.models import PointTransaction, User
+
+from .models import Lottery, Participant
+
+logger = logging.getLogger(__name__)
+
+# 参与结果状态码
+JOIN_OK = 'OK'
+JOIN_LOTTERY_NOT_FOUND = 'LOTTERY_NOT_FOUND'
+JOIN_LOTTERY_CLOSED = 'LOTTERY_CLOSED'
+JOIN_NOT_MEMBER = 'NOT_MEMBER'
+JOIN_ALREADY_JOINED = 'ALREADY_JOINED'
+JOIN_INSUFFICIENT_POINTS = 'INSUFFICIENT_POINTS'
+JOIN_ERROR = 'ERROR'
+
+
+@dataclass(frozen=True)
+class JoinResult:
+    """参与抽奖的结果"""
+    code: str
+    lottery: Optional[Lottery] = None
+    points_spent: int = 0
+    # 用户当前积分（成功时为扣除后的积分）
+    user_points: int = 0
+
+    @property
+    def success(self) -> bool:
+        return self.code == JOIN_OK
+
+
+class _JoinAborted(Exception):
+    """事务内判定不满足条件时回滚用"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def _current_points(user_pk):
+    return User.objects.filter(pk=user_pk).values_list('points', flat=True).first() or 0
+
+
+def join_lottery_atomic(lottery_id, telegram_id) -> JoinResult:
+    """
+    让用户参与抽奖（同步函数，需在线程中调用）
+
+    参数:
+    lottery_id: 抽奖ID
+    telegram_id: 用户的Telegram ID
+    """
+    member_pk = None
+    lottery = None
+    try:
+        try:
+            lottery = Lottery.objects.select_related('group').get(id=lottery_id)
+        except Lottery.DoesNotExist:
+            logger.info(f"[抽奖参与] 用户 {telegram_id} 尝试参与不存在的抽奖 {lottery_id}")
+            return JoinResult(JOIN_LOTTERY_NOT_FOUND)
+
+        if lottery.status != 'ACTIVE' or not lottery.can_join:
+            logger.info(f"[抽奖参与] 抽奖ID={lottery_id}已结束或不可参与，状态={lottery.status}")
+            return JoinResult(JOIN_LOTTERY_CLOSED, lottery=lottery)
+
+        points_required = lottery.points_required
+        with transaction.atomic():
+            # 锁住仍为 ACTIVE 的抽奖行：开奖器把状态改为 DRAWING 的条件更新会等待本事务提交，
+            # 已开始开奖的抽奖则不会再插入参与记录、扣除积分
+            if not Lottery.objects.select_for_update().filter(id=lottery.id, status='ACTIVE').exists():
+                raise _JoinAborted(JOIN_LOTTERY_CLOSED)
+
+            # 成员状态以数据库为准（成员缓存可能是其他分片更新前的快照）
+            member_pk = User.objects.filter(
+                telegram_id=telegram_id, group_id=lottery.group_id, is_active=True
+            ).values_list('id', flat=True).first()
+            if member_pk is None:
+                raise _JoinAborted(JOIN_NOT_MEMBER)
+
+            # 先插入参与记录，重复参与会触发唯一约束
+            Participant.objects.create(
+                lottery=lottery,
+                user_id=member_pk,
+                points_spent=points_required
+            )
+
+            if points_required > 0:
+                # 条件扣除积分，积分不足时不更新任何行
+                updated = User.objects.filter(pk=member_pk, points__gte=points_required).update(
+                    points=F('points') - points_required
+                )
+                if not updated:
+                    raise _JoinAborted(JOIN_INSUFFICIENT_POINTS)
+                transaction.on_commit(lambda: apply_points_delta(lottery.group_id, member_pk, -points_required))
+
+                PointTransaction.objects.create(
+                    user_id=member_pk,
+                    group_id=lottery.group_id,
+                    amount=-points_required,
+                    type='RAFFLE_PARTICIPATION',
+                    description=f"参与抽奖 '{lottery.title}'",
+                    transaction_date=timezone.now().date()
+                )
+
+            user_points = _current_points(member_pk)
+    except IntegrityError:
+        logger.info(f"[抽奖参与] 用户 {telegram_id} 已经参与了抽奖ID={lottery_id}")
+        return JoinResult(JOIN_ALREADY_JOINED, lottery=lottery)
+    except _JoinAborted as e:
+        if e.code == JOIN_LOTTERY_CLOSED:
+            logger.info(f"[抽奖参与] 抽奖ID={lottery_id}已开始开奖，用户 {telegram_id} 无法参与")
+            return JoinResult(e.code, lottery=lottery)
+        if e.code == JOIN_NOT_MEMBER:
+            logger.info(f"[抽奖参与] 用户 {telegram_id} 尝试参与抽奖 {lottery_id}，但在群组 {lottery.group.group_id} 中不存在或已离开")
+            return JoinResult(e.code, lottery=lottery)
+        user_points = _current_points(member_pk)
+        logger.info(f"[抽奖参与] 用户 {telegram_id} 积分不足，当前积分={user_points}，需要积分={points_required}")
+        return JoinResult(e.code, lottery=lottery, user_points=user_points)
+    except Exception as e:
+        logger.error(f"[抽奖参与] 用户 {telegram_id} 参与抽奖ID={lottery_id}时出错: {e}", exc_info=True)
+        return JoinResult(JOIN_ERROR, lottery=lottery)
+
+    logger.info(f"[抽奖参与] 用户 {telegram_id} 成功参与抽奖ID={lottery_id}，扣除积分={points_required}，剩余积分={user_points}")
+    return JoinResult(JOIN_OK, lottery=lottery, points_spent=points_required, user_points=user_points)
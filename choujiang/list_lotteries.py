@@ -1,22 +1,110 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+"""
+群组抽奖列表
+
+原来每次翻页都要重新查询群组，再用 OFFSET 取一页并 COUNT 全部抽奖，群组抽奖越多翻到后面的页越慢。现在：
+- 按 (created_at, id) 游标分页：回调数据中带上当前页首/尾抽奖的游标，翻页只取游标之后的一页，
+  配合 (group, created_at, id) 索引，任何一页的代价都相同
+- 群组名称随抽奖一起查询（select_related），只有没有抽奖时才单独查询群组
+- 总页数使用按群组缓存的抽奖总数，缓存 LIST_LOTTERIES_COUNT_TTL 秒，新建/删除抽奖时失效；
+  显示时保证总页数不小于当前页（还有下一页时不小于当前页+1）
+
+回调数据格式: list_lotteries_{群组ID}[_{页码}[_{方向}_{游标时间}_{游标ID}]]，
+方向为 n（下一页）或 p（上一页），游标时间和游标ID使用 36 进制以控制在 64 字节以内。
+只有群组ID或页码的旧格式按第一页处理。
+"""
+
 import logging
+import math
+import threading
+import time
 import traceback
+from datetime import datetime, timedelta, timezone as dt_timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from jifen.db_executor import db_sync_to_async
 
 # 设置日志记录
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # 每页显示的抽奖数量
 LOTTERIES_PER_PAGE = 9  # 3行x3列 = 9个抽奖
 
+# 翻页方向
+NEXT = 'n'
+PREV = 'p'
+
+_EPOCH = datetime(1970, 1, 1)
+_BASE36_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+# 群组主键 -> (抽奖总数, 过期时间)
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+
+def _to_base36(value):
+    if value < 0:
+        return '-' + _to_base36(-value)
+    digits = ''
+    while True:
+        value, remainder = divmod(value, 36)
+        digits = _BASE36_DIGITS[remainder] + digits
+        if value == 0:
+            return digits
+
+
+def encode_cursor(created_at, lottery_id):
+    """把 (created_at, id) 编码为回调数据中的游标（精确到微秒，可无损还原）"""
+    epoch = _EPOCH if created_at.tzinfo is None else _EPOCH.replace(tzinfo=dt_timezone.utc)
+    micros = (created_at - epoch) // timedelta(microseconds=1)
+    return f"{_to_base36(micros)}_{_to_base36(lottery_id)}"
+
+
+def decode_cursor(created_part, id_part):
+    """还原 encode_cursor 编码的游标，格式错误时抛出 ValueError"""
+    created_at = _EPOCH + timedelta(microseconds=int(created_part, 36))
+    if settings.USE_TZ:
+        created_at = created_at.replace(tzinfo=dt_timezone.utc)
+    return created_at, int(id_part, 36)
+
+
+def parse_callback_data(data):
+    """解析回调数据，返回 (群组ID, 页码, 方向, 游标)，没有游标时方向和游标为 None"""
+    parts = data.split('_')
+    group_id = int(parts[2])
+    if len(parts) >= 7 and parts[4] in (NEXT, PREV):
+        try:
+            return group_id, max(1, int(parts[3])), parts[4], decode_cursor(parts[5], parts[6])
+        except ValueError:
+            pass
+    return group_id, 1, None, None
+
+
+def forget_group_count(group_pk):
+    """群组的抽奖数量变化后清除缓存的总数"""
+    with _count_cache_lock:
+        _count_cache.pop(group_pk, None)
+
+
+def _cached_group_count(group_pk):
+    """群组的抽奖总数，缓存 LIST_LOTTERIES_COUNT_TTL 秒"""
+    from choujiang.models import Lottery
+
+    now = time.monotonic()
+    with _count_cache_lock:
+        entry = _count_cache.get(group_pk)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+    count = Lottery.objects.filter(group_id=group_pk).count()
+    with _count_cache_lock:
+        _count_cache[group_pk] = (count, now + getattr(settings, 'LIST_LOTTERIES_COUNT_TTL', 300))
+    return count
+
+
 async def view_group_lotteries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """显示指定群组的抽奖列表"""
     query = update.callback_query
@@ -25,26 +113,15 @@ async def view_group_lotteries(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     try:
-        # 从回调数据中提取群组ID和页码
-        callback_data_parts = query.data.split('_')
-        group_id = int(callback_data_parts[2])
-        page = 1  # 默认第一页
-        
-        # 如果有页码参数，解析页码
-        if len(callback_data_parts) > 3:
-            try:
-                page = int(callback_data_parts[3])
-            except ValueError:
-                page = 1
+        # 从回调数据中提取群组ID、页码和游标
+        group_id, page, direction, cursor = parse_callback_data(query.data)
         
         logger.info(f"[查看群组抽奖] 用户 {user.id} 请求查看群组ID={group_id}的抽奖列表，页码={page}")
         
-        # 获取群组名称
-        group_name = await get_group_name(group_id)
-        
-        # 获取群组的抽奖列表
-        lotteries = await get_group_lotteries(group_id, page, LOTTERIES_PER_PAGE)
-        total_pages = await get_total_pages(group_id, LOTTERIES_PER_PAGE)
+        # 获取群组名称和当前页的抽奖
+        result = await get_group_lotteries(group_id, cursor, direction, LOTTERIES_PER_PAGE)
+        group_name = result['group_name']
+        lotteries = result['lotteries']
         
         if not lotteries:
             # 如果没有抽奖，显示提示信息
@@ -60,6 +137,11 @@ async def view_group_lotteries(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return
         
+        # 前面已经没有抽奖时即为第一页（翻页期间有新抽奖时页码可能偏移）
+        if not result['has_prev']:
+            page = 1
+        total_pages = max(math.ceil(result['total_count'] / LOTTERIES_PER_PAGE), page + 1 if result['has_next'] else page)
+        
         # 构建抽奖列表按钮
         buttons = []
         current_row = []
@@ -79,14 +161,22 @@ async def view_group_lotteries(update: Update, context: ContextTypes.DEFAULT_TYP
                 buttons.append(current_row)
                 current_row = []
         
-        # 添加分页按钮
+        # 添加分页按钮，游标为当前页第一个/最后一个抽奖
         nav_buttons = []
         
-        if page > 1:
-            nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f"list_lotteries_{group_id}_{page-1}"))
+        if result['has_prev']:
+            first = lotteries[0]
+            cursor_data = encode_cursor(first['created_at'], first['id'])
+            nav_buttons.append(InlineKeyboardButton(
+                "⬅️ 上一页", callback_data=f"list_lotteries_{group_id}_{page-1}_{PREV}_{cursor_data}"
+            ))
         
-        if page < total_pages:
-            nav_buttons.append(InlineKeyboardButton("➡️ 下一页", callback_data=f"list_lotteries_{group_id}_{page+1}"))
+        if result['has_next']:
+            last = lotteries[-1]
+            cursor_data = encode_cursor(last['created_at'], last['id'])
+            nav_buttons.append(InlineKeyboardButton(
+                "➡️ 下一页", callback_data=f"list_lotteries_{group_id}_{page+1}_{NEXT}_{cursor_data}"
+            ))
         
         if nav_buttons:
             buttons.append(nav_buttons)
@@ -124,12 +214,11 @@ async def view_group_lotteries(update: Update, context: ContextTypes.DEFAULT_TYP
             reply_markup=reply_markup
         )
 
-@sync_to_async
-def get_group_name(group_id):
+def _group_name(group_id):
     """获取群组名称"""
     from jifen.models import Group
     try:
-        group = Group.objects.get(group_id=group_id)
+        group = Group.objects.only('group_title').get(group_id=group_id)
         return group.group_title or "未知群组"
     except Group.DoesNotExist:
         return "未知群组"
@@ -137,56 +226,64 @@ def get_group_name(group_id):
         logger.error(f"获取群组名称时出错: {e}")
         return "未知群组"
 
-@sync_to_async
-def get_group_lotteries(group_id, page, page_size):
-    """获取指定群组的抽奖列表"""
+@db_sync_to_async
+def get_group_lotteries(group_id, cursor, direction, page_size):
+    """
+    获取指定群组的一页抽奖（按创建时间倒序）
+    
+    cursor 为 (created_at, id)，为空时返回第一页；direction 为 NEXT 时返回游标之后（更早）的一页，
+    为 PREV 时返回游标之前（更新）的一页
+    """
+    from django.db.models import Q
     from choujiang.models import Lottery
-    from jifen.models import Group
     
+    empty = {'group_name': "未知群组", 'lotteries': [], 'has_next': False, 'has_prev': False, 'total_count': 0}
     try:
-        # 计算偏移量
-        offset = (page - 1) * page_size
+        # 按群组的 Telegram ID 关联过滤，群组名称随抽奖一起取出
+        queryset = Lottery.objects.filter(group__group_id=group_id).select_related('group').only(
+            'id', 'title', 'status', 'created_at', 'group_id', 'group__group_title'
+        )
         
-        # 获取群组
-        group = Group.objects.get(group_id=group_id)
+        if cursor is not None and direction == PREV:
+            created_at, lottery_id = cursor
+            rows = list(
+                queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=lottery_id))
+                .order_by('created_at', 'id')[:page_size + 1]
+            )
+            has_prev = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            has_next = True
+        else:
+            if cursor is not None:
+                created_at, lottery_id = cursor
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=lottery_id))
+            rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+            has_prev = cursor is not None
         
-        # 获取该群组的所有抽奖，按创建时间倒序排列
-        lotteries = Lottery.objects.filter(group=group).order_by('-created_at')[offset:offset+page_size]
+        if not rows:
+            # 没有抽奖时才单独查询群组名称
+            empty['group_name'] = _group_name(group_id)
+            return empty
         
+        group = rows[0].group
         result = []
-        for lottery in lotteries:
+        for lottery in rows:
             result.append({
                 'id': lottery.id,
                 'title': lottery.title,
                 'status': lottery.status,
-                'points_required': lottery.points_required,
                 'created_at': lottery.created_at
             })
         
-        return result
-    except Group.DoesNotExist:
-        logger.error(f"群组ID={group_id}不存在")
-        return []
+        return {
+            'group_name': group.group_title or "未知群组",
+            'lotteries': result,
+            'has_next': has_next,
+            'has_prev': has_prev,
+            'total_count': _cached_group_count(group.id),
+        }
     except Exception as e:
         logger.error(f"获取群组抽奖列表时出错: {e}\n{traceback.format_exc()}")
-        return []
-
-@sync_to_async
-def get_total_pages(group_id, page_size):
-    """获取总页数"""
-    from choujiang.models import Lottery
-    from jifen.models import Group
-    import math
-    
-    try:
-        # 获取群组
-        group = Group.objects.get(group_id=group_id)
-        
-        # 获取该群组的抽奖总数
-        total_count = Lottery.objects.filter(group=group).count()
-        
-        # 计算总页数
-        return max(1, math.ceil(total_count / page_size))
-    except Exception as e:
-        logger.error(f"计算总页数时出错: {e}")
-        return 1 
\ No newline at end of file
+        return empty
@@ -3,6 +3,8 @@ from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler,
     CallbackQueryHandler, MessageHandler, filters
 )
+from django.db.models import CharField
+from django.db.models.functions import Cast
 from .models import Lottery, Participant
 from jifen.models import User
 import logging
@@ -19,6 +21,9 @@ SELECT_LOTTERY = 1
 SELECT_WINNERS = 2
 CONFIRM_WINNERS = 3
 
+# 选择中奖者时每页显示的参与者数量
+PARTICIPANTS_PER_PAGE = 10
+
 async def update_user_info(telegram_user):
     """更新用户信息（如用户名）到数据库"""
     @sync_to_async
@@ -142,6 +147,95 @@ async def start_admin_draw(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             await message.reply_text(error_message)
         return ConversationHandler.END
 
+def _participant_queryset(lottery_id, search=None):
+    """参与者查询集，search 为纯数字时按用户ID前缀搜索，否则按用户名前缀搜索"""
+    queryset = Participant.objects.filter(lottery_id=lottery_id)
+    if search:
+        keyword = search.lstrip('@')
+        if keyword.isdigit():
+            queryset = queryset.annotate(
+                telegram_id_str=Cast('user__telegram_id', CharField())
+            ).filter(telegram_id_str__startswith=keyword)
+        else:
+            queryset = queryset.filter(user__username__istartswith=keyword)
+    return queryset
+
+@sync_to_async
+def fetch_participant_page(lottery_id, search=None, after=None, before=None):
+    """
+    按参与记录ID分页获取参与者（键集分页，只查询一页）
+
+    参数:
+    after: 获取ID大于该值的一页
+    before: 获取ID小于该值的一页（上一页）
+
+    返回 (参与者列表, 是否有上一页, 是否有下一页)
+    """
+    queryset = _participant_queryset(lottery_id, search)
+    fields = ('id', 'user__telegram_id', 'user__first_name', 'user__last_name', 'user__username')
+    if before is not None:
+        rows = list(queryset.filter(id__lt=before).order_by('-id').values(*fields)[:PARTICIPANTS_PER_PAGE + 1])
+        has_prev = len(rows) > PARTICIPANTS_PER_PAGE
+        rows = rows[:PARTICIPANTS_PER_PAGE][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            queryset_page = queryset.filter(id__gt=after)
+        else:
+            queryset_page = queryset
+        rows = list(queryset_page.order_by('id').values(*fields)[:PARTICIPANTS_PER_PAGE + 1])
+        has_next = len(rows) > PARTICIPANTS_PER_PAGE
+        rows = rows[:PARTICIPANTS_PER_PAGE]
+        has_prev = after is not None and queryset.filter(id__lte=after).exists()
+    return rows, has_prev, has_next
+
+async def render_participant_page(admin_draw_data, after=None, before=None, title=None):
+    """
+    生成参与者选择页的文本和键盘
+
+    当前页的起始位置保存在 admin_draw_data['page_after'] 中，切换选择后按该位置重新渲染本页
+    """
+    lottery_id = admin_draw_data['lottery_id']
+    search = admin_draw_data.get('search')
+    selected_winners = admin_draw_data.get('selected_winners', set())
+
+    rows, has_prev, has_next = await fetch_participant_page(lottery_id, search, after=after, before=before)
+    if rows:
+        admin_draw_data['page_after'] = rows[0]['id'] - 1
+
+    keyboard = []
+    for row in rows:
+        is_selected = row['user__telegram_id'] in selected_winners
+        keyboard.append([InlineKeyboardButton(
+            f"{'✅ ' if is_selected else ''}{row['user__first_name']} {row['user__last_name'] or ''} (@{row['user__username'] or '无用户名'})",
+            callback_data=f"select_winner_{row['user__telegram_id']}"
+        )])
+
+    nav_buttons = []
+    if rows and has_prev:
+        nav_buttons.append(InlineKeyboardButton("◀️ 上一页", callback_data=f"winner_page_prev_{rows[0]['id']}"))
+    if rows and has_next:
+        nav_buttons.append(InlineKeyboardButton("下一页 ▶️", callback_data=f"winner_page_next_{rows[-1]['id']}"))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+
+    if search:
+        keyboard.append([InlineKeyboardButton("❌ 清除搜索", callback_data="winner_search_clear")])
+    else:
+        keyboard.append([InlineKeyboardButton("🔍 搜索参与者", callback_data="winner_search")])
+    keyboard.append([InlineKeyboardButton("完成选择", callback_data="finish_selection")])
+
+    text = title or (
+        f"已选择 {len(selected_winners)} 位中奖用户\n"
+        f"抽奖：{admin_draw_data.get('lottery_title', '')}\n"
+    )
+    if search:
+        text += f"\n🔍 搜索：{search}\n"
+        if not rows:
+            text += "没有找到匹配的参与者\n"
+    text += "点击用户名称选择/取消选择，完成后点击'完成选择'"
+    return text, InlineKeyboardMarkup(keyboard), bool(rows)
+
 async def select_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """处理选择抽奖的回调"""
     query = update.callback_query
@@ -161,57 +255,24 @@ async def select_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         lottery = await get_lottery()
         
-        # 获取参与者列表及其telegram_id
-        @sync_to_async
-        def get_participants_with_telegram_ids():
-            participants_list = list(Participant.objects.filter(lottery=lottery).select_related('user'))
-            # 在数据库查询中一次性获取所有需要的数据
-            return participants_list, [p.user.telegram_id for p in participants_list]
-        
-        participants, participant_telegram_ids = await get_participants_with_telegram_ids()
-        
-        if not participants:
-            await query.edit_message_text("该抽奖活动还没有参与者。")
-            return ConversationHandler.END
-        
-        # 存储抽奖信息到上下文
-        context.user_data['admin_draw'] = {
+        # 存储抽奖信息到上下文，已选中奖者只保存Telegram ID集合
+        admin_draw_data = {
             'lottery_id': lottery_id,
-            'participants': participant_telegram_ids
+            'lottery_title': lottery.title,
+            'selected_winners': set()
         }
         
-        # 获取参与者详细信息
-        @sync_to_async
-        def get_participants_details():
-            result = []
-            for participant in participants:
-                user = participant.user
-                result.append({
-                    'telegram_id': user.telegram_id,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name or '',
-                    'username': user.username or '无用户名'
-                })
-            return result
-        
-        participant_details = await get_participants_details()
-        
-        # 创建参与者选择键盘
-        keyboard = []
-        for p_detail in participant_details:
-            keyboard.append([InlineKeyboardButton(
-                f"{p_detail['first_name']} {p_detail['last_name']} (@{p_detail['username']})",
-                callback_data=f"select_winner_{p_detail['telegram_id']}"
-            )])
+        text, reply_markup, has_rows = await render_participant_page(
+            admin_draw_data,
+            title=f"请选择中奖用户（抽奖：{lottery.title}）：\n"
+        )
         
-        keyboard.append([InlineKeyboardButton("完成选择", callback_data="finish_selection")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        if not has_rows:
+            await query.edit_message_text("该抽奖活动还没有参与者。")
+            return ConversationHandler.END
         
-        await query.edit_message_text(
-            f"请选择中奖用户（抽奖：{lottery.title}）：\n"
-            "点击用户名称选择/取消选择，完成后点击'完成选择'",
-            reply_markup=reply_markup
-        )
+        context.user_data['admin_draw'] = admin_draw_data
+        await query.edit_message_text(text, reply_markup=reply_markup)
         
         return SELECT_WINNERS
         
@@ -243,53 +304,99 @@ async def select_winner(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         admin_draw_data['selected_winners'] = selected_winners
         context.user_data['admin_draw'] = admin_draw_data
         
-        # 重新获取抽奖信息
-        @sync_to_async
-        def get_lottery():
-            return Lottery.objects.get(id=admin_draw_data['lottery_id'])
+        # 只重新获取当前这一页
+        text, reply_markup, _ = await render_participant_page(admin_draw_data, after=admin_draw_data.get('page_after'))
+        await query.edit_message_text(text, reply_markup=reply_markup)
         
-        lottery = await get_lottery()
+        return SELECT_WINNERS
         
-        # 重新获取参与者列表及其详细信息
-        @sync_to_async
-        def get_participants_details():
-            participants_list = list(Participant.objects.filter(lottery=lottery).select_related('user'))
-            result = []
-            for participant in participants_list:
-                user = participant.user
-                result.append({
-                    'telegram_id': user.telegram_id,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name or '',
-                    'username': user.username or '无用户名'
-                })
-            return result
-        
-        participant_details = await get_participants_details()
-        
-        # 更新键盘显示
-        keyboard = []
-        for p_detail in participant_details:
-            is_selected = p_detail['telegram_id'] in selected_winners
-            keyboard.append([InlineKeyboardButton(
-                f"{'✅ ' if is_selected else ''}{p_detail['first_name']} {p_detail['last_name']} (@{p_detail['username']})",
-                callback_data=f"select_winner_{p_detail['telegram_id']}"
-            )])
+    except Exception as e:
+        logger.error(f"[管理员抽奖] 处理选择中奖用户时出错: {e}\n{traceback.format_exc()}")
+        await query.edit_message_text("处理请求时出错，请重试。")
+        return ConversationHandler.END
+
+async def change_participant_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """处理参与者列表翻页的回调"""
+    query = update.callback_query
+    parts = query.data.split("_")
+    direction, cursor = parts[2], int(parts[3])
+    
+    await query.answer()
+    
+    try:
+        admin_draw_data = context.user_data.get('admin_draw', {})
+        if direction == 'prev':
+            text, reply_markup, _ = await render_participant_page(admin_draw_data, before=cursor)
+        else:
+            text, reply_markup, _ = await render_participant_page(admin_draw_data, after=cursor)
+        await query.edit_message_text(text, reply_markup=reply_markup)
         
-        keyboard.append([InlineKeyboardButton("完成选择", callback_data="finish_selection")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        return SELECT_WINNERS
         
-        await query.edit_message_text(
-            f"已选择 {len(selected_winners)} 位中奖用户\n"
-            f"抽奖：{lottery.title}\n"
-            "点击用户名称选择/取消选择，完成后点击'完成选择'",
-            reply_markup=reply_markup
+    except Exception as e:
+        logger.error(f"[管理员抽奖] 处理参与者翻页时出错: {e}\n{traceback.format_exc()}")
+        await query.edit_message_text("处理请求时出错，请重试。")
+        return ConversationHandler.END
+
+async def start_participant_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """处理搜索参与者按钮，等待管理员输入关键词"""
+    query = update.callback_query
+    await query.answer()
+    
+    admin_draw_data = context.user_data.get('admin_draw', {})
+    admin_draw_data['awaiting_search'] = True
+    context.user_data['admin_draw'] = admin_draw_data
+    
+    await query.edit_message_text(
+        "请输入要搜索的用户名（可带@）或用户ID开头的数字：",
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ 取消搜索", callback_data="winner_search_clear")]])
+    )
+    return SELECT_WINNERS
+
+async def receive_participant_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """处理管理员输入的搜索关键词"""
+    admin_draw_data = context.user_data.get('admin_draw', {})
+    if not admin_draw_data.get('awaiting_search'):
+        # 选择中奖用户期间的文字消息不会被其他处理器处理，提示管理员如何操作
+        await update.message.reply_text(
+            "正在选择中奖用户，请点击上方列表中的按钮操作；"
+            "如需按用户名或用户ID查找参与者，请先点击「🔍 搜索参与者」按钮再输入关键词。"
         )
+        return SELECT_WINNERS
+    
+    try:
+        admin_draw_data['awaiting_search'] = False
+        admin_draw_data['search'] = update.message.text.strip()[:64]
+        context.user_data['admin_draw'] = admin_draw_data
+        
+        text, reply_markup, _ = await render_participant_page(admin_draw_data)
+        await update.message.reply_text(text, reply_markup=reply_markup)
         
         return SELECT_WINNERS
         
     except Exception as e:
-        logger.error(f"[管理员抽奖] 处理选择中奖用户时出错: {e}\n{traceback.format_exc()}")
+        logger.error(f"[管理员抽奖] 处理搜索参与者时出错: {e}\n{traceback.format_exc()}")
+        await update.message.reply_text("处理请求时出错，请重试。")
+        return ConversationHandler.END
+
+async def clear_participant_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """处理清除搜索的回调"""
+    query = update.callback_query
+    await query.answer()
+    
+    try:
+        admin_draw_data = context.user_data.get('admin_draw', {})
+        admin_draw_data['awaiting_search'] = False
+        admin_draw_data.pop('search', None)
+        context.user_data['admin_draw'] = admin_draw_data
+        
+        text, reply_markup, _ = await render_participant_page(admin_draw_data)
+        await query.edit_message_text(text, reply_markup=reply_markup)
+        
+        return SELECT_WINNERS
+        
+    except Exception as e:
+        logger.error(f"[管理员抽奖] 处理清除搜索时出错: {e}\n{traceback.format_exc()}")
         await query.edit_message_text("处理请求时出错，请重试。")
         return ConversationHandler.END
 
@@ -454,49 +561,15 @@ async def reselect_winners(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await update_user_info(user)
         
         admin_draw_data = context.user_data.get('admin_draw', {})
-        lottery_id = admin_draw_data['lottery_id']
-        
-        # 获取抽奖信息
-        @sync_to_async
-        def get_lottery():
-            return Lottery.objects.get(id=lottery_id)
-        
-        lottery = await get_lottery()
+        admin_draw_data.pop('search', None)
+        admin_draw_data['awaiting_search'] = False
         
-        # 获取参与者列表及其详细信息
-        @sync_to_async
-        def get_participants_details():
-            participants_list = list(Participant.objects.filter(lottery=lottery).select_related('user'))
-            result = []
-            for participant in participants_list:
-                user = participant.user
-                result.append({
-                    'telegram_id': user.telegram_id,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name or '',
-                    'username': user.username or '无用户名'
-                })
-            return result
-        
-        participant_details = await get_participants_details()
-        
-        # 创建参与者选择键盘
-        keyboard = []
-        for p_detail in participant_details:
-            is_selected = p_detail['telegram_id'] in admin_draw_data.get('selected_winners', set())
-            keyboard.append([InlineKeyboardButton(
-                f"{'✅ ' if is_selected else ''}{p_detail['first_name']} {p_detail['last_name']} (@{p_detail['username']})",
-                callback_data=f"select_winner_{p_detail['telegram_id']}"
-            )])
-        
-        keyboard.append([InlineKeyboardButton("完成选择", callback_data="finish_selection")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            f"请重新选择中奖用户（抽奖：{lottery.title}）：\n"
-            "点击用户名称选择/取消选择，完成后点击'完成选择'",
-            reply_markup=reply_markup
+        text, reply_markup, _ = await render_participant_page(
+            admin_draw_data,
+            title=f"请重新选择中奖用户（抽奖：{admin_draw_data.get('lottery_title', '')}）：\n"
+                  f"已选择 {len(admin_draw_data.get('selected_winners', set()))} 位中奖用户\n"
         )
+        await query.edit_message_text(text, reply_markup=reply_markup)
         
         return SELECT_WINNERS
         
@@ -516,6 +589,10 @@ def get_admin_draw_conversation_handler():
             SELECT_LOTTERY: [CallbackQueryHandler(select_lottery, pattern="^select_lottery_")],
             SELECT_WINNERS: [
                 CallbackQueryHandler(select_winner, pattern="^select_winner_"),
+                CallbackQueryHandler(change_participant_page, pattern="^winner_page_(prev|next)_"),
+                CallbackQueryHandler(start_participant_search, pattern="^winner_search$"),
+                CallbackQueryHandler(clear_participant_search, pattern="^winner_search_clear$"),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, receive_participant_search),
                 CallbackQueryHandler(finish_selection, pattern="^finish_selection$")
             ],
             CONFIRM_WINNERS: [
@@ -6,11 +6,9 @@ from asgiref.sync import sync_to_async
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-# 配置日志
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from choujiang.lottery_drawer import notify_lottery_schedule_changed
+from choujiang.render_cache import render_lottery_announcement
+
 logger = logging.getLogger(__name__)
 
 async def copy_lottery_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -210,7 +208,10 @@ async def copy_lottery_to_group(update: Update, context: ContextTypes.DEFAULT_TY
                         group_username=req.group_username,
                         group_id=req.group_id,
                         min_registration_days=req.min_registration_days,
-                        chat_identifier=req.chat_identifier
+                        chat_identifier=req.chat_identifier,
+                        chat_type=req.chat_type,
+                        bot_is_admin=req.bot_is_admin,
+                        resolved_at=req.resolved_at
                     )
                     new_req.save()
                 
@@ -237,28 +238,13 @@ async def copy_lottery_to_group(update: Update, context: ContextTypes.DEFAULT_TY
         if not new_lottery:
             await query.message.edit_text("❌ 复制抽奖时出错，请重试。")
             return
+        
+        # 新抽奖的开奖计划交给开奖调度器（草稿状态下不会被安排开奖）
+        notify_lottery_schedule_changed(new_lottery.id)
             
         # 删除选择群组的消息
         await query.message.delete()
         
-        # 获取奖品信息用于预览消息
-        @sync_to_async
-        def get_prizes(lottery_id):
-            from choujiang.models import Prize
-            prizes = Prize.objects.filter(lottery_id=lottery_id).order_by('order')
-            return list(prizes)
-            
-        prizes = await get_prizes(new_lottery.id)
-        
-        # 获取参与条件信息
-        @sync_to_async
-        def get_requirements(lottery_id):
-            from choujiang.models import LotteryRequirement
-            requirements = LotteryRequirement.objects.filter(lottery_id=lottery_id)
-            return list(requirements)
-            
-        requirements = await get_requirements(new_lottery.id)
-        
         # 获取实际的 Telegram 群组ID
         @sync_to_async
         def get_telegram_group_id(group_id):
@@ -277,45 +263,9 @@ async def copy_lottery_to_group(update: Update, context: ContextTypes.DEFAULT_TY
             
         logger.info(f"[抽奖复制] 获取到Telegram群组ID: {telegram_group_id}, 群组标题: {group_title}")
         
-        # 构建奖品信息文本
-        prizes_text = ""
-        for prize in prizes:
-            prizes_text += f"• {prize.name}: {prize.description} ({prize.quantity}名)\n"
-            
-        # 构建参与条件文本
-        requirements_text = ""
-        for req in requirements:
-            if req.requirement_type == 'CHANNEL' and req.channel_username:
-                username = req.channel_username
-                if not username.startswith('@'):
-                    username = f"@{username}"
-                requirements_text += f"• 必须加入: {username}\n"
-            elif req.requirement_type == 'GROUP' and req.group_username:
-                username = req.group_username
-                if not username.startswith('@'):
-                    username = f"@{username}"
-                requirements_text += f"• 必须加入: {username}\n"
-            elif req.requirement_type == 'GROUP' and req.chat_identifier:
-                requirements_text += f"• 必须加入: {req.chat_identifier}\n"
-            elif req.requirement_type == 'CHANNEL' and req.chat_identifier:
-                requirements_text += f"• 必须加入: {req.chat_identifier}\n"
-        
-        # 构建完整的预览消息
-        preview_message = (
-            f"🎁 <b>{new_lottery.title}</b>\n\n"
-            f"{new_lottery.description}\n\n"
-            f"⏱ 报名截止: {new_lottery.signup_deadline.strftime('%Y-%m-%d %H:%M')}\n"
-            f"🕒 开奖时间: {new_lottery.draw_time.strftime('%Y-%m-%d %H:%M')}\n\n"
-            f"🏆 奖品设置:\n{prizes_text}\n"
-        )
-        
-        # 如果有参与条件，添加到预览消息
-        if requirements_text:
-            preview_message += f"📝 参与条件:\n{requirements_text}\n"
-        
-        # 如果有积分要求，添加积分信息
-        if new_lottery.points_required > 0:
-            preview_message += f"💰 参与所需积分: {new_lottery.points_required}\n"
+        # 群组公告预览（与发布时使用同一份渲染结果）
+        announcement = await render_lottery_announcement(new_lottery)
+        preview_message = announcement.text
         
         # 创建查看新抽奖和发布按钮
         keyboard = InlineKeyboardMarkup([
@@ -1,34 +1,135 @@
 import logging
 import asyncio
+import heapq
 import random
+import time
 import traceback
 from datetime import datetime, timedelta
-from asgiref.sync import sync_to_async
+from jifen.db_executor import db_sync_to_async
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 import threading
 
 from choujiang.models import Lottery, Participant, Prize, LotteryLog
 from jifen.models import User, Group, PointTransaction
+from jifen.send_queue import PRIORITY_HIGH, queued_send_message, submit_message
 
-# 配置日志
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+def claim_lottery_for_draw(lottery_id):
+    """
+    认领开奖：以单条条件更新把抽奖状态从 ACTIVE 改为 DRAWING（同步函数）
+    
+    返回:
+    bool: 是否认领成功，已被其他开奖器认领或不是活跃状态时返回 False
+    """
+    updated = Lottery.objects.filter(id=lottery_id, status='ACTIVE').update(
+        status='DRAWING',
+        updated_at=timezone.now()
+    )
+    return updated == 1
+
+def release_lottery_claim(lottery_id):
+    """开奖失败时把 DRAWING 状态恢复为 ACTIVE（同步函数）"""
+    updated = Lottery.objects.filter(id=lottery_id, status='DRAWING').update(
+        status='ACTIVE',
+        updated_at=timezone.now()
+    )
+    if updated:
+        logger.info(f"[抽奖开奖] 抽奖ID={lottery_id}开奖未完成，已恢复为进行中状态")
+
+def recover_stale_draw_claims():
+    """恢复长时间停留在 DRAWING 状态的抽奖（开奖进程中途退出时），便于重新开奖（同步函数）"""
+    timeout = getattr(settings, 'LOTTERY_DRAW_CLAIM_TIMEOUT', 600)
+    updated = Lottery.objects.filter(
+        status='DRAWING',
+        updated_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status='ACTIVE', updated_at=timezone.now())
+    if updated:
+        logger.warning(f"[自动开奖] 已恢复 {updated} 个超时未完成开奖的抽奖")
+
+def save_draw_results(lottery, winners, details):
+    """
+    在一个事务内保存开奖结果（同步函数）
+    
+    中奖者用一条 bulk_update 只写 is_winner 和 prize_id 两列，
+    抽奖状态用条件更新从 DRAWING 改为 ENDED，不经过 Lottery.save() 的整行写入
+    
+    参数:
+    lottery: 抽奖对象
+    winners: 中奖者信息列表，每项包含 participant 和 prize
+    details: 开奖日志内容
+    
+    返回:
+    bool: 是否保存成功，抽奖已不是 DRAWING 状态（认领已被恢复）时返回 False 并回滚
+    """
+    participants = []
+    for winner_info in winners:
+        participant = winner_info['participant']
+        participant.is_winner = True
+        participant.prize = winner_info['prize']
+        participants.append(participant)
+    
+    now = timezone.now()
+    with transaction.atomic():
+        if participants:
+            Participant.objects.bulk_update(participants, ['is_winner', 'prize'], batch_size=500)
+        
+        updated = Lottery.objects.filter(id=lottery.id, status='DRAWING').update(status='ENDED', updated_at=now)
+        if not updated:
+            logger.warning(f"[抽奖开奖] 抽奖ID={lottery.id}已不是开奖中状态，放弃保存开奖结果")
+            transaction.set_rollback(True)
+            return False
+        
+        LotteryLog.objects.create(
+            lottery=lottery,
+            user=lottery.creator,
+            action='DRAW',
+            details=details
+        )
+    
+    lottery.status = 'ENDED'
+    lottery.updated_at = now
+    return True
+
 class LotteryDrawer:
     """抽奖开奖器类，处理自动开奖和指定中奖者功能"""
     
     def __init__(self, bot):
         """初始化抽奖开奖器"""
         self.bot = bot
+        # 开奖时间堆: [(draw_time, lottery_id)]，过期条目以 _armed 为准惰性删除
+        self._heap = []
+        # 当前有效的开奖计划: {lottery_id: draw_time}
+        self._armed = {}
+        # 等待从数据库刷新开奖计划的抽奖ID
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        # 兜底全量核对的间隔（秒）
+        self.sweep_interval = getattr(settings, 'LOTTERY_DRAW_SWEEP_INTERVAL', 600)
+        # 开奖失败后首次重试的等待时间（秒），之后按失败次数翻倍
+        self.retry_delay = getattr(settings, 'LOTTERY_DRAW_RETRY_DELAY', 30)
+        # 连续开奖失败次数: {lottery_id: 次数}
+        self._retry_attempts = {}
+        # 限制同时进行的开奖数量
+        self.draw_semaphore = asyncio.Semaphore(getattr(settings, 'LOTTERY_DRAW_CONCURRENCY', 5))
+        # 正在进行的开奖任务: {lottery_id: Task}
+        self._draw_tasks = {}
+        # 中奖私信发送结果的汇总任务，保留引用避免任务被回收
+        self._delivery_tasks = set()
     
     async def check_and_draw_lotteries(self):
-        """检查并执行所有需要开奖的抽奖"""
+        """
+        检查所有需要开奖的抽奖，为每个抽奖启动一个开奖任务
+
+        不等待开奖完成，调度器可以继续响应新到期的抽奖和 notify_changed
+        """
         try:
             # 获取所有需要开奖的抽奖
-            @sync_to_async
+            @db_sync_to_async
             def get_lotteries_to_draw():
                 now = timezone.now()
                 
@@ -49,34 +150,78 @@ class LotteryDrawer:
                 
             logger.info(f"[自动开奖] 发现 {len(lotteries_to_draw)} 个需要开奖的抽奖")
             
-            # 依次执行开奖
+            # 每个抽奖一个任务并发开奖，同时进行的开奖数量受 draw_semaphore 限制
             for lottery in lotteries_to_draw:
-                logger.info(f"[自动开奖] 准备开奖: ID={lottery.id}, 标题={lottery.title}")
-                
-                # 检查是否有指定的中奖者
-                specified_winners = None
-                if lottery.specified_winners:
-                    try:
-                        # 从字符串转换为ID列表
-                        specified_winners = [int(id) for id in lottery.specified_winners.split(',') if id.strip()]
-                        logger.info(f"[自动开奖] 抽奖ID={lottery.id}使用指定中奖者，共{len(specified_winners)}人")
-                    except Exception as e:
-                        logger.error(f"[自动开奖] 处理指定中奖者时出错: {e}")
-                
-                # 执行开奖
-                success = await self.draw_lottery(lottery.id, specified_winners)
-                if success:
-                    logger.info(f"[自动开奖] 抽奖ID={lottery.id}开奖成功")
-                else:
-                    logger.error(f"[自动开奖] 抽奖ID={lottery.id}开奖失败")
+                self._start_draw(lottery)
                     
         except Exception as e:
             logger.error(f"[自动开奖] 检查开奖任务时出错: {e}\n{traceback.format_exc()}")
     
+    def _start_draw(self, lottery):
+        """为抽奖启动开奖任务，已有任务在进行时跳过"""
+        if lottery.id in self._draw_tasks:
+            return
+        task = asyncio.create_task(self._auto_draw(lottery))
+        self._draw_tasks[lottery.id] = task
+        task.add_done_callback(lambda _: self._draw_tasks.pop(lottery.id, None))
+    
+    async def _auto_draw(self, lottery):
+        """自动开奖单个抽奖，失败时按退避时间安排重试"""
+        success = False
+        try:
+            async with self.draw_semaphore:
+                success = await self._auto_draw_locked(lottery)
+        except Exception as e:
+            logger.error(f"[自动开奖] 抽奖ID={lottery.id}开奖任务出错: {e}\n{traceback.format_exc()}")
+        if success:
+            self._retry_attempts.pop(lottery.id, None)
+        else:
+            self._schedule_retry(lottery.id)
+    
+    def _schedule_retry(self, lottery_id):
+        """
+        开奖失败后重新登记开奖计划（认领已恢复为 ACTIVE），不必等待下一次全量核对
+        
+        等待时间从 retry_delay 开始按连续失败次数翻倍，最长为 sweep_interval；
+        到时如果抽奖已不是待开奖状态（例如已被其他开奖器开奖），check_and_draw_lotteries 不会再处理它
+        """
+        attempts = self._retry_attempts.get(lottery_id, 0) + 1
+        self._retry_attempts[lottery_id] = attempts
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.sweep_interval)
+        self._arm(lottery_id, timezone.now() + timedelta(seconds=delay))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"[自动开奖] 抽奖ID={lottery_id}将在 {delay} 秒后重试开奖（第 {attempts} 次失败）")
+    
+    async def _auto_draw_locked(self, lottery):
+        """在 draw_semaphore 内执行单个抽奖的自动开奖"""
+        logger.info(f"[自动开奖] 准备开奖: ID={lottery.id}, 标题={lottery.title}")
+        
+        # 检查是否有指定的中奖者
+        specified_winners = None
+        if lottery.specified_winners:
+            try:
+                # 从字符串转换为ID列表
+                specified_winners = [int(id) for id in lottery.specified_winners.split(',') if id.strip()]
+                logger.info(f"[自动开奖] 抽奖ID={lottery.id}使用指定中奖者，共{len(specified_winners)}人")
+            except Exception as e:
+                logger.error(f"[自动开奖] 处理指定中奖者时出错: {e}")
+        
+        # 执行开奖
+        success = await self.draw_lottery(lottery.id, specified_winners)
+        if success:
+            logger.info(f"[自动开奖] 抽奖ID={lottery.id}开奖成功")
+        else:
+            logger.error(f"[自动开奖] 抽奖ID={lottery.id}开奖失败")
+        return success
+    
     async def draw_lottery(self, lottery_id, specified_winners=None):
         """
         执行抽奖开奖操作
         
+        开奖前先在数据库中把抽奖状态从 ACTIVE 改为 DRAWING 认领该抽奖，
+        保证多个进程中的开奖器不会重复开奖；开奖失败时恢复为 ACTIVE 以便重试
+        
         参数:
         lottery_id: 抽奖ID
         specified_winners: 指定的中奖者ID列表，如果提供则使用手动指定中奖者模式
@@ -84,9 +229,24 @@ class LotteryDrawer:
         返回:
         bool: 是否成功开奖
         """
+        claimed = await db_sync_to_async(claim_lottery_for_draw)(lottery_id)
+        if not claimed:
+            logger.warning(f"[抽奖开奖] 抽奖ID={lottery_id}不是活跃状态或已被其他开奖器认领，跳过开奖")
+            return False
+        
+        success = False
+        try:
+            success = await self._draw_claimed_lottery(lottery_id, specified_winners)
+            return success
+        finally:
+            if not success:
+                await db_sync_to_async(release_lottery_claim)(lottery_id)
+    
+    async def _draw_claimed_lottery(self, lottery_id, specified_winners=None):
+        """对已认领（DRAWING 状态）的抽奖执行开奖"""
         try:
             # 获取抽奖信息
-            @sync_to_async
+            @db_sync_to_async
             def get_lottery_with_participants():
                 try:
                     # 使用prefetch_related和select_related预加载相关对象
@@ -116,8 +276,8 @@ class LotteryDrawer:
                 logger.error(f"[抽奖开奖] 无法获取抽奖ID={lottery_id}的信息")
                 return False
                 
-            if lottery.status != 'ACTIVE':
-                logger.warning(f"[抽奖开奖] 抽奖ID={lottery_id}不是活跃状态，无法开奖")
+            if lottery.status != 'DRAWING':
+                logger.warning(f"[抽奖开奖] 抽奖ID={lottery_id}未被认领开奖，当前状态={lottery.status}")
                 return False
                 
             # 参与人数检查
@@ -125,20 +285,8 @@ class LotteryDrawer:
                 logger.warning(f"[抽奖开奖] 抽奖ID={lottery_id}没有参与者，无法开奖")
                 
                 # 更新抽奖状态为已结束
-                @sync_to_async
-                def update_lottery_status():
-                    lottery.status = 'ENDED'
-                    lottery.save()
-                    
-                    # 添加日志
-                    LotteryLog.objects.create(
-                        lottery=lottery,
-                        user=lottery.creator,
-                        action='DRAW',
-                        details=f"自动开奖：无参与者，抽奖结束"
-                    )
-                    
-                await update_lottery_status()
+                if not await db_sync_to_async(save_draw_results)(lottery, [], "自动开奖：无参与者，抽奖结束"):
+                    return False
                 
                 # 发送无人参与的通知
                 try:
@@ -163,22 +311,24 @@ class LotteryDrawer:
                             logger.warning(f"[抽奖开奖] 获取bot用户名时出错: {e}")
                             result_text += f"🤖 机器人支持"
                         
-                        # 使用sync_to_async处理群组ID获取
-                        @sync_to_async
+                        # 使用db_sync_to_async处理群组ID获取
+                        @db_sync_to_async
                         def get_group_id():
                             return lottery.group.group_id
                             
                         group_id = await get_group_id()
                         
-                        message = await self.bot.send_message(
+                        message = await queued_send_message(
+                            self.bot,
                             chat_id=group_id,
-                            text=result_text
+                            text=result_text,
+                            priority=PRIORITY_HIGH
                         )
                         
                         # 置顶抽奖结果
                         if lottery.pin_results:
                             try:
-                                # 再次使用sync_to_async处理群组ID获取
+                                # 再次使用db_sync_to_async处理群组ID获取
                                 group_id = await get_group_id()
                                 
                                 await self.bot.pin_chat_message(
@@ -190,10 +340,11 @@ class LotteryDrawer:
                                 logger.error(f"[抽奖开奖] 置顶消息失败: {e}")
                         
                         # 保存结果消息ID
-                        @sync_to_async
+                        @db_sync_to_async
                         def save_result_message_id():
                             lottery.result_message_id = message.message_id
-                            lottery.save()
+                            # 只写这一列，不用过期的实例整行覆盖管理员的并发修改
+                            Lottery.objects.filter(id=lottery.id).update(result_message_id=message.message_id)
                             
                         await save_result_message_id()
                 except Exception as e:
@@ -236,31 +387,10 @@ class LotteryDrawer:
                 return False
             
             # 保存中奖信息到数据库
-            @sync_to_async
+            @db_sync_to_async
             def save_winners():
                 try:
-                    for winner_info in winners:
-                        participant = winner_info['participant']
-                        prize = winner_info['prize']
-                        
-                        # 更新参与者信息
-                        participant.is_winner = True
-                        participant.prize = prize
-                        participant.save()
-                        
-                    # 更新抽奖状态
-                    lottery.status = 'ENDED'
-                    lottery.save()
-                    
-                    # 添加日志
-                    LotteryLog.objects.create(
-                        lottery=lottery,
-                        user=lottery.creator,
-                        action='DRAW',
-                        details=f"开奖完成：{len(winners)}人中奖"
-                    )
-                    
-                    return True
+                    return save_draw_results(lottery, winners, f"开奖完成：{len(winners)}人中奖")
                 except Exception as e:
                     logger.error(f"[抽奖开奖] 保存中奖信息时出错: {e}\n{traceback.format_exc()}")
                     return False
@@ -304,20 +434,22 @@ class LotteryDrawer:
             try:
                 # 群组公布结果
                 if lottery.announce_results_in_group:
-                    # 使用sync_to_async处理群组ID获取
-                    @sync_to_async
+                    # 使用db_sync_to_async处理群组ID获取
+                    @db_sync_to_async
                     def get_group_id():
                         return lottery.group.group_id
                         
-                    @sync_to_async
+                    @db_sync_to_async
                     def get_group_title():
                         return lottery.group.group_title
                         
                     group_id = await get_group_id()
                     
-                    group_message = await self.bot.send_message(
+                    group_message = await queued_send_message(
+                        self.bot,
                         chat_id=group_id,
-                        text=result_text
+                        text=result_text,
+                        priority=PRIORITY_HIGH
                     )
                     
                     # 置顶抽奖结果
@@ -333,10 +465,11 @@ class LotteryDrawer:
                             logger.error(f"[抽奖开奖] 置顶消息失败: {e}")
                     
                     # 保存结果消息ID
-                    @sync_to_async
+                    @db_sync_to_async
                     def save_result_message_id():
                         lottery.result_message_id = group_message.message_id
-                        lottery.save()
+                        # 只写这一列，不用过期的实例整行覆盖管理员的并发修改
+                        Lottery.objects.filter(id=lottery.id).update(result_message_id=group_message.message_id)
                         
                     await save_result_message_id()
                 
@@ -344,6 +477,8 @@ class LotteryDrawer:
                 if lottery.notify_winners_privately:
                     group_title = await get_group_title()
                     
+                    # 所有私信一次性提交到发送队列，由队列按限速并发发送
+                    deliveries = []
                     for winner in winners:
                         try:
                             private_text = (
@@ -366,15 +501,20 @@ class LotteryDrawer:
                                 logger.warning(f"[抽奖开奖] 获取bot用户名时出错: {e}")
                                 private_text += f"📱 联系机器人: @zhuhao99900"
                             
-                            await self.bot.send_message(
+                            deliveries.append((winner, submit_message(
+                                self.bot,
                                 chat_id=winner['user_id'],
-                                text=private_text
-                            )
-                            
-                            logger.info(f"[抽奖开奖] 已私信通知中奖者 {winner['username']} (ID: {winner['user_id']})")
+                                text=private_text,
+                                priority=PRIORITY_HIGH
+                            )))
                         except Exception as e:
                             logger.error(f"[抽奖开奖] 私信通知中奖者 {winner['username']} 时出错: {e}")
                             continue
+                    
+                    # 私信由发送队列投递，开奖不等待发送完成，结果在后台汇总
+                    task = asyncio.create_task(self._report_deliveries(lottery_id, deliveries))
+                    self._delivery_tasks.add(task)
+                    task.add_done_callback(self._delivery_tasks.discard)
                             
             except Exception as e:
                 logger.error(f"[抽奖开奖] 发送中奖通知时出错: {e}\n{traceback.format_exc()}")
@@ -386,6 +526,18 @@ class LotteryDrawer:
             logger.error(f"[抽奖开奖] 开奖过程中出错: {e}\n{traceback.format_exc()}")
             return False
             
+    async def _report_deliveries(self, lottery_id, deliveries):
+        """等待中奖私信发送完成并记录结果"""
+        results = await asyncio.gather(*(future for _, future in deliveries))
+        failed = 0
+        for (winner, _), result in zip(deliveries, results):
+            if result.ok:
+                logger.info(f"[抽奖开奖] 已私信通知中奖者 {winner['username']} (ID: {winner['user_id']})")
+            else:
+                failed += 1
+                logger.error(f"[抽奖开奖] 私信通知中奖者 {winner['username']} 失败，尝试 {result.attempts} 次: {result.error}")
+        logger.info(f"[抽奖开奖] 抽奖ID={lottery_id}中奖私信发送完成，成功 {len(results) - failed} 条，失败 {failed} 条")
+    
     async def _draw_randomly(self, lottery, prizes, participants, winners):
         """随机抽取中奖者"""
         # 随机打乱参与者列表
@@ -487,17 +639,132 @@ class LotteryDrawer:
                         'prize_desc': prize.description
                     })
     
+    def _arm(self, lottery_id, draw_time):
+        """登记抽奖的开奖时间"""
+        with self._lock:
+            if self._armed.get(lottery_id) == draw_time:
+                return
+            self._armed[lottery_id] = draw_time
+            heapq.heappush(self._heap, (draw_time, lottery_id))
+    
+    def _disarm(self, lottery_id):
+        """取消抽奖的开奖计划，堆中的旧条目在弹出时丢弃"""
+        with self._lock:
+            self._armed.pop(lottery_id, None)
+    
+    def _load_schedule(self):
+        """从数据库加载所有待自动开奖的抽奖，重建开奖时间堆（同步函数）"""
+        rows = list(Lottery.objects.filter(
+            status='ACTIVE',
+            auto_draw=True,
+            draw_time__isnull=False
+        ).values_list('id', 'draw_time'))
+        
+        with self._lock:
+            self._armed = {lottery_id: draw_time for lottery_id, draw_time in rows}
+            self._heap = [(draw_time, lottery_id) for lottery_id, draw_time in rows]
+            heapq.heapify(self._heap)
+        logger.info(f"[自动开奖] 已加载 {len(rows)} 个待开奖的抽奖计划")
+    
+    def _refresh_lotteries(self, lottery_ids):
+        """从数据库重新读取指定抽奖的状态和开奖时间，更新开奖计划（同步函数）"""
+        rows = dict(Lottery.objects.filter(
+            id__in=lottery_ids,
+            status='ACTIVE',
+            auto_draw=True,
+            draw_time__isnull=False
+        ).values_list('id', 'draw_time'))
+        
+        for lottery_id in lottery_ids:
+            if lottery_id in rows:
+                self._arm(lottery_id, rows[lottery_id])
+                logger.info(f"[自动开奖] 抽奖ID={lottery_id}的开奖时间已设置为 {rows[lottery_id]}")
+            else:
+                self._disarm(lottery_id)
+    
+    def _pop_due(self, now):
+        """弹出所有已到开奖时间的抽奖ID"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                draw_time, lottery_id = heapq.heappop(self._heap)
+                if self._armed.get(lottery_id) == draw_time:
+                    del self._armed[lottery_id]
+                    due.append(lottery_id)
+        return due
+    
+    def _next_draw_time(self):
+        """返回最近一次有效的开奖时间，没有时返回 None"""
+        with self._lock:
+            while self._heap:
+                draw_time, lottery_id = self._heap[0]
+                if self._armed.get(lottery_id) == draw_time:
+                    return draw_time
+                heapq.heappop(self._heap)
+        return None
+    
+    def notify_changed(self, lottery_id):
+        """抽奖发布、修改、复制或取消后调用，唤醒调度器重新读取该抽奖的开奖计划（线程安全）"""
+        with self._lock:
+            self._dirty.add(lottery_id)
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
     async def run_scheduler(self):
-        """运行定时器，定期检查需要开奖的抽奖"""
+        """
+        运行开奖调度器
+        
+        启动时加载所有待开奖抽奖的开奖时间，之后只休眠到最近一次开奖时间，
+        抽奖变更时由 notify_changed 唤醒；每隔 sweep_interval 秒做一次全量核对作为兜底
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        _running_drawers.append(self)
+        
+        last_sweep = None
         while True:
+            timeout = self.sweep_interval
             try:
-                logger.info("[自动开奖] 开始检查需要开奖的抽奖")
-                await self.check_and_draw_lotteries()
+                # 兜底全量核对（启动时也会执行一次，补开错过的抽奖）
+                if last_sweep is None or time.monotonic() - last_sweep >= self.sweep_interval:
+                    logger.info("[自动开奖] 开始全量核对开奖计划")
+                    with self._lock:
+                        self._dirty.clear()
+                    # 全量核对会重新登记所有待开奖的抽奖，失败次数随之重置
+                    self._retry_attempts.clear()
+                    await db_sync_to_async(recover_stale_draw_claims)()
+                    await db_sync_to_async(self._load_schedule)()
+                    # 已到期的抽奖由下面的 check_and_draw_lotteries 一并处理，不再从堆中重复触发
+                    self._pop_due(timezone.now())
+                    await self.check_and_draw_lotteries()
+                    last_sweep = time.monotonic()
+                
+                # 处理发生变更的抽奖
+                with self._lock:
+                    dirty, self._dirty = self._dirty, set()
+                if dirty:
+                    await db_sync_to_async(self._refresh_lotteries)(dirty)
+                
+                # 执行已到时间的开奖
+                due = self._pop_due(timezone.now())
+                if due:
+                    logger.info(f"[自动开奖] 抽奖 {due} 已到开奖时间")
+                    await self.check_and_draw_lotteries()
+                
+                # 计算下次唤醒时间
+                timeout = max(0, self.sweep_interval - (time.monotonic() - last_sweep))
+                next_draw_time = self._next_draw_time()
+                if next_draw_time is not None:
+                    timeout = min(timeout, max(0, (next_draw_time - timezone.now()).total_seconds()))
             except Exception as e:
-                logger.error(f"[自动开奖] 运行定时器时出错: {e}\n{traceback.format_exc()}")
+                logger.error(f"[自动开奖] 运行调度器时出错: {e}\n{traceback.format_exc()}")
+                timeout = 5
             
-            # 每分钟检查一次
-            await asyncio.sleep(60)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
     
     async def manual_draw(self, lottery_id, specified_winners=None, allow_save_only=False):
         """
@@ -521,7 +788,7 @@ class LotteryDrawer:
         if allow_save_only and specified_winners:
             try:
                 # 只保存指定的中奖者信息
-                @sync_to_async
+                @db_sync_to_async
                 def save_specified_winners():
                     try:
                         lottery = Lottery.objects.get(id=lottery_id)
@@ -561,6 +828,22 @@ async def start_lottery_drawer(bot):
     
     return drawer
 
+# 当前进程中正在运行调度器的开奖器
+_running_drawers = []
+
+def notify_lottery_schedule_changed(lottery_id):
+    """
+    通知开奖调度器某个抽奖的开奖计划可能已变化（发布、修改、复制、取消后调用）
+    
+    参数:
+    lottery_id: 抽奖ID
+    """
+    for drawer in _running_drawers:
+        try:
+            drawer.notify_changed(lottery_id)
+        except Exception as e:
+            logger.error(f"[自动开奖] 通知开奖调度器时出错: {e}")
+
 # 创建一个线程安全的单例模式，确保抽奖开奖器只被初始化一次
 _drawer_instance = None
 _drawer_lock = threading.Lock()
@@ -10,9 +10,20 @@ import logging
 from asgiref.sync import sync_to_async
 import traceback
 from django.utils import timezone
+from django.conf import settings
 import asyncio
 import time
 from .lottery_admin_handlers import get_admin_draw_conversation_handler
+from .lottery_drawer import notify_lottery_schedule_changed
+from jifen.db_executor import db_sync_to_async
+from jifen.send_queue import submit_message, submit_temporary_message
+from .requirement_checker import check_member, normalize_chat_ref, resolve_chat
+from .render_cache import get_lottery_requirements, render_lottery_announcement, render_lottery_detail
+from .lottery_listing import NEXT, PREV, list_active_lotteries
+from .join_engine import (
+    join_lottery_atomic, JOIN_LOTTERY_NOT_FOUND, JOIN_LOTTERY_CLOSED, JOIN_NOT_MEMBER,
+    JOIN_ALREADY_JOINED, JOIN_INSUFFICIENT_POINTS
+)
 import telegram.error
 
 # 设置日志
@@ -278,36 +289,52 @@ async def requirement_link_input(update: Update, context: ContextTypes.DEFAULT_T
         lottery_id = lottery_data['current_lottery_id']
         logger.info(f"[抽奖设置] 用户 {user.id} 输入了频道/群组链接: {channel_link} 用于抽奖ID={lottery_id}")
         
+        # 处理链接格式
+        identifier = channel_link.strip()
+        if identifier.startswith('https://t.me/'):
+            identifier = identifier[13:]
+        elif identifier.startswith('@'):
+            identifier = identifier[1:]
+        if '/' in identifier:
+            identifier = identifier.split('/')[0]
+        
+        # 创建前解析聊天的数字ID、类型和机器人管理员状态，之后检查成员时直接使用数字ID
+        resolved = None
+        try:
+            resolved = await resolve_chat(context.bot, normalize_chat_ref(identifier))
+            logger.info(f"[抽奖设置] 解析聊天 {identifier}: ID={resolved.chat_id}, 类型={resolved.chat_type}, 机器人管理员={resolved.bot_is_admin}")
+        except telegram.error.TelegramError as e:
+            logger.warning(f"[抽奖设置] 解析聊天 {identifier} 失败，稍后由后台任务重试: {e}")
+        
         # 创建抽奖条件记录
         try:
             # 使用sync_to_async包装创建LotteryRequirement记录
             @sync_to_async
             def create_requirement(lottery_id, channel_link):
-                from .models import Lottery, LotteryRequirement
+                from .models import Lottery
                 lottery = Lottery.objects.get(id=lottery_id)
                 
                 requirement = LotteryRequirement(
                     lottery=lottery,
-                    requirement_type='GROUP',  # 默认设置为群组，后续可优化判断
+                    requirement_type='GROUP',  # 未能解析时默认设置为群组
                     chat_identifier=channel_link
                 )
-                
-                # 处理链接格式
-                identifier = channel_link.strip()
-                if identifier.startswith('https://t.me/'):
-                    identifier = identifier[13:]
-                elif identifier.startswith('@'):
-                    identifier = identifier[1:]
-                if '/' in identifier:
-                    identifier = identifier.split('/')[0]
-                
                 requirement.group_username = identifier
+                if resolved is not None:
+                    requirement.apply_resolved_chat(resolved)
                 requirement.save()
                 return requirement
                 
             requirement = await create_requirement(lottery_id, channel_link)
             logger.info(f"[抽奖设置] 成功创建抽奖条件: {requirement}")
             
+            # 提示无法自动检查成员的情况
+            warning = ""
+            if resolved is None:
+                warning = "⚠️ 暂时无法获取该频道/群组的信息，请确认链接正确且机器人已加入。\n\n"
+            elif not resolved.bot_is_admin:
+                warning = "⚠️ 机器人不是该频道/群组的管理员，可能无法检查用户是否已加入，请将机器人设为管理员。\n\n"
+            
             # 提供继续添加或下一步的选项
             keyboard = InlineKeyboardMarkup([
                 [InlineKeyboardButton("➕ 继续添加频道/群组", callback_data=f"add_more_channel_{lottery_id}")],
@@ -316,6 +343,7 @@ async def requirement_link_input(update: Update, context: ContextTypes.DEFAULT_T
             
             await message.reply_text(
                 f"✅ 已添加参与条件: 必须关注 {channel_link}\n\n"
+                f"{warning}"
                 f"您可以继续添加更多频道/群组，或进入下一步。",
                 reply_markup=keyboard
             )
@@ -389,7 +417,7 @@ async def next_step_after_requirement(update: Update, context: ContextTypes.DEFA
         # 获取已设置的参与条件
         @sync_to_async
         def get_requirements(lottery_id):
-            from .models import Lottery, LotteryRequirement
+            from .models import Lottery
             lottery = Lottery.objects.get(id=lottery_id)
             return list(LotteryRequirement.objects.filter(lottery=lottery))
             
@@ -1317,6 +1345,9 @@ async def set_pin_results(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             logger.info(f"[抽奖设置] 已更新抽奖设置: ID={lottery_id}")
             
+            # 开奖时间或状态已变化，通知开奖调度器
+            notify_lottery_schedule_changed(lottery_id)
+            
             # 格式化日期时间显示 (北京时间)
             beijing_time_format = "%Y-%m-%d %H:%M"
             beijing_tz = dt_timezone(timedelta(hours=8))
@@ -1358,7 +1389,7 @@ async def set_pin_results(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # 获取参与条件
             @sync_to_async
             def get_requirements(lottery_id):
-                from .models import Lottery, LotteryRequirement
+                from .models import Lottery
                 lottery = Lottery.objects.get(id=lottery_id)
                 return list(LotteryRequirement.objects.filter(lottery=lottery))
             
@@ -1537,77 +1568,16 @@ async def publish_lottery_to_group(update: Update, context: ContextTypes.DEFAULT
         
         # 发送抽奖信息到群组
         try:
-            # 使用存储在上下文中的预览消息，如果不存在则生成一个
+            # 使用存储在上下文中的预览消息，如果不存在则使用缓存的公告内容
+            announcement = await render_lottery_announcement(lottery)
             preview_message = lottery_data.get('preview_message')
             if not preview_message:
-                logger.warning("[抽奖发布] 预览消息不存在，正在生成...")
-                
-                # 获取奖品信息
-                @sync_to_async
-                def get_prizes(lottery_id):
-                    from .models import Prize
-                    prizes = Prize.objects.filter(lottery_id=lottery_id).order_by('order')
-                    return list(prizes)
-                
-                prizes = await get_prizes(lottery_id)
-                
-                # 获取参与条件信息
-                @sync_to_async
-                def get_requirements(lottery_id):
-                    from .models import LotteryRequirement
-                    requirements = LotteryRequirement.objects.filter(lottery_id=lottery_id)
-                    return list(requirements)
-                    
-                requirements = await get_requirements(lottery_id)
-                
-                # 构建奖品信息文本
-                prizes_text = ""
-                for prize in prizes:
-                    prizes_text += f"• {prize.name}: {prize.description} ({prize.quantity}名)\n"
-                
-                # 构建参与条件文本
-                requirements_text = ""
-                for req in requirements:
-                    if req.requirement_type == 'CHANNEL' and req.channel_username:
-                        username = req.channel_username
-                        if not username.startswith('@'):
-                            username = f"@{username}"
-                        requirements_text += f"• 必须加入: {username}\n"
-                    elif req.requirement_type == 'GROUP' and req.group_username:
-                        username = req.group_username
-                        if not username.startswith('@'):
-                            username = f"@{username}"
-                        requirements_text += f"• 必须加入: {username}\n"
-                    elif req.requirement_type == 'GROUP' and req.chat_identifier:
-                        requirements_text += f"• 必须加入: {req.chat_identifier}\n"
-                    elif req.requirement_type == 'CHANNEL' and req.chat_identifier:
-                        requirements_text += f"• 必须加入: {req.chat_identifier}\n"
-                
-                # 构建预览消息
-                preview_message = (
-                    f"🎁 <b>{lottery.title}</b>\n\n"
-                    f"{lottery.description}\n\n"
-                    f"⏱ 报名截止: {lottery.signup_deadline.strftime('%Y-%m-%d %H:%M')}\n"
-                    f"🕒 开奖时间: {lottery.draw_time.strftime('%Y-%m-%d %H:%M')}\n\n"
-                    f"🏆 奖品设置:\n{prizes_text}\n"
-                )
-                
-                # 如果有参与条件，添加到预览消息
-                if requirements_text:
-                    preview_message += f"📝 参与条件:\n{requirements_text}\n"
-                
-                # 如果有积分要求，添加积分信息
-                if lottery.points_required > 0:
-                    preview_message += f"💰 参与所需积分: {lottery.points_required}\n"
-                
-                # 更新lottery_data
+                preview_message = announcement.text
                 lottery_data['preview_message'] = preview_message
                 logger.info("[抽奖发布] 已生成预览消息")
             
-            # 添加参与按钮
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("🎲 参与抽奖", callback_data=f"join_lottery_{lottery_id}")]
-            ])
+            # 参与按钮
+            keyboard = announcement.keyboard
             
             # 根据媒体类型选择发送方式
             media_type = lottery.media_type
@@ -1630,6 +1600,7 @@ async def publish_lottery_to_group(update: Update, context: ContextTypes.DEFAULT
                 return lottery.status
                 
             lottery_status = await activate_lottery(lottery_id)
+            notify_lottery_schedule_changed(lottery_id)
             logger.info(f"[抽奖发布] 抽奖ID={lottery_id}的当前状态: {lottery_status}")
             
             # 确保使用的是从数据库中获取的实际Telegram群组ID
@@ -1677,7 +1648,11 @@ async def publish_lottery_to_group(update: Update, context: ContextTypes.DEFAULT
                     from jifen.models import Group, User
                     from choujiang.models import Lottery
                     from django.db import transaction
+                    from jifen.rule_cache import invalidate_group_rule
                     with transaction.atomic():
+                        # 群组ID变化，提交后清除新旧群组的积分规则缓存
+                        transaction.on_commit(lambda: (invalidate_group_rule(old_id), invalidate_group_rule(new_id)))
+                        
                         # 检查新ID是否已存在
                         existing_group = Group.objects.filter(group_id=new_id).first()
                         old_group = Group.objects.get(group_id=old_id)
@@ -2228,7 +2203,7 @@ async def join_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     try:
         # 从回调数据中提取抽奖ID
         lottery_id = int(query.data.split("_")[2])
-        logger.info(f"[抽奖参与] 用户 {user.id} 尝试参与抽奖ID={lottery_id}")
+        logger.debug("[抽奖参与] 用户 %s 尝试参与抽奖ID=%s", user.id, lottery_id)
         
         # 获取抽奖信息
         @sync_to_async
@@ -2242,15 +2217,19 @@ async def join_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 
         lottery, is_active = await get_lottery_and_check_status(lottery_id)
         
+        # 群内提示经由发送队列异步发送（受群组限速），不阻塞该群后续更新的处理
+        chat_id = query.message.chat_id
+        reply_to = query.message.message_id
+        
         if not lottery:
-            logger.warning(f"[抽奖参与] 抽奖ID={lottery_id}不存在")
+            logger.warning("[抽奖参与] 抽奖ID=%s不存在", lottery_id)
             await query.edit_message_reply_markup(reply_markup=None)
-            await query.message.reply_text("❌ 该抽奖活动不存在或已被删除。")
+            submit_message(context.bot, chat_id, "❌ 该抽奖活动不存在或已被删除。", reply_to_message_id=reply_to)
             return
             
         if not is_active:
-            logger.warning(f"[抽奖参与] 抽奖ID={lottery_id}已结束或不可参与")
-            await query.message.reply_text("❌ 该抽奖活动已结束或不在可参与时间内。")
+            logger.warning("[抽奖参与] 抽奖ID=%s已结束或不可参与", lottery_id)
+            submit_message(context.bot, chat_id, "❌ 该抽奖活动已结束或不在可参与时间内。", reply_to_message_id=reply_to)
             return
             
         # 检查用户是否已参与
@@ -2282,54 +2261,36 @@ async def join_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         user_obj, has_joined, user_points, points_required, group, lottery_obj = await check_user_participation(lottery_id, user.id)
         
         if not user_obj:
-            logger.warning(f"[抽奖参与] 用户 {user.id} 不在群组中或抽奖不存在")
-            await query.message.reply_text("❌ 您不是该群组的成员，无法参与抽奖。")
+            logger.warning("[抽奖参与] 用户 %s 不在群组中或抽奖不存在", user.id)
+            submit_message(context.bot, chat_id, "❌ 您不是该群组的成员，无法参与抽奖。", reply_to_message_id=reply_to)
             return
             
         if has_joined:
-            logger.info(f"[抽奖参与] 用户 {user.id} 已经参与了抽奖ID={lottery_id}")
-            message = await query.message.reply_text("您已经参与了该抽奖活动，请勿重复参与。")
-            
-            # 设置10秒后自动删除消息
-            async def delete_message_later():
-                await asyncio.sleep(10)  # 等待10秒
-                try:
-                    await message.delete()
-                    logger.info(f"[抽奖参与] 已自动删除用户 {user.id} 的重复参与提醒消息")
-                except Exception as e:
-                    logger.error(f"[抽奖参与] 自动删除重复参与提醒消息失败: {e}")
-            
-            # 创建异步任务，不等待它完成
-            context.application.create_task(delete_message_later())
+            logger.debug("[抽奖参与] 用户 %s 已经参与了抽奖ID=%s", user.id, lottery_id)
+            # 10秒后自动删除提醒
+            submit_temporary_message(
+                context.bot, chat_id, "您已经参与了该抽奖活动，请勿重复参与。", 10, reply_to_message_id=reply_to
+            )
             return
             
         # 检查用户积分是否足够
         if user_points < points_required:
-            logger.info(f"[抽奖参与] 用户 {user.id} 积分不足，当前积分={user_points}，需要积分={points_required}")
-            message = await query.message.reply_text(
+            logger.debug("[抽奖参与] 用户 %s 积分不足，当前积分=%s，需要积分=%s", user.id, user_points, points_required)
+            # 10秒后自动删除提醒
+            submit_temporary_message(
+                context.bot, chat_id,
                 f"❌ @{user.username or user.first_name} 您的积分不足，无法参与抽奖。\n"
                 f"当前积分: {user_points}\n"
                 f"所需积分: {points_required}\n"
-                f"还差 {points_required - user_points} 积分"
+                f"还差 {points_required - user_points} 积分",
+                10, reply_to_message_id=reply_to
             )
-            
-            # 设置10秒后自动删除消息
-            async def delete_message_later():
-                await asyncio.sleep(10)  # 等待10秒
-                try:
-                    await message.delete()
-                    logger.info(f"[抽奖参与] 已自动删除用户 {user.id} 的积分不足提醒消息")
-                except Exception as e:
-                    logger.error(f"[抽奖参与] 自动删除积分不足提醒消息失败: {e}")
-            
-            # 创建异步任务，不等待它完成
-            context.application.create_task(delete_message_later())
             return
         
         # 获取参与条件
         @sync_to_async
         def get_lottery_requirements(lottery_id):
-            from .models import Lottery, LotteryRequirement
+            from .models import Lottery
             lottery = Lottery.objects.get(id=lottery_id)
             return list(LotteryRequirement.objects.filter(lottery=lottery)), lottery.title
             
@@ -2348,27 +2309,16 @@ async def join_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 [InlineKeyboardButton("🎲 前往参与抽奖", url=deep_link)]
             ])
             
-            # 发送提示消息
-            message = await query.message.reply_text(
+            # 发送提示消息，10秒后自动删除
+            submit_temporary_message(
+                context.bot, chat_id,
                 f"✅ @{user.username or user.first_name} 您的积分满足参与条件！\n\n"
                 f"请点击下方按钮前往与机器人私聊，以完成抽奖参与。\n"
                 f"这样我们才能在您中奖时通知您！",
-                reply_markup=keyboard
+                10, reply_to_message_id=reply_to, reply_markup=keyboard
             )
             
-            # 设置10秒后自动删除消息
-            async def delete_message_later():
-                await asyncio.sleep(10)
-                try:
-                    await message.delete()
-                    logger.info(f"[抽奖参与] 已自动删除用户 {user.id} 的参与引导消息")
-                except Exception as e:
-                    logger.error(f"[抽奖参与] 自动删除参与引导消息失败: {e}")
-            
-            # 创建异步任务，不等待它完成
-            asyncio.create_task(delete_message_later())
-            
-            logger.info(f"[抽奖参与] 已引导用户 {user.id} 前往私聊检查参与条件，抽奖ID={lottery_id}")
+            logger.debug("[抽奖参与] 已引导用户 %s 前往私聊检查参与条件，抽奖ID=%s", user.id, lottery_id)
             return
             
         # 如果有参与条件，使用新的命令格式
@@ -2379,31 +2329,20 @@ async def join_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             [InlineKeyboardButton("🎲 前往检查参与条件", url=direct_link)]
         ])
         
-        # 发送提示消息
-        message = await query.message.reply_text(
+        # 发送提示消息，30秒后自动删除
+        submit_temporary_message(
+            context.bot, chat_id,
             f"✅ @{user.username or user.first_name} 您的积分满足参与条件！\n\n"
             f"请点击下方按钮前往与机器人私聊，以完成抽奖参与。\n"
             f"这样我们才能在您中奖时通知您！",
-            reply_markup=keyboard
+            30, reply_to_message_id=reply_to, reply_markup=keyboard
         )
         
-        # 设置10秒后自动删除消息
-        async def delete_message_later():
-            await asyncio.sleep(30)
-            try:
-                await message.delete()
-                logger.info(f"[抽奖参与] 已自动删除用户 {user.id} 的参与引导消息")
-            except Exception as e:
-                logger.error(f"[抽奖参与] 自动删除参与引导消息失败: {e}")
-        
-        # 创建异步任务，不等待它完成
-        asyncio.create_task(delete_message_later())
-        
-        logger.info(f"[抽奖参与] 已引导用户 {user.id} 前往私聊检查参与条件，抽奖ID={lottery_id}")
+        logger.debug("[抽奖参与] 已引导用户 %s 前往私聊检查参与条件，抽奖ID=%s", user.id, lottery_id)
         
     except Exception as e:
         logger.error(f"[抽奖参与] A处理参与抽奖时出错: {e}\n{traceback.format_exc()}")
-        await query.message.reply_text("参与抽奖时出错，请重试。")
+        submit_message(context.bot, query.message.chat_id, "参与抽奖时出错，请重试。")
 
 async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """处理 /start 命令"""
@@ -2515,40 +2454,28 @@ async def process_lottery_join(update: Update, context: ContextTypes.DEFAULT_TYP
     # 确定消息对象 - 可能来自回调查询或直接消息
     if update.callback_query:
         message = update.callback_query.message
-        logger.info(f"[抽奖参与] 用户 {user.id} 通过回调查询参与抽奖ID={lottery_id}")
+        logger.debug("[抽奖参与] 用户 %s 通过回调查询参与抽奖ID=%s", user.id, lottery_id)
     else:
         message = update.message
-        logger.info(f"[抽奖参与] 用户 {user.id} 通过深度链接参与抽奖ID={lottery_id}")
+        logger.debug("[抽奖参与] 用户 %s 通过深度链接参与抽奖ID=%s", user.id, lottery_id)
     
     try:
-        # 获取抽奖信息
-        @sync_to_async
-        def get_lottery_info(lottery_id, user_id):
-            from .models import Lottery, Participant
-            from jifen.models import User
-            
-            try:
-                lottery = Lottery.objects.get(id=lottery_id)
-                group = lottery.group
-                
-                try:
-                    user = User.objects.get(telegram_id=user_id, group=group)
-                    has_joined = Participant.objects.filter(lottery=lottery, user=user).exists()
-                    return lottery, user, has_joined, lottery.points_required, user.points, group
-                except User.DoesNotExist:
-                    logger.info(f"[抽奖参与] 用户 {user_id} 尝试参与抽奖 {lottery_id}，但在群组 {group.group_id} 中不存在")
-                    return lottery, None, False, lottery.points_required, 0, group
-            except Lottery.DoesNotExist:
-                logger.info(f"[抽奖参与] 用户 {user_id} 尝试参与不存在的抽奖 {lottery_id}")
-                return None, None, False, 0, 0, None
+        # 在一个事务内完成资格检查、积分扣除和参与记录
+        result = await db_sync_to_async(join_lottery_atomic)(lottery_id, user.id)
+        lottery = result.lottery
         
-        lottery, user_obj, has_joined, points_required, user_points, group = await get_lottery_info(lottery_id, user.id)
-        
-        if not lottery:
+        if result.code == JOIN_LOTTERY_NOT_FOUND:
             await message.reply_text("❌ 抽奖活动不存在。")
             return False
         
-        if not user_obj:
+        group = lottery.group
+        points_required = lottery.points_required
+        
+        if result.code == JOIN_LOTTERY_CLOSED:
+            await message.reply_text("❌ 该抽奖活动已结束或不在可参与时间内。")
+            return False
+        
+        if result.code == JOIN_NOT_MEMBER:
             # 用户不是群组成员，提示加入群组
             keyboard = InlineKeyboardMarkup([
                 [InlineKeyboardButton(
@@ -2565,57 +2492,21 @@ async def process_lottery_join(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return False
         
-        if has_joined:
+        if result.code == JOIN_ALREADY_JOINED:
             await message.reply_text("您已经参与了该抽奖活动，请勿重复参与。")
             return True
         
         # 检查用户是否有足够积分
-        if user_points < points_required:
+        if result.code == JOIN_INSUFFICIENT_POINTS:
             await message.reply_text(
                 f"❌ 您的积分不足！\n\n"
                 f"参与抽奖需要 {points_required} 积分\n"
-                f"您当前的积分: {user_points}\n\n"
+                f"您当前的积分: {result.user_points}\n\n"
                 f"请通过与群组互动获取更多积分后再参与抽奖。"
             )
             return False
         
-        # 参与抽奖
-        @sync_to_async
-        def join_raffle(lottery, user_obj, points_required):
-            from .models import Participant
-            from jifen.models import PointTransaction
-            from django.utils import timezone
-            import datetime
-            
-            # 创建参与记录
-            participant = Participant(
-                lottery=lottery,
-                user=user_obj,
-                joined_at=timezone.now(),
-                points_spent=points_required
-            )
-            participant.save()
-            
-            # 如果需要扣除积分
-            if points_required > 0:
-                # 扣除用户积分
-                user_obj.points -= points_required
-                user_obj.save()
-                
-                # 记录积分变动
-                transaction = PointTransaction(
-                    user=user_obj,
-                    group=user_obj.group,
-                    amount=-points_required,
-                    type='RAFFLE_PARTICIPATION',
-                    description=f"参与抽奖 '{lottery.title}'",
-                    transaction_date=datetime.date.today()
-                )
-                transaction.save()
-            
-            return True
-        
-        success = await join_raffle(lottery, user_obj, points_required)
+        success = result.success
         
         if success:
             # 发送成功消息
@@ -2658,7 +2549,7 @@ async def process_lottery_join(update: Update, context: ContextTypes.DEFAULT_TYP
                     await message.reply_text(
                         f"✅ 您已成功参与抽奖活动！\n"
                         f"已扣除 {points_required} 积分\n"
-                        f"剩余积分: {user_points - points_required}\n"
+                        f"剩余积分: {result.user_points}\n"
                         f"【{draw_time_str}】开奖，请关注群组，我们也会私聊通知你。",
                         reply_markup=keyboard
                     )
@@ -2670,7 +2561,7 @@ async def process_lottery_join(update: Update, context: ContextTypes.DEFAULT_TYP
                         reply_markup=keyboard
                     )
                 
-                logger.info(f"[抽奖参与] 用户 {user.id} 成功参与抽奖ID={lottery_id}，扣除积分={points_required}")
+                logger.info("[抽奖参与] 用户 %s 成功参与抽奖ID=%s，扣除积分=%s", user.id, lottery_id, points_required)
                 return True
             except Exception as msg_e:
                 # 如果发送消息出错，记录错误并使用更简单的消息格式
@@ -2709,27 +2600,25 @@ async def process_lottery_check(update: Update, context: ContextTypes.DEFAULT_TY
     try:
         logger.info(f"[抽奖条件检测] 开始处理抽奖ID={lottery_id}的详情查看请求")
         
-        # 获取抽奖信息和要求
-        @sync_to_async
-        def get_lottery_info_and_requirements(lottery_id):
-            from .models import Lottery, LotteryRequirement
-            try:
-                lottery = Lottery.objects.get(id=lottery_id)
-                requirements = list(LotteryRequirement.objects.filter(lottery=lottery))
-                prize_setup = lottery.prizes.exists()
-                return lottery, requirements, prize_setup
-            except Lottery.DoesNotExist:
+        # 获取抽奖信息（奖品和参与条件部分使用渲染缓存）
+        @db_sync_to_async
+        def get_lottery(lottery_id):
+            from .models import Lottery
+            lottery = Lottery.objects.filter(id=lottery_id).first()
+            if lottery is None:
                 logger.error(f"[抽奖条件检测] 抽奖ID={lottery_id}不存在")
-                return None, [], False
+            return lottery
         
-        lottery, requirements, prize_setup = await get_lottery_info_and_requirements(lottery_id)
+        lottery = await get_lottery(lottery_id)
         
         if not lottery:
             await message.reply_text("❌ 该抽奖ID不存在，请检查您的链接或输入。")
             return
         
+        detail = await render_lottery_detail(lottery)
+        
         # 检查抽奖是否已经设置好奖品
-        if not prize_setup:
+        if detail is None:
             await message.reply_text("⚠️ 该抽奖尚未完成设置，奖品信息不完整。")
             return
         
@@ -2737,6 +2626,7 @@ async def process_lottery_check(update: Update, context: ContextTypes.DEFAULT_TY
         if lottery.status != 'ACTIVE':
             status_text = {
                 'DRAFT': '草稿',
+                'DRAWING': '开奖中',
                 'PAUSED': '已暂停',
                 'ENDED': '已结束',
                 'CANCELLED': '已取消'
@@ -2776,48 +2666,11 @@ async def process_lottery_check(update: Update, context: ContextTypes.DEFAULT_TY
             else:
                 lottery_text += f"⏰ 报名截止: {deadline.strftime('%Y-%m-%d %H:%M')} (已截止)\n"
         
-        # 添加开奖时间
-        if lottery.draw_time:
-            lottery_text += f"🔮 开奖时间: {lottery.draw_time.strftime('%Y-%m-%d %H:%M')}\n"
-        
-        lottery_text += "\n🏆 奖品设置:\n"
-        
-        # 获取奖品信息
-        @sync_to_async
-        def get_prizes(lottery_id):
-            from .models import Prize
-            return list(Prize.objects.filter(lottery_id=lottery_id).order_by('order'))
-            
-        prizes = await get_prizes(lottery_id)
-        
-        for prize in prizes:
-            lottery_text += f"• {prize.name}: {prize.description} ({prize.quantity}名)\n"
-        
-        # 添加参与条件说明
-        if requirements:
-            lottery_text += "\n📝 参与条件:\n"
-            for req in requirements:
-                if req.requirement_type == 'CHANNEL':
-                    display_name = req.channel_username or str(req.channel_id)
-                    # 智能显示频道用户名，如果不以@开头则添加@
-                    if display_name and not display_name.startswith('@'):
-                        display_name = f"@{display_name}"
-                    lottery_text += f"• 必须关注: {display_name}\n"
-                elif req.requirement_type == 'GROUP':
-                    display_name = req.group_username or str(req.group_id)
-                    # 智能显示群组用户名，如果不以@开头则添加@
-                    if display_name and not display_name.startswith('@'):
-                        display_name = f"@{display_name}"
-                    lottery_text += f"• 必须加入: {display_name}\n"
-                elif req.requirement_type == 'REGISTRATION_TIME':
-                    lottery_text += f"• 账号注册时间: >{req.min_registration_days}天\n"
-        else:
-            lottery_text += "\n此抽奖没有特殊参与条件。\n"
+        # 开奖时间、奖品和参与条件（缓存）
+        lottery_text += detail.text
         
         # 创建检查条件按钮和参与按钮
-        buttons = [
-            [InlineKeyboardButton("🔍 检测是否已满足条件", callback_data=f"private_check_req_{lottery_id}")]
-        ]
+        buttons = list(detail.keyboard.inline_keyboard)
         
         # 检查用户是否是管理员，如果是，添加"发送到群组"按钮
         @sync_to_async
@@ -2859,13 +2712,13 @@ async def check_channel_subscription(bot, user_id, channel_username):
             chat_id = f"@{username}"
         
         logger.info(f"正在检查用户 {user_id} 是否订阅频道 {chat_id}")
-        chat_member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-        valid_status = chat_member.status in ['member', 'administrator', 'creator']
+        # 使用短期缓存，并限制同一频道的并发请求数
+        valid_status = await check_member(bot, chat_id, user_id)
         
         if valid_status:
-            logger.info(f"用户 {user_id} 已订阅频道 {chat_id}，状态为: {chat_member.status}")
+            logger.info(f"用户 {user_id} 已订阅频道 {chat_id}")
         else:
-            logger.info(f"用户 {user_id} 未订阅频道 {chat_id}，状态为: {chat_member.status}")
+            logger.info(f"用户 {user_id} 未订阅频道 {chat_id}")
             
         return valid_status
     except Exception as e:
@@ -2890,13 +2743,13 @@ async def check_group_membership(bot, user_id, group_id):
             chat_id = f"@{group_username}"
         
         logger.info(f"正在检查用户 {user_id} 是否在群组 {chat_id} 中")
-        chat_member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-        valid_status = chat_member.status in ['member', 'administrator', 'creator']
+        # 使用短期缓存，并限制同一群组的并发请求数
+        valid_status = await check_member(bot, chat_id, user_id)
         
         if valid_status:
-            logger.info(f"用户 {user_id} 在群组 {chat_id} 中，状态为: {chat_member.status}")
+            logger.info(f"用户 {user_id} 在群组 {chat_id} 中")
         else:
-            logger.info(f"用户 {user_id} 在群组 {chat_id} 中，但状态为: {chat_member.status}，不视为有效成员")
+            logger.info(f"用户 {user_id} 不是群组 {chat_id} 的有效成员")
             
         return valid_status
     except Exception as e:
@@ -2912,7 +2765,7 @@ async def check_registration_time(user_id, min_days):
     """检查用户注册时间是否满足最低天数要求"""
     try:
         from jifen.models import User
-        user = await sync_to_async(User.objects.get)(telegram_id=user_id)
+        user = await db_sync_to_async(User.objects.get)(telegram_id=user_id)
         if not user.register_time:
             return False
         days_registered = (timezone.now() - user.register_time).days
@@ -2932,15 +2785,15 @@ async def private_check_requirements(update: Update, context: ContextTypes.DEFAU
     try:
         # 从回调数据中提取抽奖ID
         lottery_id = int(query.data.split("_")[3])
-        logger.info(f"[私聊抽奖条件检测] 用户 {user.id} 在私聊中请求检测抽奖ID={lottery_id}的参与条件")
+        logger.debug("[私聊抽奖条件检测] 用户 %s 在私聊中请求检测抽奖ID=%s的参与条件", user.id, lottery_id)
         
         # 获取抽奖信息
-        lottery = await sync_to_async(Lottery.objects.get)(id=lottery_id)
+        lottery = await db_sync_to_async(Lottery.objects.get)(id=lottery_id)
         
         # 检查该抽奖是否激活
         if not lottery.is_active:
             await query.edit_message_text("该抽奖活动已结束或未激活。")
-            logger.info(f"[私聊抽奖条件检测] 用户 {user.id} 尝试检测已结束的抽奖ID={lottery_id}")
+            logger.debug("[私聊抽奖条件检测] 用户 %s 尝试检测已结束的抽奖ID=%s", user.id, lottery_id)
             return
         
         # 初始化未满足的条件列表和已满足的条件列表
@@ -2948,20 +2801,34 @@ async def private_check_requirements(update: Update, context: ContextTypes.DEFAU
         fulfilled_requirements = []
         
         # 获取抽奖所有要求
-        requirements = await sync_to_async(list)(LotteryRequirement.objects.filter(lottery=lottery))
+        requirements = await get_lottery_requirements(lottery)
         
-        # 检查每个要求
-        for req in requirements:
-            requirement_met = False
-            
+        # 并发检查全部要求（频道/群组的 get_chat_member 请求同时发出）
+        async def check_requirement(req):
+            # 已解析的条件直接使用数字ID检查
+            if req.requirement_type == 'CHANNEL':
+                return await check_channel_subscription(bot, user.id, req.member_chat_id())
+            if req.requirement_type == 'GROUP':
+                return await check_group_membership(bot, user.id, req.member_chat_id())
+            if req.requirement_type == 'REGISTRATION_TIME':
+                return await check_registration_time(user.id, req.min_registration_days)
+            return None
+        
+        results = await asyncio.gather(*(check_requirement(req) for req in requirements))
+        
+        # 按原顺序整理检查结果
+        for req, requirement_met in zip(requirements, results):
+            join_username = None
             # 获取可显示的条件文本
             if req.requirement_type == 'CHANNEL':
+                join_username = req.channel_username
                 display_name = req.channel_username or str(req.channel_id)
                 # 智能显示频道用户名，如果不以@开头则添加@
                 if display_name and not display_name.startswith('@'):
                     display_name = f"@{display_name}"
                 condition_text = f"关注频道: {display_name}"
             elif req.requirement_type == 'GROUP':
+                join_username = req.group_username
                 display_name = req.group_username or str(req.group_id)
                 # 智能显示群组用户名，如果不以@开头则添加@
                 if display_name and not display_name.startswith('@'):
@@ -2972,53 +2839,20 @@ async def private_check_requirements(update: Update, context: ContextTypes.DEFAU
             else:
                 condition_text = "未知条件"
             
-            if req.requirement_type == 'CHANNEL':
-                # 检查频道订阅
-                is_subscribed = await check_channel_subscription(bot, user.id, req.channel_username)
-                if is_subscribed:
-                    fulfilled_requirements.append(f"✅ {condition_text}")
-                    requirement_met = True
-                else:
-                    unfulfilled_requirements.append({
-                        'text': f"❌ {condition_text}",
-                        'username': req.channel_username
-                    })
-                    
-            elif req.requirement_type == 'GROUP':
-                # 检查群组成员
-                is_member = await check_group_membership(bot, user.id, req.group_username)
-                if is_member:
-                    fulfilled_requirements.append(f"✅ {condition_text}")
-                    requirement_met = True
-                else:
-                    unfulfilled_requirements.append({
-                        'text': f"❌ {condition_text}",
-                        'username': req.group_username
-                    })
-                    
-            elif req.requirement_type == 'REGISTRATION_TIME':
-                # 检查注册时间
-                try:
-                    min_days = req.min_registration_days
-                    meets_time_req = await check_registration_time(user.id, min_days)
-                    if meets_time_req:
-                        fulfilled_requirements.append(f"✅ {condition_text}")
-                        requirement_met = True
-                    else:
-                        unfulfilled_requirements.append({
-                            'text': f"❌ {condition_text}",
-                            'username': None
-                        })
-                except ValueError:
-                    logger.error(f"[私聊抽奖条件检测] 时间要求值无效: {req.min_registration_days}")
-                    
-            else:
+            if requirement_met is None:
                 # 未知类型的要求
-                logger.warning(f"[私聊抽奖条件检测] 未知类型的要求: {req.requirement_type}")
+                logger.warning("[私聊抽奖条件检测] 未知类型的要求: %s", req.requirement_type)
                 unfulfilled_requirements.append({
                     'text': f"❓ {condition_text} (未知类型)",
                     'username': None
                 })
+            elif requirement_met:
+                fulfilled_requirements.append(f"✅ {condition_text}")
+            else:
+                unfulfilled_requirements.append({
+                    'text': f"❌ {condition_text}",
+                    'username': join_username
+                })
         
         # 创建重新检测按钮
         buttons = []
@@ -3042,7 +2876,7 @@ async def private_check_requirements(update: Update, context: ContextTypes.DEFAU
                 message_text,
                 reply_markup=keyboard
             )
-            logger.info(f"[私聊抽奖条件检测] 用户 {user.id} 满足抽奖ID={lottery_id}的所有参与条件")
+            logger.debug("[私聊抽奖条件检测] 用户 %s 满足抽奖ID=%s的所有参与条件", user.id, lottery_id)
             return
         else:
             # 用户未满足所有条件
@@ -3068,7 +2902,7 @@ async def private_check_requirements(update: Update, context: ContextTypes.DEFAU
                 message_text,
                 reply_markup=keyboard
             )
-            logger.info(f"[私聊抽奖条件检测] 用户 {user.id} 在私聊中未满足抽奖ID={lottery_id}的所有参与条件")
+            logger.debug("[私聊抽奖条件检测] 用户 %s 在私聊中未满足抽奖ID=%s的所有参与条件", user.id, lottery_id)
     
     except Exception as e:
         logger.error(f"[私聊抽奖条件检测] 处理私聊检测按钮时出错: {e}\n{traceback.format_exc()}")
@@ -3091,39 +2925,27 @@ async def private_join_lottery(update: Update, context: ContextTypes.DEFAULT_TYP
     try:
         # 从回调数据中提取抽奖ID
         lottery_id = int(query.data.split("_")[3])
-        logger.info(f"[私聊参与抽奖] 用户 {user.id} 在私聊中请求参与抽奖ID={lottery_id}")
+        logger.debug("[私聊参与抽奖] 用户 %s 在私聊中请求参与抽奖ID=%s", user.id, lottery_id)
         
         # 不要尝试修改update对象，而是直接使用query.message
         message = query.message
         
-        # 获取抽奖信息
-        @sync_to_async
-        def get_lottery_info(lottery_id, user_id):
-            from .models import Lottery, Participant
-            from jifen.models import User
-            
-            try:
-                lottery = Lottery.objects.get(id=lottery_id)
-                group = lottery.group
-                
-                try:
-                    user = User.objects.get(telegram_id=user_id, group=group)
-                    has_joined = Participant.objects.filter(lottery=lottery, user=user).exists()
-                    return lottery, user, has_joined, lottery.points_required, user.points, group
-                except User.DoesNotExist:
-                    logger.info(f"[抽奖参与] 用户 {user_id} 尝试参与抽奖 {lottery_id}，但在群组 {group.group_id} 中不存在")
-                    return lottery, None, False, lottery.points_required, 0, group
-            except Lottery.DoesNotExist:
-                logger.info(f"[抽奖参与] 用户 {user_id} 尝试参与不存在的抽奖 {lottery_id}")
-                return None, None, False, 0, 0, None
-        
-        lottery, user_obj, has_joined, points_required, user_points, group = await get_lottery_info(lottery_id, user.id)
+        # 在一个事务内完成资格检查、积分扣除和参与记录
+        result = await db_sync_to_async(join_lottery_atomic)(lottery_id, user.id)
+        lottery = result.lottery
         
-        if not lottery:
+        if result.code == JOIN_LOTTERY_NOT_FOUND:
             await message.reply_text("❌ 抽奖活动不存在。")
             return False
         
-        if not user_obj:
+        group = lottery.group
+        points_required = lottery.points_required
+        
+        if result.code == JOIN_LOTTERY_CLOSED:
+            await message.reply_text("❌ 该抽奖活动已结束或不在可参与时间内。")
+            return False
+        
+        if result.code == JOIN_NOT_MEMBER:
             # 用户不是群组成员，提示加入群组
             keyboard = InlineKeyboardMarkup([
                 [InlineKeyboardButton(
@@ -3140,57 +2962,21 @@ async def private_join_lottery(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return False
         
-        if has_joined:
+        if result.code == JOIN_ALREADY_JOINED:
             await message.reply_text("您已经参与了该抽奖活动，请勿重复参与。")
             return True
         
         # 检查用户是否有足够积分
-        if user_points < points_required:
+        if result.code == JOIN_INSUFFICIENT_POINTS:
             await message.reply_text(
                 f"❌ 您的积分不足！\n\n"
                 f"参与抽奖需要 {points_required} 积分\n"
-                f"您当前的积分: {user_points}\n\n"
+                f"您当前的积分: {result.user_points}\n\n"
                 f"请通过与群组互动获取更多积分后再参与抽奖。"
             )
             return False
         
-        # 参与抽奖
-        @sync_to_async
-        def join_raffle(lottery, user_obj, points_required):
-            from .models import Participant
-            from jifen.models import PointTransaction
-            from django.utils import timezone
-            import datetime
-            
-            # 创建参与记录
-            participant = Participant(
-                lottery=lottery,
-                user=user_obj,
-                joined_at=timezone.now(),
-                points_spent=points_required
-            )
-            participant.save()
-            
-            # 如果需要扣除积分
-            if points_required > 0:
-                # 扣除用户积分
-                user_obj.points -= points_required
-                user_obj.save()
-                
-                # 记录积分变动
-                transaction = PointTransaction(
-                    user=user_obj,
-                    group=user_obj.group,
-                    amount=-points_required,
-                    type='RAFFLE_PARTICIPATION',
-                    description=f"参与抽奖 '{lottery.title}'",
-                    transaction_date=datetime.date.today()
-                )
-                transaction.save()
-            
-            return True
-        
-        success = await join_raffle(lottery, user_obj, points_required)
+        success = result.success
         
         if success:
             # 发送成功消息
@@ -3233,7 +3019,7 @@ async def private_join_lottery(update: Update, context: ContextTypes.DEFAULT_TYP
                     await message.reply_text(
                         f"✅ 您已成功参与抽奖活动！\n"
                         f"已扣除 {points_required} 积分\n"
-                        f"剩余积分: {user_points - points_required}\n"
+                        f"剩余积分: {result.user_points}\n"
                         f"【{draw_time_str}】开奖，请关注群组，我们也会私聊通知你。",
                         reply_markup=keyboard
                     )
@@ -3245,7 +3031,7 @@ async def private_join_lottery(update: Update, context: ContextTypes.DEFAULT_TYP
                         reply_markup=keyboard
                     )
                 
-                logger.info(f"[抽奖参与] 用户 {user.id} 成功参与抽奖ID={lottery_id}，扣除积分={points_required}")
+                logger.info("[抽奖参与] 用户 %s 成功参与抽奖ID=%s，扣除积分=%s", user.id, lottery_id, points_required)
                 return True
             except Exception as msg_e:
                 # 如果发送消息出错，记录错误并使用更简单的消息格式
@@ -3382,6 +3168,7 @@ def get_lottery_handlers():
         CallbackQueryHandler(private_check_requirements, pattern="^private_check_req_\d+$"),
         CallbackQueryHandler(private_join_lottery, pattern="^private_join_lottery_\d+$"),
         CommandHandler("check_lottery", direct_check_lottery),
+        CallbackQueryHandler(check_lottery_page, pattern="^check_lottery_page_(all|mine)_[np]_\d+$"),
         CallbackQueryHandler(view_lottery, pattern="^view_lottery_\d+$"),
         get_admin_draw_conversation_handler(),  # 调用函数而不是直接返回函数
     ]
@@ -3412,37 +3199,14 @@ async def direct_check_lottery(update: Update, context: ContextTypes.DEFAULT_TYP
     # 发送一条临时消息
     temp_message = await message.reply_text("正在查询可参与的抽奖活动，请稍候...")
     
-    # 检查是否提供了抽奖ID参数
-    if not context.args:
-        # 如果没有提供ID参数，列出所有可参与的抽奖
-        @sync_to_async
-        def get_all_active_lotteries():
-            from .models import Lottery
-            from jifen.models import User, Group
-            
-            try:
-                # 直接获取所有活跃抽奖，不进行群组筛选
-                active_lotteries = Lottery.objects.filter(
-                    status='ACTIVE'
-                ).order_by('-created_at')
-                
-                logger.info(f"[Direct Check] 找到活跃抽奖数: {active_lotteries.count()}")
-                
-                result = []
-                for lottery in active_lotteries:
-                    result.append({
-                        'id': lottery.id,
-                        'title': lottery.title,
-                        'group_name': lottery.group.group_title or '未知群组',
-                        'points_required': lottery.points_required
-                    })
-                
-                return result
-            except Exception as e:
-                logger.error(f"[Direct Check] 获取抽奖列表时出错: {e}\n{traceback.format_exc()}")
-                return []
-            
-        lotteries = await get_all_active_lotteries()
+    # 检查是否提供了抽奖ID参数（/check_lottery mine 只列出自己所在群组的抽奖）
+    if not context.args or context.args[0].lower() == 'mine':
+        mine = bool(context.args)
+        try:
+            page = await get_active_lottery_page(None, NEXT, user.id if mine else None)
+        except Exception as e:
+            logger.error(f"[Direct Check] 获取抽奖列表时出错: {e}\n{traceback.format_exc()}")
+            page = None
         
         # 删除临时消息
         try:
@@ -3450,29 +3214,14 @@ async def direct_check_lottery(update: Update, context: ContextTypes.DEFAULT_TYP
         except:
             pass
         
-        if not lotteries:
-            await message.reply_text("目前没有可参与的抽奖活动。请返回群组查看最新抽奖。")
+        if page is None or not page.items:
+            if mine:
+                await message.reply_text("您所在的群组目前没有可参与的抽奖活动。可以使用 /check_lottery 查看全部抽奖。")
+            else:
+                await message.reply_text("目前没有可参与的抽奖活动。请返回群组查看最新抽奖。")
             return
         
-        text = "🎲 可参与的抽奖活动列表：\n\n"
-        buttons = []
-        
-        for lottery in lotteries:
-            text += f"ID: {lottery['id']} - {lottery['title']}\n"
-            text += f"群组: {lottery['group_name']}\n"
-            text += f"所需积分: {lottery['points_required']}\n\n"
-            
-            # 为每个抽奖添加一个查看按钮
-            buttons.append([InlineKeyboardButton(
-                f"查看 {lottery['title']} (ID:{lottery['id']})", 
-                callback_data=f"view_lottery_{lottery['id']}"
-            )])
-        
-        text += "请点击下方按钮查看抽奖详情，或者使用命令 /check_lottery ID 查看特定抽奖。"
-        
-        # 创建按钮键盘
-        keyboard = InlineKeyboardMarkup(buttons)
-        
+        text, keyboard = build_lottery_page_message(page, mine)
         await message.reply_text(text, reply_markup=keyboard)
         return
     
@@ -3495,6 +3244,87 @@ async def direct_check_lottery(update: Update, context: ContextTypes.DEFAULT_TYP
         logger.error(f"[Direct Check] 处理抽奖检查命令时出错: {e}\n{traceback.format_exc()}")
         await message.reply_text("处理您的请求时出错，请重试。")
 
+@db_sync_to_async
+def get_active_lottery_page(cursor, direction, telegram_id=None):
+    """获取一页进行中的抽奖"""
+    return list_active_lotteries(
+        cursor=cursor,
+        direction=direction,
+        page_size=getattr(settings, 'CHECK_LOTTERY_PAGE_SIZE', 10),
+        telegram_id=telegram_id,
+    )
+
+def build_lottery_page_message(page, mine):
+    """构建抽奖列表的一页：文本、每个抽奖的查看按钮、翻页和筛选按钮"""
+    scope = 'mine' if mine else 'all'
+    text = "🎲 您所在群组可参与的抽奖活动：\n\n" if mine else "🎲 可参与的抽奖活动列表：\n\n"
+    buttons = []
+    
+    for lottery in page.items:
+        text += f"ID: {lottery.id} - {lottery.title}\n"
+        text += f"群组: {lottery.group_name}\n"
+        text += f"所需积分: {lottery.points_required}\n\n"
+        
+        # 为每个抽奖添加一个查看按钮
+        buttons.append([InlineKeyboardButton(
+            f"查看 {lottery.title} (ID:{lottery.id})", 
+            callback_data=f"view_lottery_{lottery.id}"
+        )])
+    
+    text += "请点击下方按钮查看抽奖详情，或者使用命令 /check_lottery ID 查看特定抽奖。"
+    
+    # 翻页按钮，游标为当前页首/尾的抽奖ID
+    nav_row = []
+    if page.has_prev:
+        nav_row.append(InlineKeyboardButton("◀️ 上一页", callback_data=f"check_lottery_page_{scope}_{PREV}_{page.first_id}"))
+    if page.has_next:
+        nav_row.append(InlineKeyboardButton("下一页 ▶️", callback_data=f"check_lottery_page_{scope}_{NEXT}_{page.last_id}"))
+    if nav_row:
+        buttons.append(nav_row)
+    
+    # 切换是否只看自己所在群组
+    if mine:
+        buttons.append([InlineKeyboardButton("🌐 查看全部抽奖", callback_data="check_lottery_page_all_n_0")])
+    else:
+        buttons.append([InlineKeyboardButton("👥 只看我的群组", callback_data="check_lottery_page_mine_n_0")])
+    
+    return text, InlineKeyboardMarkup(buttons)
+
+async def check_lottery_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """处理 /check_lottery 列表的翻页和筛选按钮"""
+    query = update.callback_query
+    user = update.effective_user
+    
+    await query.answer()
+    
+    try:
+        # 回调数据格式: check_lottery_page_{all|mine}_{n|p}_{游标抽奖ID}，游标为 0 表示第一页
+        _, _, _, scope, direction, cursor = query.data.split("_")
+        mine = scope == 'mine'
+        cursor = int(cursor) or None
+        
+        page = await get_active_lottery_page(cursor, direction, user.id if mine else None)
+        if cursor is not None and not page.items:
+            # 游标附近的抽奖已结束，回到第一页
+            page = await get_active_lottery_page(None, NEXT, user.id if mine else None)
+        
+        if not page.items:
+            await query.edit_message_text(
+                "您所在的群组目前没有可参与的抽奖活动。" if mine else "目前没有可参与的抽奖活动。请返回群组查看最新抽奖。",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🌐 查看全部抽奖", callback_data="check_lottery_page_all_n_0")]]) if mine else None
+            )
+            return
+        
+        text, keyboard = build_lottery_page_message(page, mine)
+        await query.edit_message_text(text, reply_markup=keyboard)
+    except telegram.error.BadRequest as e:
+        # 内容未变化（重复点击）时忽略
+        if "not modified" not in str(e).lower():
+            logger.error(f"[Direct Check] 翻页时出错: {e}")
+    except Exception as e:
+        logger.error(f"[Direct Check] 处理抽奖列表翻页时出错: {e}\n{traceback.format_exc()}")
+        await query.message.reply_text("加载抽奖列表时出错，请重新输入 /check_lottery。")
+
 async def view_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """处理用户点击查看抽奖按钮的回调"""
     query = update.callback_query
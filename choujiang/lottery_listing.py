@@ -0,0 +1,88 @@
+"""
+进行中抽奖的分页列表
+
+/check_lottery 原来一次取出全部进行中的抽奖，逐条读取 lottery.group 产生 N+1 查询，并把所有抽奖放进一条消息。
+这里按主键倒序（即创建顺序）做游标分页：
+- 每页只查询一次：select_related('group') + only() 只取列表需要的字段，多取一条判断是否还有下一页
+- 游标为当前页首/尾的抽奖ID，翻页使用 id < 游标 / id > 游标，只读取一页而不是 OFFSET 跳过前面的行；
+  进行中的抽奖通过 (status, auto_draw, draw_time) 索引的 status 前缀定位（数量有限，排序代价很小），不再单独建索引
+- 可选只列出用户所在群组的抽奖：按 (telegram_id, group, is_active) 索引取出用户的群组，以子查询过滤
+"""
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .models import Lottery
+
+logger = logging.getLogger(__name__)
+
+# 翻页方向
+NEXT = 'n'
+PREV = 'p'
+
+
+@dataclass(frozen=True)
+class LotteryListItem:
+    id: int
+    title: str
+    group_name: str
+    points_required: int
+
+
+@dataclass(frozen=True)
+class LotteryPage:
+    items: List[LotteryListItem]
+    has_next: bool
+    has_prev: bool
+
+    @property
+    def first_id(self) -> Optional[int]:
+        return self.items[0].id if self.items else None
+
+    @property
+    def last_id(self) -> Optional[int]:
+        return self.items[-1].id if self.items else None
+
+
+def list_active_lotteries(cursor=None, direction=NEXT, page_size=10, telegram_id=None) -> LotteryPage:
+    """
+    获取一页进行中的抽奖（同步函数，需在线程中调用）
+
+    参数:
+    cursor: 游标抽奖ID，为空时返回第一页
+    direction: NEXT 返回 id < cursor 的一页，PREV 返回 id > cursor 的一页
+    telegram_id: 传入时只列出该用户所在（且活跃）群组的抽奖
+    """
+    from jifen.models import User
+
+    queryset = Lottery.objects.filter(status='ACTIVE')
+    if telegram_id is not None:
+        user_groups = User.objects.filter(telegram_id=telegram_id, is_active=True).values('group_id')
+        queryset = queryset.filter(group_id__in=user_groups)
+    queryset = queryset.select_related('group').only(
+        'id', 'title', 'points_required', 'group__group_title'
+    )
+
+    if cursor is not None and direction == PREV:
+        rows = list(queryset.filter(id__gt=cursor).order_by('id')[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_prev, has_next = has_more, True
+    else:
+        if cursor is not None:
+            queryset = queryset.filter(id__lt=cursor)
+        rows = list(queryset.order_by('-id')[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        has_prev, has_next = cursor is not None, has_more
+
+    items = [
+        LotteryListItem(
+            id=lottery.id,
+            title=lottery.title,
+            group_name=lottery.group.group_title or '未知群组',
+            points_required=lottery.points_required,
+        )
+        for lottery in rows
+    ]
+    return LotteryPage(items=items, has_next=has_next, has_prev=has_prev)
@@ -0,0 +1,101 @@
+"""
+开奖结果保存基准测试
+
+创建临时抽奖和中奖者，分别用逐条 participant.save() + lottery.save() 的旧写法
+和 save_draw_results 的批量写法保存开奖结果，对比数据库往返次数和耗时。
+
+用法:
+python manage.py bench_draw_save --winners 300
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from choujiang.lottery_drawer import save_draw_results
+from choujiang.models import Lottery, LotteryLog, Participant, Prize
+from jifen.models import Group, User
+
+
+class Command(BaseCommand):
+    help = '对比逐条保存和批量保存开奖结果的数据库往返次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--winners', type=int, default=300, help='中奖人数')
+        parser.add_argument('--prizes', type=int, default=3, help='奖品种类数')
+
+    def handle(self, *args, **options):
+        group = Group.objects.create(
+            group_id=-random.randint(10 ** 12, 10 ** 13),
+            group_title='开奖基准测试群组',
+            is_active=True
+        )
+        try:
+            for label, save in (('逐条保存', self._save_per_row), ('批量保存', self._save_bulk)):
+                lottery, winners = self._create_fixtures(group, options)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.monotonic()
+                    save(lottery, winners)
+                    elapsed = time.monotonic() - started
+
+                winner_count = Participant.objects.filter(lottery=lottery, is_winner=True).count()
+                status = Lottery.objects.filter(id=lottery.id).values_list('status', flat=True).first()
+                self.stdout.write(
+                    f"{label}: {len(queries.captured_queries)} 次数据库往返，耗时 {elapsed * 1000:.1f} 毫秒，"
+                    f"中奖 {winner_count} 人，状态 {status}"
+                )
+        finally:
+            # 删除群组会级联删除用户、抽奖、奖品和参与记录
+            group.delete()
+
+    def _create_fixtures(self, group, options):
+        users = [
+            User(telegram_id=2 * 10 ** 9 + index, username=f'bench_{index}', group=group)
+            for index in range(options['winners'])
+        ]
+        User.objects.bulk_create(users, ignore_conflicts=True)
+        users = list(User.objects.filter(group=group).order_by('id')[:options['winners']])
+
+        lottery = Lottery.objects.create(
+            title='开奖基准测试',
+            group=group,
+            creator=users[0],
+            status='DRAWING',
+            signup_deadline=datetime.now() + timedelta(days=1),
+            draw_time=datetime.now() + timedelta(days=1),
+            auto_draw=False
+        )
+        prizes = [
+            Prize.objects.create(lottery=lottery, name=f'奖品{index}', description='基准测试奖品', quantity=options['winners'], order=index)
+            for index in range(options['prizes'])
+        ]
+        Participant.objects.bulk_create([Participant(lottery=lottery, user=user, joined_at=datetime.now()) for user in users])
+        participants = list(Participant.objects.filter(lottery=lottery).order_by('id'))
+        winners = [
+            {'participant': participant, 'prize': prizes[index % len(prizes)]}
+            for index, participant in enumerate(participants)
+        ]
+        return lottery, winners
+
+    def _save_per_row(self, lottery, winners):
+        """改造前的写法：每个中奖者一次整行 UPDATE，再整行保存抽奖"""
+        with transaction.atomic():
+            for winner_info in winners:
+                participant = winner_info['participant']
+                participant.is_winner = True
+                participant.prize = winner_info['prize']
+                participant.save()
+            lottery.status = 'ENDED'
+            lottery.save()
+            LotteryLog.objects.create(
+                lottery=lottery,
+                user=lottery.creator,
+                action='DRAW',
+                details=f"开奖完成：{len(winners)}人中奖"
+            )
+
+    def _save_bulk(self, lottery, winners):
+        save_draw_results(lottery, winners, f"开奖完成：{len(winners)}人中奖")
@@ -0,0 +1,331 @@
+"""
+群组消息处理离线回放基准测试
+
+创建临时群组、积分规则和用户，按配置的比例生成普通发言、签到、"积分"查询、
+"排行榜"查询和"邀请链接"请求的 telegram.Update，逐条交给真实的
+combined_group_message_handler 处理。Bot API 请求由本地桩返回固定响应，
+不访问 Telegram；数据库使用当前 settings 中配置的数据库（SQLite 或 MySQL）。
+
+输出每秒处理的更新数、延迟分位数和每条更新的数据库查询数，
+并保存为 JSON，便于不同版本之间对比。
+
+用法:
+python manage.py bench_group_messages --updates 2000 --users 200
+python manage.py bench_group_messages --mix chat=0.9,checkin=0.05,points=0.05 --output bench.json
+"""
+import asyncio
+import datetime
+import json
+import platform
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+import django
+import telegram
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from telegram import Bot, Update
+from telegram.ext import ApplicationBuilder, CallbackContext
+from telegram.request import BaseRequest
+
+from jifen.message_ledger import message_ledger, start_message_ledger
+from jifen.models import Group, PointRule, User
+
+# 默认的消息类型比例
+DEFAULT_MIX = 'chat=0.83,checkin=0.08,points=0.05,rank=0.02,invite=0.02'
+BOT_USER = {'id': 7000000001, 'is_bot': True, 'first_name': 'ReplayBot', 'username': 'replay_bot'}
+
+
+class ReplayRequest(BaseRequest):
+    """Bot API 请求桩：不发起网络请求，按方法名返回固定响应并统计调用次数"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _result(self, method, parameters):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getChat':
+            return {'id': parameters.get('chat_id'), 'type': 'supergroup', 'title': '回放基准测试群组'}
+        if method in ('createChatInviteLink', 'exportChatInviteLink'):
+            link = f"https://t.me/+replay{random.randint(10 ** 8, 10 ** 9)}"
+            if method == 'exportChatInviteLink':
+                return link
+            return {
+                'invite_link': link, 'creator': BOT_USER, 'creates_join_request': False,
+                'is_primary': False, 'is_revoked': False
+            }
+        if method in ('sendMessage', 'editMessageText'):
+            self._message_id += 1
+            return {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': parameters.get('chat_id'), 'type': 'supergroup'},
+                'text': parameters.get('text', '')
+            }
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        parameters = request_data.parameters if request_data else {}
+        payload = {'ok': True, 'result': self._result(api_method, parameters)}
+        return 200, json.dumps(payload).encode('utf-8')
+
+
+class QueryCounter:
+    """统计所有线程中的数据库查询次数（sync_to_async 的查询在其他线程的连接上执行）"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        """安装到指定连接；未指定时安装到当前线程的所有连接"""
+        for conn in [connection] if connection is not None else connections.all():
+            if self not in conn.execute_wrappers:
+                conn.execute_wrappers.append(self)
+
+    def uninstall(self):
+        for conn in connections.all():
+            if self in conn.execute_wrappers:
+                conn.execute_wrappers.remove(self)
+
+
+def parse_mix(value):
+    """解析 "chat=0.8,checkin=0.1" 形式的比例配置"""
+    mix = {}
+    try:
+        for part in value.split(','):
+            kind, weight = part.split('=')
+            mix[kind.strip()] = float(weight)
+    except ValueError:
+        raise CommandError(f"无法解析消息比例: {value}")
+    unknown = set(mix) - {'chat', 'checkin', 'points', 'rank', 'invite'}
+    if unknown:
+        raise CommandError(f"未知的消息类型: {', '.join(sorted(unknown))}")
+    if sum(mix.values()) <= 0:
+        raise CommandError("消息比例之和必须大于0")
+    return mix
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(latencies, queries):
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'max_ms': round(max(latencies), 3) if latencies else 0.0,
+        'queries_per_update': round(sum(queries) / len(queries), 3) if queries else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = '离线回放合成的群组消息，测量群组消息处理的吞吐量、延迟和数据库查询数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--updates', type=int, default=2000, help='回放的更新数')
+        parser.add_argument('--users', type=int, default=200, help='发言用户数')
+        parser.add_argument('--warmup', type=int, default=50, help='预热更新数（不计入结果）')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='消息类型比例，可选 chat/checkin/points/rank/invite')
+        parser.add_argument('--seed', type=int, default=42, help='随机种子')
+        parser.add_argument('--output', help='JSON 结果保存路径')
+        parser.add_argument('--keep', action='store_true', help='测试结束后保留测试数据')
+
+    def handle(self, *args, **options):
+        # 延迟导入，避免 manage.py 加载命令列表时导入整个机器人模块
+        from telegram_bot import combined_group_message_handler
+
+        mix = parse_mix(options['mix'])
+        rng = random.Random(options['seed'])
+        group, rule, users = self._create_fixtures(options)
+
+        # 新建的连接通过信号安装计数器，已存在的连接直接安装
+        counter = QueryCounter()
+        connection_created.connect(counter.install, weak=False)
+        counter.install()
+        try:
+            plan = self._build_plan(rng, mix, group, rule, users, options['warmup'] + options['updates'])
+            result = asyncio.run(self._replay(combined_group_message_handler, plan, options['warmup'], counter))
+
+            # 写后缓冲中剩余的发言积分落库，查询数单独统计
+            pending = message_ledger.pending_count()
+            before_flush = counter.count
+            message_ledger.shutdown()
+            result['ledger_flush'] = {'events': pending, 'queries': counter.count - before_flush}
+        finally:
+            connection_created.disconnect(counter.install)
+            counter.uninstall()
+            if not options['keep']:
+                # 删除群组会级联删除积分规则、用户和积分记录
+                group.delete()
+
+        result['config'] = {
+            'updates': options['updates'],
+            'warmup': options['warmup'],
+            'users': options['users'],
+            'mix': mix,
+            'seed': options['seed'],
+            'message_points_write_behind': getattr(settings, 'MESSAGE_POINTS_WRITE_BEHIND', False),
+        }
+        result['environment'] = {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'python_telegram_bot': telegram.__version__,
+        }
+
+        self._report(result)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"结果已保存到 {options['output']}"))
+
+    def _create_fixtures(self, options):
+        group = Group.objects.create(
+            group_id=-random.randint(10 ** 12, 10 ** 13),
+            group_title='回放基准测试群组',
+            is_active=True
+        )
+        rule = PointRule.objects.create(group=group, points_enabled=True, message_daily_limit=100)
+        User.objects.bulk_create([
+            User(
+                telegram_id=2 * 10 ** 9 + index,
+                username=f'replay_{index}',
+                first_name=f'回放用户{index}',
+                group=group,
+                points=0
+            )
+            for index in range(options['users'])
+        ])
+        users = list(User.objects.filter(group=group).values_list('telegram_id', 'username', 'first_name'))
+        return group, rule, users
+
+    def _build_plan(self, rng, mix, group, rule, users, total):
+        """预先生成所有更新的原始数据，回放时只计入处理耗时"""
+        kinds = list(mix)
+        weights = [mix[kind] for kind in kinds]
+        texts = {
+            'checkin': rule.checkin_keyword,
+            'points': '积分',
+            'rank': '排行榜',
+            'invite': '邀请链接',
+        }
+        plan = []
+        now = int(time.time())
+        # message_points.message_id 全局唯一，从随机起点编号避免与已有数据冲突
+        first_message_id = random.randint(10 ** 9, 2 * 10 ** 9)
+        for index in range(total):
+            kind = rng.choices(kinds, weights)[0]
+            telegram_id, username, first_name = rng.choice(users)
+            text = texts.get(kind) or ''.join(
+                rng.choice('今天天气不错大家好我们一起来聊天吧抽奖活动什么时候开始') for _ in range(rng.randint(3, 40))
+            )
+            plan.append((kind, {
+                'update_id': index + 1,
+                'message': {
+                    'message_id': first_message_id + index,
+                    'date': now,
+                    'chat': {'id': group.group_id, 'type': 'supergroup', 'title': group.group_title},
+                    'from': {'id': telegram_id, 'is_bot': False, 'first_name': first_name, 'username': username},
+                    'text': text,
+                },
+            }))
+        return plan
+
+    async def _replay(self, handler, plan, warmup, counter):
+        request = ReplayRequest()
+        bot = Bot('7000000001:REPLAY', request=request, get_updates_request=ReplayRequest())
+        application = ApplicationBuilder().bot(bot).build()
+        await application.initialize()
+        # 与 run_bot 一致：开关打开时启动发言积分写后缓冲，后台刷新的查询计入当时正在处理的更新
+        await start_message_ledger()
+        # sync_to_async 的工作线程可能已经建立过数据库连接，需要在该线程中安装计数器
+        await sync_to_async(counter.install)()
+
+        latencies = defaultdict(list)
+        queries = defaultdict(list)
+        errors = 0
+        started = None
+        try:
+            for index, (kind, data) in enumerate(plan):
+                if index == warmup:
+                    request.calls.clear()
+                    started = time.perf_counter()
+                update = Update.de_json(data, bot)
+                context = CallbackContext.from_update(update, application)
+                queries_before = counter.count
+                update_started = time.perf_counter()
+                try:
+                    await handler(update, context)
+                except Exception:
+                    errors += 1
+                if index >= warmup:
+                    latencies[kind].append((time.perf_counter() - update_started) * 1000)
+                    queries[kind].append(counter.count - queries_before)
+            elapsed = time.perf_counter() - started if started is not None else 0.0
+        finally:
+            await sync_to_async(counter.uninstall)()
+            # 取消处理器创建的延迟删除消息等后台任务
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await application.shutdown()
+
+        all_latencies = [value for values in latencies.values() for value in values]
+        all_queries = [value for values in queries.values() for value in values]
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'updates_per_second': round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+            'errors': errors,
+            'overall': summarize(all_latencies, all_queries),
+            'by_kind': {kind: summarize(latencies[kind], queries[kind]) for kind in sorted(latencies)},
+            'bot_api_calls': dict(request.calls),
+        }
+
+    def _report(self, result):
+        overall = result['overall']
+        self.stdout.write(
+            f"共回放 {overall['count']} 条更新，耗时 {result['elapsed_seconds']:.2f} 秒，"
+            f"{result['updates_per_second']:.1f} 条/秒，处理出错 {result['errors']} 条"
+        )
+        self.stdout.write(
+            f"延迟: p50={overall['p50_ms']:.2f}ms p95={overall['p95_ms']:.2f}ms "
+            f"p99={overall['p99_ms']:.2f}ms max={overall['max_ms']:.2f}ms，"
+            f"每条更新 {overall['queries_per_update']:.2f} 次查询"
+        )
+        for kind, stats in result['by_kind'].items():
+            self.stdout.write(
+                f"  {kind:8} {stats['count']:6} 条  p50={stats['p50_ms']:.2f}ms "
+                f"p99={stats['p99_ms']:.2f}ms  查询/条={stats['queries_per_update']:.2f}"
+            )
+        flush = result['ledger_flush']
+        self.stdout.write(f"写后缓冲落库: {flush['events']} 条发言，{flush['queries']} 次查询")
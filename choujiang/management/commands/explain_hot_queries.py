@@ -0,0 +1,104 @@
+"""
+热点查询执行计划检查
+
+对积分查询、自动开奖、开奖加载参与者、成员查询等高频查询执行 EXPLAIN，
+任何一条退化为全表扫描时命令以非零状态退出，可在上线前或迁移后对生产规模的数据执行。
+同样的检查由 choujiang/tests.py 中的 HotQueryPlanTests 在 manage.py test 中执行。
+
+支持 MySQL、SQLite 和 PostgreSQL。数据量很小时数据库可能主动选择全表扫描，
+请在接近生产规模的数据上运行。
+
+用法:
+python manage.py explain_hot_queries
+python manage.py explain_hot_queries --verbose
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from choujiang.models import Lottery, Participant
+from jifen.models import User
+from jifen.points_query import daily_points_summary_queryset
+
+
+def hot_querysets():
+    """返回 (名称, 查询集) 列表，查询条件与业务代码中的查询一致"""
+    today = datetime.date.today()
+    now = timezone.now()
+    return [
+        ('积分查询: 总积分和今日各类积分', daily_points_summary_queryset(1, 1, today)),
+        ('自动开奖: 到期的抽奖', Lottery.objects.filter(
+            status='ACTIVE', auto_draw=True, draw_time__lte=now
+        )),
+        ('开奖调度: 加载开奖计划', Lottery.objects.filter(
+            status='ACTIVE', auto_draw=True, draw_time__isnull=False
+        ).values_list('id', 'draw_time')),
+        ('开奖: 加载未中奖参与者', Participant.objects.filter(
+            lottery_id=1, is_winner=False
+        ).select_related('user')),
+        ('成员缓存: 按用户和群组查询', User.objects.filter(
+            telegram_id=1, group_id=1
+        ).values('id', 'is_active', 'is_admin')),
+        ('参与抽奖: 活跃成员查询', User.objects.filter(
+            telegram_id=1, group_id=1, is_active=True
+        ).values('id')),
+    ]
+
+
+def explain(queryset):
+    """
+    执行 EXPLAIN，返回 (执行计划行列表, 全表扫描的表名列表)
+    """
+    sql, params = queryset.query.sql_with_params()
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            rows = [row[-1] for row in cursor.fetchall()]
+            # SQLite: "SCAN 表名" 且未使用索引即为全表扫描
+            full_scans = [
+                row.split()[1] for row in rows
+                if row.startswith('SCAN') and 'INDEX' not in row
+            ]
+        elif vendor == 'postgresql':
+            cursor.execute(f"EXPLAIN {sql}", params)
+            rows = [row[0] for row in cursor.fetchall()]
+            full_scans = [row.split(' on ')[1].split()[0] for row in rows if 'Seq Scan on ' in row]
+        else:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            columns = [column[0].lower() for column in cursor.description]
+            plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            rows = [
+                f"table={item.get('table')} type={item.get('type')} key={item.get('key')} "
+                f"rows={item.get('rows')} extra={item.get('extra')}"
+                for item in plan
+            ]
+            # MySQL: type=ALL 表示全表扫描
+            full_scans = [item.get('table') for item in plan if item.get('type') == 'ALL']
+    return rows, full_scans
+
+
+class Command(BaseCommand):
+    help = '对热点查询执行 EXPLAIN，出现全表扫描时失败'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose', action='store_true', help='输出完整执行计划')
+
+    def handle(self, *args, **options):
+        failures = []
+        for name, queryset in hot_querysets():
+            rows, full_scans = explain(queryset)
+            if full_scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"✗ {name}: 全表扫描 {', '.join(full_scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✓ {name}"))
+            if options['verbose'] or full_scans:
+                for row in rows:
+                    self.stdout.write(f"    {row}")
+
+        if failures:
+            raise CommandError(f"{len(failures)} 条热点查询退化为全表扫描: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("所有热点查询均使用索引"))
@@ -0,0 +1,92 @@
+"""
+向 webhook 回放录制的更新
+
+读取录制的 Telegram 更新（JSON 数组，或每行一个 JSON 的 JSONL 文件），
+带上 secret token 逐条或并发 POST 到 webhook 地址，统计各状态码数量和请求耗时，
+用于在本地验证 webhook 模式、secret 校验和队列满时的 503 背压。
+
+用法:
+python manage.py post_webhook_updates updates.jsonl --url http://127.0.0.1:8000/telegram/webhook/
+python manage.py post_webhook_updates updates.json --concurrency 20 --repeat 10
+"""
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def load_updates(path):
+    """读取 JSON 数组或 JSONL 文件中的更新"""
+    with open(path, encoding='utf-8') as f:
+        content = f.read().strip()
+    if not content:
+        return []
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+class Command(BaseCommand):
+    help = '把录制的 Telegram 更新 POST 到 webhook 地址，统计响应状态和耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='录制的更新文件（JSON 数组或 JSONL）')
+        parser.add_argument('--url', default='http://127.0.0.1:8000/telegram/webhook/', help='webhook 地址')
+        parser.add_argument('--secret', default=None, help='secret token，默认使用 BOT_WEBHOOK_SECRET')
+        parser.add_argument('--concurrency', type=int, default=1, help='并发请求数')
+        parser.add_argument('--repeat', type=int, default=1, help='重复发送的轮数（每轮重新编号 update_id）')
+
+    def handle(self, *args, **options):
+        try:
+            updates = load_updates(options['file'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"读取更新文件失败: {e}")
+        if not updates:
+            raise CommandError("更新文件为空")
+
+        secret = options['secret'] if options['secret'] is not None else getattr(settings, 'BOT_WEBHOOK_SECRET', '')
+        payloads = []
+        next_id = 1
+        for _ in range(options['repeat']):
+            for update in updates:
+                payloads.append(dict(update, update_id=next_id))
+                next_id += 1
+
+        def post(payload):
+            request = urllib.request.Request(
+                options['url'],
+                data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret},
+                method='POST'
+            )
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except urllib.error.URLError as e:
+                status = f"error: {e.reason}"
+            return status, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as executor:
+            results = list(executor.map(post, payloads))
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(status for status, _ in results)
+        latencies = sorted(latency for _, latency in results)
+        self.stdout.write(
+            f"共发送 {len(results)} 条更新，耗时 {elapsed:.2f} 秒，{len(results) / elapsed:.1f} 条/秒"
+        )
+        self.stdout.write(
+            f"延迟: p50={latencies[len(latencies) // 2]:.2f}ms "
+            f"p99={latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:.2f}ms"
+        )
+        for status, count in sorted(statuses.items(), key=lambda item: str(item[0])):
+            self.stdout.write(f"  {status}: {count}")
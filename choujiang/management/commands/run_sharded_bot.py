@@ -0,0 +1,48 @@
+"""
+多进程分片运行机器人
+
+调度进程轮询 Telegram 更新，按聊天ID分发到多个工作进程，同一聊天的更新总在同一进程中按顺序处理；
+工作进程退出或心跳超时会被自动重启。只支持轮询模式，不能与 BOT_UPDATE_MODE = 'webhook' 同时使用。
+
+用法:
+python manage.py run_sharded_bot
+python manage.py run_sharded_bot --workers 8
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from telegram_lottery_bot.sharding import ShardDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '以多进程分片方式运行机器人（按聊天ID分发更新）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'SHARD_WORKERS', 4), help='工作进程数')
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'BOT_UPDATE_MODE', 'polling') == 'webhook':
+            raise CommandError("分片模式只支持轮询，请将 BOT_UPDATE_MODE 设置为 'polling'")
+        if options['workers'] < 1:
+            raise CommandError("--workers 至少为 1")
+
+        from telegram_bot import TOKEN
+
+        dispatcher = ShardDispatcher(
+            token=TOKEN,
+            workers=options['workers'],
+            queue_size=getattr(settings, 'SHARD_QUEUE_SIZE', 1000),
+            heartbeat_timeout=getattr(settings, 'SHARD_HEARTBEAT_TIMEOUT', 30),
+            startup_grace=getattr(settings, 'SHARD_STARTUP_GRACE', 120),
+        )
+        try:
+            asyncio.run(dispatcher.run())
+        except KeyboardInterrupt:
+            logger.info("分片机器人已通过键盘中断停止运行")
+        finally:
+            dispatcher.stop()
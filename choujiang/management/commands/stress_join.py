@@ -0,0 +1,125 @@
+"""
+抽奖参与并发压测
+
+创建临时群组、用户和抽奖，用 asyncio 并发模拟大量用户重复点击参与，
+然后校验每个用户最多参与一次、积分只扣除一次、积分变动记录与参与记录一致。
+
+用法:
+python manage.py stress_join --users 200 --attempts 5 --points-required 10
+"""
+import asyncio
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from choujiang.join_engine import join_lottery_atomic
+from choujiang.models import Lottery, Participant
+from jifen.models import Group, PointTransaction, User
+
+
+class Command(BaseCommand):
+    help = '并发压测抽奖参与流程，校验不会重复扣分或重复参与'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='参与用户数')
+        parser.add_argument('--attempts', type=int, default=5, help='每个用户并发点击次数')
+        parser.add_argument('--points-required', type=int, default=10, help='参与所需积分')
+        parser.add_argument('--initial-points', type=int, default=15, help='每个用户的初始积分')
+        parser.add_argument('--poor-ratio', type=float, default=0.2, help='积分不足用户的比例')
+        parser.add_argument('--keep', action='store_true', help='压测结束后保留测试数据')
+
+    def handle(self, *args, **options):
+        group, users, lottery = self._create_fixtures(options)
+        try:
+            started = time.monotonic()
+            outcomes = asyncio.run(self._swarm(lottery.id, users, options['attempts']))
+            elapsed = time.monotonic() - started
+
+            total = sum(outcomes.values())
+            self.stdout.write(f"共 {total} 次参与请求，耗时 {elapsed:.2f} 秒，{total / elapsed:.1f} 次/秒")
+            for code, count in sorted(outcomes.items()):
+                self.stdout.write(f"  {code}: {count}")
+
+            errors = self._verify(lottery, users, options)
+            if errors:
+                for error in errors:
+                    self.stderr.write(self.style.ERROR(error))
+                raise CommandError(f"校验失败，共 {len(errors)} 个问题")
+            self.stdout.write(self.style.SUCCESS("校验通过：无重复参与，无重复扣分"))
+        finally:
+            if not options['keep']:
+                # 删除群组会级联删除用户、抽奖、参与记录和积分变动记录
+                group.delete()
+
+    def _create_fixtures(self, options):
+        group = Group.objects.create(
+            group_id=-random.randint(10 ** 12, 10 ** 13),
+            group_title='压测群组',
+            is_active=True
+        )
+        poor_count = int(options['users'] * options['poor_ratio'])
+        users = []
+        for index in range(options['users']):
+            points = options['initial_points'] if index >= poor_count else max(0, options['points_required'] - 1)
+            users.append(User(
+                telegram_id=10 ** 9 + index,
+                username=f'stress_{index}',
+                group=group,
+                points=points
+            ))
+        User.objects.bulk_create(users)
+        users = list(User.objects.filter(group=group))
+
+        lottery = Lottery.objects.create(
+            title='压测抽奖',
+            group=group,
+            creator=users[0],
+            status='ACTIVE',
+            signup_deadline=datetime.now() + timedelta(days=1),
+            draw_time=datetime.now() + timedelta(days=1),
+            auto_draw=False,
+            points_required=options['points_required']
+        )
+        return group, users, lottery
+
+    async def _swarm(self, lottery_id, users, attempts):
+        @sync_to_async(thread_sensitive=False)
+        def join(telegram_id):
+            try:
+                return join_lottery_atomic(lottery_id, telegram_id).code
+            finally:
+                close_old_connections()
+
+        tasks = [join(user.telegram_id) for user in users for _ in range(attempts)]
+        random.shuffle(tasks)
+        results = await asyncio.gather(*tasks)
+        return Counter(results)
+
+    def _verify(self, lottery, users, options):
+        errors = []
+        cost = options['points_required']
+        joined = set(Participant.objects.filter(lottery=lottery).values_list('user_id', flat=True))
+        charges = Counter(
+            PointTransaction.objects.filter(
+                group=lottery.group, type='RAFFLE_PARTICIPATION'
+            ).values_list('user_id', flat=True)
+        )
+        balances = dict(User.objects.filter(group=lottery.group).values_list('id', 'points'))
+
+        for user in users:
+            if user.points >= cost and user.id not in joined:
+                errors.append(f"用户 {user.telegram_id} 积分足够但未能参与")
+            if user.points < cost and user.id in joined:
+                errors.append(f"用户 {user.telegram_id} 积分不足却参与成功")
+            expected_charges = 1 if user.id in joined and cost > 0 else 0
+            if charges.get(user.id, 0) != expected_charges:
+                errors.append(f"用户 {user.telegram_id} 积分变动记录 {charges.get(user.id, 0)} 条，应为 {expected_charges} 条")
+            expected_points = user.points - (cost if user.id in joined else 0)
+            if balances[user.id] != expected_points:
+                errors.append(f"用户 {user.telegram_id} 积分为 {balances[user.id]}，应为 {expected_points}")
+        return errors
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-18 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('choujiang', '0006_auto_20250503_0928'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lottery',
+            name='status',
+            field=models.CharField(choices=[('DRAFT', '草稿'), ('ACTIVE', '进行中'), ('DRAWING', '开奖中'), ('PAUSED', '已暂停'), ('ENDED', '已结束'), ('CANCELLED', '已取消')], default='DRAFT', max_length=20, verbose_name='状态'),
+        ),
+    ]
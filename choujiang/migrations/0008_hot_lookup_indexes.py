@@ -0,0 +1,21 @@
+# Generated by Django 3.2.24 on 2026-10-18 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('choujiang', '0007_lottery_drawing_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lottery',
+            index=models.Index(fields=['status', 'auto_draw', 'draw_time'], name='choujiang_l_status_d2149b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['lottery', 'is_winner'], name='choujiang_p_lottery_66bf5f_idx'),
+        ),
+    ]
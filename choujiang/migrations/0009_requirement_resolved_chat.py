@@ -0,0 +1,28 @@
+# Generated by Django 3.2.24 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('choujiang', '0008_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lotteryrequirement',
+            name='bot_is_admin',
+            field=models.BooleanField(blank=True, null=True, verbose_name='机器人是否为管理员'),
+        ),
+        migrations.AddField(
+            model_name='lotteryrequirement',
+            name='chat_type',
+            field=models.CharField(blank=True, max_length=20, null=True, verbose_name='聊天类型'),
+        ),
+        migrations.AddField(
+            model_name='lotteryrequirement',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最近解析时间'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.24 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('choujiang', '0009_requirement_resolved_chat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lottery',
+            index=models.Index(fields=['group', 'created_at', 'id'], name='choujiang_l_group_i_fd58f2_idx'),
+        ),
+    ]
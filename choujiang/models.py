@@ -4,6 +4,9 @@ from datetime import datetime, timedelta, timezone as dt_timezone
 from telegram import Bot
 import telegram
 from django.utils.timezone import make_aware, make_naive, is_aware
+import logging
+
+logger = logging.getLogger(__name__)
 
 class LotteryType(models.Model):
     """抽奖类型"""
@@ -31,6 +34,7 @@ class Lottery(models.Model):
         choices=[
             ('DRAFT', '草稿'),
             ('ACTIVE', '进行中'),
+            ('DRAWING', '开奖中'),
             ('PAUSED', '已暂停'),
             ('ENDED', '已结束'),
             ('CANCELLED', '已取消')
@@ -101,6 +105,13 @@ class Lottery(models.Model):
         verbose_name = "抽奖活动"
         verbose_name_plural = "抽奖活动"
         ordering = ['-created_at']
+        indexes = [
+            # 开奖调度查询 status=ACTIVE, auto_draw=True, draw_time<=now；
+            # /check_lottery 列出 status=ACTIVE 的抽奖也使用该索引的 status 前缀
+            models.Index(fields=['status', 'auto_draw', 'draw_time']),
+            # 群组抽奖列表按 (created_at, id) 游标分页
+            models.Index(fields=['group', 'created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.get_status_display()})"
@@ -129,7 +140,8 @@ class Lottery(models.Model):
         elif deadline:
             deadline = deadline.astimezone(beijing_tz)
             
-        return self.is_active and now < deadline
+        # 没有设置报名截止时间时一直可以参与
+        return self.is_active and (deadline is None or now < deadline)
     
     @property
     def should_draw(self):
@@ -167,6 +179,11 @@ class LotteryRequirement(models.Model):
     # 保留chat_identifier字段用于输入
     chat_identifier = models.CharField(max_length=255, blank=True, null=True, verbose_name="聊天标识符")
     
+    # 创建时通过 Bot API 解析的聊天信息，chat_type 为空表示尚未解析（由后台任务重试）
+    chat_type = models.CharField(max_length=20, blank=True, null=True, verbose_name="聊天类型")
+    bot_is_admin = models.BooleanField(blank=True, null=True, verbose_name="机器人是否为管理员")
+    resolved_at = models.DateTimeField(blank=True, null=True, verbose_name="最近解析时间")
+    
     def save(self, *args, **kwargs):
         """保存方法，不再尝试调用Telegram API"""
         print(f"LotteryRequirement.save() 被调用，chat_identifier={self.chat_identifier}")
@@ -176,13 +193,31 @@ class LotteryRequirement(models.Model):
         super().save(*args, **kwargs)
         print(f"保存完成，requirement_type={self.requirement_type}")
 
-    async def set_chat_link_async(self, link):
+    def member_chat_id(self):
+        """检查成员时使用的聊天标识：已解析时为数字ID，未解析的旧数据使用 @用户名"""
+        if self.requirement_type == 'CHANNEL':
+            chat_id, username = self.channel_id, self.channel_username
+        else:
+            chat_id, username = self.group_id, self.group_username
+        if chat_id:
+            return chat_id
+        if username:
+            return f"@{username.lstrip('@')}"
+        return None
+
+    def apply_resolved_chat(self, resolved):
+        """把解析结果写入字段（不保存）"""
+        for field, value in resolved_chat_fields(resolved, self.channel_username or self.group_username).items():
+            setattr(self, field, value)
+
+    async def set_chat_link_async(self, link, bot=None):
         """
         异步方法：设置聊天链接并自动判断类型
         
         参数:
         link: 频道或群组链接
-        
+        bot: 传入时通过 Bot API 解析聊天的数字ID、类型和机器人管理员状态
+
         返回:
         (bool, str): (是否成功设置, 错误信息)
         """
@@ -216,10 +251,17 @@ class LotteryRequirement(models.Model):
         # 默认设置为群组类型
         self.requirement_type = 'GROUP'
         self.group_username = identifier
-        self.group_id = 0  # 暂时设置为0
+        self.group_id = None  # 未解析，检查时使用用户名
         self.channel_id = None
         self.channel_username = None
         
+        if bot is not None:
+            from .requirement_checker import normalize_chat_ref, resolve_chat
+            try:
+                self.apply_resolved_chat(await resolve_chat(bot, normalize_chat_ref(identifier)))
+            except telegram.error.TelegramError as e:
+                logger.warning(f"解析聊天 {identifier} 失败，稍后由后台任务重试: {e}")
+        
         # 使用异步方式保存
         from asgiref.sync import sync_to_async
         await sync_to_async(self.save)()
@@ -283,6 +325,27 @@ class LotteryRequirement(models.Model):
         else:
             return "无条件参与"
 
+def resolved_chat_fields(resolved, fallback_username=None):
+    """
+    根据解析结果生成 LotteryRequirement 的字段值
+
+    频道写入 channel_id/channel_username，群组写入 group_id/group_username；
+    聊天没有公开用户名时保留原来输入的用户名用于显示
+    """
+    username = resolved.username or (fallback_username.lstrip('@') if fallback_username else None)
+    fields = {
+        'chat_type': resolved.chat_type,
+        'bot_is_admin': resolved.bot_is_admin,
+        'resolved_at': timezone.now(),
+    }
+    if resolved.chat_type == 'channel':
+        fields.update(requirement_type='CHANNEL', channel_id=resolved.chat_id, channel_username=username,
+                      group_id=None, group_username=None)
+    else:
+        fields.update(requirement_type='GROUP', group_id=resolved.chat_id, group_username=username,
+                      channel_id=None, channel_username=None)
+    return fields
+
 class Prize(models.Model):
     """奖品"""
     lottery = models.ForeignKey(Lottery, on_delete=models.CASCADE, related_name="prizes", verbose_name="所属抽奖")
@@ -319,6 +382,10 @@ class Participant(models.Model):
         verbose_name = "参与者"
         verbose_name_plural = "参与者"
         unique_together = ['lottery', 'user']  # 一个用户只能参与一次同一个抽奖
+        indexes = [
+            # 开奖时加载未中奖的参与者
+            models.Index(fields=['lottery', 'is_winner']),
+        ]
     
     def __str__(self):
         return f"{self.user} - {self.lottery}"
@@ -0,0 +1,237 @@
+"""
+抽奖消息渲染缓存
+
+抽奖详情、群组公告和参与条件检测每次都要重新查询奖品、参与条件并拼接相同的文本和按钮，
+热门抽奖每分钟会被点击成千上万次"查看"。这里按 (抽奖ID, 消息类型) 缓存渲染结果：
+- 缓存条目记录抽奖的版本 (updated_at, status)，读取时版本不一致即视为失效
+- 奖品和参与条件的增删改由 choujiang.signals 更新所属抽奖的 updated_at，
+  因此其他进程（分片工作进程）也能通过版本号发现变化
+- 同一条目同时未命中时只渲染一次，其他请求等待同一个结果
+- 条目最多保留 RENDER_CACHE_TTL 秒，缓存大小受 RENDER_CACHE_SIZE 限制（LRU 淘汰）
+
+缓存的是与用户无关的内容，随时间变化的部分（如报名剩余时间）和按用户区分的按钮仍在每次请求时生成。
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from jifen.db_executor import db_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RenderedMessage:
+    """渲染好的消息：文本、解析模式和按钮（InlineKeyboardMarkup 不可变，可以在请求之间共享）"""
+    text: str
+    parse_mode: Optional[str] = None
+    keyboard: Optional[InlineKeyboardMarkup] = None
+
+
+def lottery_version(lottery) -> Tuple:
+    """抽奖的版本号，内容或状态变化后 updated_at 都会更新"""
+    return (lottery.updated_at, lottery.status)
+
+
+class LotteryRenderCache:
+    """(抽奖ID, 消息类型) -> 渲染结果 的缓存，线程安全"""
+
+    def __init__(self, max_size=2000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Tuple[int, str], Tuple[Tuple, float, Any]]' = OrderedDict()
+        self._inflight: Dict[Tuple[int, str, Tuple], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, lottery, kind: str):
+        key = (lottery.id, kind)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == lottery_version(lottery) and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, lottery, kind: str, value) -> None:
+        key = (lottery.id, kind)
+        with self._lock:
+            self._entries[key] = (lottery_version(lottery), time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, lottery_id: int) -> None:
+        """清除某个抽奖的全部渲染结果"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == lottery_id]:
+                del self._entries[key]
+
+    async def get_or_render(self, lottery, kind: str, render):
+        """
+        返回缓存的渲染结果，未命中时调用 render()（异步函数）渲染并缓存
+
+        render 返回 None 时不缓存
+        """
+        value = self.get(lottery, kind)
+        if value is not None:
+            return value
+
+        flight_key = (lottery.id, kind, lottery_version(lottery))
+        future = self._inflight.get(flight_key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight_key] = future
+        try:
+            value = await render()
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他请求等待时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            if value is not None:
+                self.put(lottery, kind, value)
+            return value
+        finally:
+            self._inflight.pop(flight_key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+
+lottery_render_cache = LotteryRenderCache(
+    max_size=getattr(settings, 'RENDER_CACHE_SIZE', 2000),
+    ttl=getattr(settings, 'RENDER_CACHE_TTL', 300),
+)
+
+
+@db_sync_to_async
+def _load_prizes_and_requirements(lottery_id):
+    from .models import LotteryRequirement, Prize
+    prizes = list(Prize.objects.filter(lottery_id=lottery_id).order_by('order'))
+    requirements = list(LotteryRequirement.objects.filter(lottery_id=lottery_id))
+    return prizes, requirements
+
+
+def _announcement_requirement_line(req):
+    if req.requirement_type == 'CHANNEL' and req.channel_username:
+        username = req.channel_username
+    elif req.requirement_type == 'GROUP' and req.group_username:
+        username = req.group_username
+    elif req.requirement_type in ('CHANNEL', 'GROUP') and req.chat_identifier:
+        return f"• 必须加入: {req.chat_identifier}\n"
+    else:
+        return ""
+    if not username.startswith('@'):
+        username = f"@{username}"
+    return f"• 必须加入: {username}\n"
+
+
+async def render_lottery_announcement(lottery) -> RenderedMessage:
+    """群组公告（HTML 预览文本 + 参与按钮），发布和复制抽奖共用"""
+    async def render():
+        prizes, requirements = await _load_prizes_and_requirements(lottery.id)
+        prizes_text = "".join(f"• {prize.name}: {prize.description} ({prize.quantity}名)\n" for prize in prizes)
+        requirements_text = "".join(_announcement_requirement_line(req) for req in requirements)
+
+        text = (
+            f"🎁 <b>{lottery.title}</b>\n\n"
+            f"{lottery.description}\n\n"
+            f"⏱ 报名截止: {lottery.signup_deadline.strftime('%Y-%m-%d %H:%M')}\n"
+            f"🕒 开奖时间: {lottery.draw_time.strftime('%Y-%m-%d %H:%M')}\n\n"
+            f"🏆 奖品设置:\n{prizes_text}\n"
+        )
+        # 如果有参与条件，添加到预览消息
+        if requirements_text:
+            text += f"📝 参与条件:\n{requirements_text}\n"
+        # 如果有积分要求，添加积分信息
+        if lottery.points_required > 0:
+            text += f"💰 参与所需积分: {lottery.points_required}\n"
+
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🎲 参与抽奖", callback_data=f"join_lottery_{lottery.id}")]
+        ])
+        return RenderedMessage(text=text, parse_mode='HTML', keyboard=keyboard)
+
+    return await lottery_render_cache.get_or_render(lottery, 'announcement', render)
+
+
+def _display_chat_name(username, chat_id):
+    display_name = username or str(chat_id)
+    # 智能显示用户名，如果不以@开头则添加@
+    if display_name and not display_name.startswith('@'):
+        display_name = f"@{display_name}"
+    return display_name
+
+
+async def render_lottery_detail(lottery) -> Optional[RenderedMessage]:
+    """
+    抽奖详情中与用户和时间无关的部分（开奖时间、奖品、参与条件）及"检测条件"按钮
+
+    奖品尚未设置时返回 None（不缓存）
+    """
+    async def render():
+        prizes, requirements = await _load_prizes_and_requirements(lottery.id)
+        if not prizes:
+            return None
+
+        text = ""
+        if lottery.draw_time:
+            text += f"🔮 开奖时间: {lottery.draw_time.strftime('%Y-%m-%d %H:%M')}\n"
+        text += "\n🏆 奖品设置:\n"
+        for prize in prizes:
+            text += f"• {prize.name}: {prize.description} ({prize.quantity}名)\n"
+
+        # 添加参与条件说明
+        if requirements:
+            text += "\n📝 参与条件:\n"
+            for req in requirements:
+                if req.requirement_type == 'CHANNEL':
+                    text += f"• 必须关注: {_display_chat_name(req.channel_username, req.channel_id)}\n"
+                elif req.requirement_type == 'GROUP':
+                    text += f"• 必须加入: {_display_chat_name(req.group_username, req.group_id)}\n"
+                elif req.requirement_type == 'REGISTRATION_TIME':
+                    text += f"• 账号注册时间: >{req.min_registration_days}天\n"
+        else:
+            text += "\n此抽奖没有特殊参与条件。\n"
+
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔍 检测是否已满足条件", callback_data=f"private_check_req_{lottery.id}")]
+        ])
+        return RenderedMessage(text=text, keyboard=keyboard)
+
+    return await lottery_render_cache.get_or_render(lottery, 'detail', render)
+
+
+async def get_lottery_requirements(lottery):
+    """抽奖的参与条件列表（只读，多个请求共享同一组实例）"""
+    async def load():
+        _, requirements = await _load_prizes_and_requirements(lottery.id)
+        return tuple(requirements)
+
+    return await lottery_render_cache.get_or_render(lottery, 'requirements', load)
@@ -0,0 +1,260 @@
+"""
+抽奖参与条件校验
+
+检测参与条件时每个频道/群组条件都要调用一次 get_chat_member，原来逐个串行调用，
+用户每次点击"重新检测"都会重新请求全部条件。这里：
+- private_check_requirements 通过 asyncio.gather 并发检查同一用户的全部条件
+- 每个频道/群组同时进行的 get_chat_member 请求不超过 REQUIREMENT_CHECK_PER_CHAT_CONCURRENCY 个
+- 检查结果按 (聊天, 用户) 缓存：已加入的结果缓存 REQUIREMENT_CACHE_TTL 秒，
+  未加入的结果只缓存 REQUIREMENT_CACHE_NEGATIVE_TTL 秒，方便用户加入后重新检测；请求出错的结果不缓存
+- 机器人担任管理员的聊天会收到 chat_member 更新，由 handle_chat_member 直接刷新缓存
+- 创建条件时解析聊天的数字ID、类型和机器人管理员状态，检查时直接使用数字ID；
+  后台任务每隔 REQUIREMENT_REVALIDATE_INTERVAL 秒重新解析进行中抽奖的条件（含创建时解析失败的条件）
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, Optional, Tuple, Union
+
+import telegram.error
+from django.conf import settings
+from django.utils import timezone
+
+from jifen.db_executor import db_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+# 视为已加入的成员状态
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+ChatRef = Union[int, str]
+
+
+def normalize_chat_ref(chat_ref) -> ChatRef:
+    """把数字ID、"-100..." 字符串、"name" 或 "@name" 统一为缓存键：数字ID 或小写的 "@name" """
+    if isinstance(chat_ref, int):
+        return chat_ref
+    chat_ref = str(chat_ref).strip()
+    if chat_ref.lstrip('-').isdigit():
+        return int(chat_ref)
+    return f"@{chat_ref.lstrip('@').lower()}"
+
+
+class RequirementCache:
+    """(聊天, 用户ID) -> 是否已加入 的短期缓存，线程安全"""
+
+    def __init__(self, ttl=60, negative_ttl=10, max_size=50000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: 'OrderedDict[Tuple[ChatRef, int], Tuple[bool, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chat_ref: ChatRef, user_id: int) -> Optional[bool]:
+        key = (chat_ref, user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, chat_ref: ChatRef, user_id: int, is_member: bool) -> None:
+        expires = time.monotonic() + (self.ttl if is_member else self.negative_ttl)
+        key = (chat_ref, user_id)
+        with self._lock:
+            self._entries[key] = (is_member, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def forget_chat(self, chat_ref: ChatRef) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == chat_ref]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+
+requirement_cache = RequirementCache(
+    ttl=getattr(settings, 'REQUIREMENT_CACHE_TTL', 60),
+    negative_ttl=getattr(settings, 'REQUIREMENT_CACHE_NEGATIVE_TTL', 10),
+    max_size=getattr(settings, 'REQUIREMENT_CACHE_SIZE', 50000),
+)
+
+# 每个聊天的 get_chat_member 并发上限
+_chat_semaphores: Dict[ChatRef, asyncio.Semaphore] = {}
+
+
+def _chat_semaphore(chat_ref: ChatRef) -> asyncio.Semaphore:
+    semaphore = _chat_semaphores.get(chat_ref)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(getattr(settings, 'REQUIREMENT_CHECK_PER_CHAT_CONCURRENCY', 5))
+        _chat_semaphores[chat_ref] = semaphore
+    return semaphore
+
+
+async def check_member(bot, chat_id, user_id: int) -> bool:
+    """
+    检查用户是否已加入指定频道/群组，优先使用缓存
+
+    chat_id 为数字ID或 "@username"；get_chat_member 出错时异常抛给调用方，结果不缓存
+    """
+    chat_ref = normalize_chat_ref(chat_id)
+    cached = requirement_cache.get(chat_ref, user_id)
+    if cached is not None:
+        logger.debug("requirement cache hit chat=%s user=%s member=%s", chat_ref, user_id, cached)
+        return cached
+
+    async with _chat_semaphore(chat_ref):
+        # 排队期间可能已有相同的检查完成
+        cached = requirement_cache.get(chat_ref, user_id)
+        if cached is not None:
+            return cached
+        chat_member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+    is_member = chat_member.status in MEMBER_STATUSES
+    requirement_cache.put(chat_ref, user_id, is_member)
+    return is_member
+
+
+def record_chat_member(chat, user_id: int, status: str) -> None:
+    """收到 chat_member 更新时刷新缓存（聊天ID和用户名两个键都刷新）"""
+    is_member = status in MEMBER_STATUSES
+    requirement_cache.put(chat.id, user_id, is_member)
+    if chat.username:
+        requirement_cache.put(normalize_chat_ref(chat.username), user_id, is_member)
+
+
+def forget_chat(chat) -> None:
+    """机器人离开聊天后清除该聊天的缓存（此后不会再收到 chat_member 更新）"""
+    requirement_cache.forget_chat(chat.id)
+    if chat.username:
+        requirement_cache.forget_chat(normalize_chat_ref(chat.username))
+
+
+@dataclass(frozen=True)
+class ResolvedChat:
+    """通过 Bot API 解析的聊天信息"""
+    chat_id: int
+    chat_type: str
+    username: Optional[str]
+    bot_is_admin: bool
+
+
+async def resolve_chat(bot, chat_ref) -> ResolvedChat:
+    """解析频道/群组的数字ID、类型和机器人是否为管理员，失败时抛出 TelegramError"""
+    chat = await bot.get_chat(chat_id=chat_ref)
+    bot_member = await bot.get_chat_member(chat_id=chat.id, user_id=bot.id)
+    return ResolvedChat(
+        chat_id=chat.id,
+        chat_type=chat.type,
+        username=chat.username,
+        bot_is_admin=bot_member.status in ('administrator', 'creator'),
+    )
+
+
+@db_sync_to_async
+def _load_stale_requirements(interval):
+    """加载需要重新解析的条件：未结束的抽奖中从未解析或解析时间早于 interval 秒前的频道/群组条件"""
+    from django.db.models import Q
+    from .models import LotteryRequirement
+
+    cutoff = timezone.now() - timedelta(seconds=interval)
+    return list(
+        LotteryRequirement.objects.filter(
+            requirement_type__in=('CHANNEL', 'GROUP'),
+            lottery__status__in=('DRAFT', 'ACTIVE', 'PAUSED'),
+        ).filter(Q(resolved_at__isnull=True) | Q(resolved_at__lt=cutoff))
+    )
+
+
+@db_sync_to_async
+def _save_resolved(requirement_ids, fields):
+    """
+    保存解析结果
+
+    批量 update 不会触发 post_save，这里同时更新所属抽奖的 updated_at 并清除渲染缓存，
+    使缓存的抽奖详情和参与条件（choujiang.signals 中的处理）在各进程中失效
+    """
+    from django.db import transaction
+    from .models import Lottery, LotteryRequirement
+    from .render_cache import lottery_render_cache
+
+    with transaction.atomic():
+        updated = LotteryRequirement.objects.filter(id__in=requirement_ids).update(**fields)
+        lottery_ids = set(
+            LotteryRequirement.objects.filter(id__in=requirement_ids).values_list('lottery_id', flat=True)
+        )
+        Lottery.objects.filter(id__in=lottery_ids).update(updated_at=timezone.now())
+    for lottery_id in lottery_ids:
+        lottery_render_cache.invalidate(lottery_id)
+    return updated
+
+
+async def revalidate_requirements(bot, interval):
+    """重新解析过期的条件，同一个聊天只请求一次，返回 (成功数, 失败数)"""
+    from .models import resolved_chat_fields
+
+    requirements = await _load_stale_requirements(interval)
+    by_chat = {}
+    for req in requirements:
+        chat_ref = req.member_chat_id()
+        if chat_ref is not None:
+            by_chat.setdefault(normalize_chat_ref(chat_ref), []).append(req)
+
+    resolved_count = failed_count = 0
+    for chat_ref, reqs in by_chat.items():
+        try:
+            resolved = await resolve_chat(bot, chat_ref)
+        except telegram.error.RetryAfter as e:
+            logger.warning(f"[参与条件] 解析聊天触发限流，{e.retry_after} 秒后继续")
+            await asyncio.sleep(e.retry_after)
+            failed_count += len(reqs)
+            continue
+        except telegram.error.TelegramError as e:
+            logger.warning(f"[参与条件] 解析聊天 {chat_ref} 失败: {e}")
+            failed_count += len(reqs)
+            continue
+        fallback_username = reqs[0].channel_username or reqs[0].group_username
+        await _save_resolved([req.id for req in reqs], resolved_chat_fields(resolved, fallback_username))
+        if not resolved.bot_is_admin:
+            logger.warning(f"[参与条件] 机器人不是聊天 {chat_ref} ({resolved.chat_id}) 的管理员，成员检查可能失败")
+        resolved_count += len(reqs)
+    if by_chat:
+        logger.info(f"[参与条件] 重新解析完成: {len(by_chat)} 个聊天，成功 {resolved_count} 条，失败 {failed_count} 条")
+    return resolved_count, failed_count
+
+
+async def start_requirement_revalidator(bot):
+    """启动参与条件的后台重新解析任务（需在事件循环中调用）"""
+    interval = getattr(settings, 'REQUIREMENT_REVALIDATE_INTERVAL', 3600)
+
+    async def run():
+        while True:
+            try:
+                await revalidate_requirements(bot, interval)
+            except Exception as e:
+                logger.error(f"[参与条件] 重新解析参与条件时出错: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    asyncio.get_running_loop().create_task(run())
+    logger.info("[参与条件] 参与条件后台解析任务已启动")
@@ -0,0 +1,33 @@
+import logging
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Lottery, LotteryRequirement, Prize
+from .list_lotteries import forget_group_count
+from .render_cache import lottery_render_cache
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Prize, dispatch_uid='prize_saved_touch_lottery')
+@receiver(post_delete, sender=Prize, dispatch_uid='prize_deleted_touch_lottery')
+@receiver(post_save, sender=LotteryRequirement, dispatch_uid='requirement_saved_touch_lottery')
+@receiver(post_delete, sender=LotteryRequirement, dispatch_uid='requirement_deleted_touch_lottery')
+def touch_lottery(sender, instance, **kwargs):
+    """奖品或参与条件变化后更新所属抽奖的 updated_at，使各进程中的渲染缓存失效"""
+    Lottery.objects.filter(id=instance.lottery_id).update(updated_at=timezone.now())
+    lottery_render_cache.invalidate(instance.lottery_id)
+
+
+@receiver(post_save, sender=Lottery, dispatch_uid='lottery_saved_invalidate_render')
+def invalidate_lottery_render(sender, instance, **kwargs):
+    lottery_render_cache.invalidate(instance.id)
+    if kwargs.get('created'):
+        forget_group_count(instance.group_id)
+
+
+@receiver(post_delete, sender=Lottery, dispatch_uid='lottery_deleted_forget_group_count')
+def forget_lottery_group_count(sender, instance, **kwargs):
+    forget_group_count(instance.group_id)
@@ -1,3 +1,162 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+
+from choujiang.join_engine import (
+    join_lottery_atomic, JOIN_OK, JOIN_ALREADY_JOINED, JOIN_INSUFFICIENT_POINTS,
+    JOIN_LOTTERY_CLOSED, JOIN_NOT_MEMBER,
+)
+from choujiang.lottery_drawer import save_draw_results
+from choujiang.management.commands.explain_hot_queries import explain, hot_querysets
+from choujiang.models import Lottery, LotteryLog, Participant, Prize
+from jifen.models import Group, PointTransaction, User
+
+
+class JoinLotteryAtomicTests(TransactionTestCase):
+    """join_lottery_atomic 的结果状态码与积分扣除"""
+
+    def setUp(self):
+        self.group = Group.objects.create(group_id=-1001, group_title='测试群组', is_active=True)
+        self.user = User.objects.create(telegram_id=1001, username='tester', group=self.group, points=15)
+        self.lottery = self._create_lottery()
+
+    def _create_lottery(self, **kwargs):
+        fields = dict(
+            title='测试抽奖',
+            group=self.group,
+            creator=self.user,
+            status='ACTIVE',
+            signup_deadline=datetime.now() + timedelta(days=1),
+            draw_time=datetime.now() + timedelta(days=1),
+            auto_draw=False,
+            points_required=10,
+        )
+        fields.update(kwargs)
+        return Lottery.objects.create(**fields)
+
+    def _points(self):
+        return User.objects.get(pk=self.user.pk).points
+
+    def _charges(self):
+        return PointTransaction.objects.filter(user=self.user, type='RAFFLE_PARTICIPATION').count()
+
+    def test_join_deducts_points_once(self):
+        result = join_lottery_atomic(self.lottery.id, self.user.telegram_id)
+        self.assertEqual(result.code, JOIN_OK)
+        self.assertEqual(result.user_points, 5)
+
+        result = join_lottery_atomic(self.lottery.id, self.user.telegram_id)
+        self.assertEqual(result.code, JOIN_ALREADY_JOINED)
+        self.assertEqual(self._points(), 5)
+        self.assertEqual(self._charges(), 1)
+        self.assertEqual(Participant.objects.filter(lottery=self.lottery).count(), 1)
+
+    def test_insufficient_points_rolls_back(self):
+        User.objects.filter(pk=self.user.pk).update(points=9)
+        result = join_lottery_atomic(self.lottery.id, self.user.telegram_id)
+        self.assertEqual(result.code, JOIN_INSUFFICIENT_POINTS)
+        self.assertEqual(result.user_points, 9)
+        self.assertEqual(self._points(), 9)
+        self.assertEqual(self._charges(), 0)
+        self.assertFalse(Participant.objects.filter(lottery=self.lottery).exists())
+
+    def test_join_without_signup_deadline(self):
+        lottery = self._create_lottery(signup_deadline=None)
+        result = join_lottery_atomic(lottery.id, self.user.telegram_id)
+        self.assertEqual(result.code, JOIN_OK)
+
+    def test_join_drawing_lottery_is_closed(self):
+        Lottery.objects.filter(id=self.lottery.id).update(status='DRAWING')
+        result = join_lottery_atomic(self.lottery.id, self.user.telegram_id)
+        self.assertEqual(result.code, JOIN_LOTTERY_CLOSED)
+        self.assertEqual(self._points(), 15)
+        self.assertFalse(Participant.objects.filter(lottery=self.lottery).exists())
+
+    def test_inactive_member_cannot_join(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        result = join_lottery_atomic(self.lottery.id, self.user.telegram_id)
+        self.assertEqual(result.code, JOIN_NOT_MEMBER)
+        self.assertEqual(self._charges(), 0)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_joins_charge_once(self):
+        def join(_):
+            try:
+                return join_lottery_atomic(self.lottery.id, self.user.telegram_id).code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            codes = list(executor.map(join, range(16)))
+
+        self.assertEqual(codes.count(JOIN_OK), 1)
+        self.assertEqual(codes.count(JOIN_ALREADY_JOINED), 15)
+        self.assertEqual(self._points(), 5)
+        self.assertEqual(self._charges(), 1)
+
+
+class HotQueryPlanTests(TestCase):
+    """热点查询必须使用索引，任何一条退化为全表扫描（缺少或删除了索引）时失败"""
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in hot_querysets():
+            with self.subTest(name):
+                rows, full_scans = explain(queryset)
+                self.assertEqual(full_scans, [], f"{name} 退化为全表扫描:\n" + "\n".join(map(str, rows)))
+
+
+class SaveDrawResultsTests(TestCase):
+    """save_draw_results 批量保存开奖结果"""
+
+    def setUp(self):
+        self.group = Group.objects.create(group_id=-1002, group_title='开奖测试群组', is_active=True)
+        self.creator = User.objects.create(telegram_id=1, group=self.group)
+
+    def _draw(self, winner_count, status='DRAWING'):
+        lottery = Lottery.objects.create(
+            title='开奖测试',
+            group=self.group,
+            creator=self.creator,
+            status=status,
+            signup_deadline=datetime.now() + timedelta(days=1),
+            draw_time=datetime.now() + timedelta(days=1),
+            auto_draw=False,
+        )
+        prize = Prize.objects.create(lottery=lottery, name='一等奖', description='测试奖品', quantity=winner_count)
+        base = lottery.id * 10 ** 6
+        User.objects.bulk_create([
+            User(telegram_id=base + index, group=self.group) for index in range(winner_count)
+        ])
+        users = User.objects.filter(group=self.group, telegram_id__gte=base, telegram_id__lt=base + winner_count)
+        Participant.objects.bulk_create([Participant(lottery=lottery, user=user, joined_at=datetime.now()) for user in users])
+        winners = [
+            {'participant': participant, 'prize': prize}
+            for participant in Participant.objects.filter(lottery=lottery)
+        ]
+        return lottery, winners
+
+    def test_saves_winners_and_ends_lottery(self):
+        lottery, winners = self._draw(5)
+        self.assertTrue(save_draw_results(lottery, winners, '测试开奖'))
+        self.assertEqual(Participant.objects.filter(lottery=lottery, is_winner=True, prize__isnull=False).count(), 5)
+        self.assertEqual(Lottery.objects.get(id=lottery.id).status, 'ENDED')
+        self.assertTrue(LotteryLog.objects.filter(lottery=lottery, action='DRAW').exists())
+
+    def test_query_count_does_not_grow_with_winners(self):
+        counts = []
+        for winner_count in (3, 60):
+            lottery, winners = self._draw(winner_count)
+            with CaptureQueriesContext(connection) as queries:
+                save_draw_results(lottery, winners, '测试开奖')
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_released_claim_is_not_overwritten(self):
+        lottery, winners = self._draw(3, status='ACTIVE')
+        self.assertFalse(save_draw_results(lottery, winners, '测试开奖'))
+        self.assertFalse(Participant.objects.filter(lottery=lottery, is_winner=True).exists())
+        self.assertEqual(Lottery.objects.get(id=lottery.id).status, 'ACTIVE')
+        self.assertFalse(LotteryLog.objects.filter(lottery=lottery).exists())
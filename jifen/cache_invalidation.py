@@ -0,0 +1,48 @@
+"""
+进程间缓存失效
+
+单进程运行时失效只作用于本进程的缓存。分片模式下，工作进程启动时通过 set_broadcaster 注册广播函数，
+本进程的失效经调度进程转发给其他工作进程，由 apply_remote 在各进程中执行。
+例如管理员在私聊（由用户所在的分片处理）中修改积分规则后，群组所在分片的规则缓存也会立即失效。
+
+各缓存模块在导入时通过 register 注册自己的失效函数。
+"""
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 失效类型 -> 本进程的失效函数
+_handlers: Dict[str, Callable] = {}
+# 把失效发送给其他进程的函数，未设置时只失效本进程
+_broadcaster: Optional[Callable] = None
+
+
+def register(kind: str, handler: Callable) -> None:
+    """注册某类缓存的失效函数 handler(key)"""
+    _handlers[kind] = handler
+
+
+def set_broadcaster(broadcaster: Optional[Callable]) -> None:
+    """设置广播函数 broadcaster(kind, key)（需线程安全，失效可能在数据库线程中触发）"""
+    global _broadcaster
+    _broadcaster = broadcaster
+
+
+def invalidate(kind: str, key) -> None:
+    """失效本进程的缓存，并通知其他进程"""
+    _handlers[kind](key)
+    if _broadcaster is not None:
+        try:
+            _broadcaster(kind, key)
+        except Exception as e:
+            logger.error(f"[缓存失效] 广播 {kind}:{key} 失败: {e}", exc_info=True)
+
+
+def apply_remote(kind: str, key) -> None:
+    """执行其他进程发来的失效"""
+    handler = _handlers.get(kind)
+    if handler is None:
+        logger.warning(f"[缓存失效] 未知的失效类型: {kind}")
+        return
+    handler(key)
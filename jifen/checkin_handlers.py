@@ -5,6 +5,11 @@ from django.utils import timezone
 from asgiref.sync import sync_to_async
 from .models import Group, PointRule, CheckIn, PointTransaction, User
 from django.db import transaction
+from django.db.models import F
+from .rule_cache import get_group_rule, invalidate_group_rule
+from .db_executor import db_sync_to_async
+from .member_cache import get_member
+from .leaderboard import apply_points_delta
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -277,6 +282,8 @@ async def handle_checkin_text_input(update: Update, context: ContextTypes.DEFAUL
             # 更新签到文字
             rule.checkin_keyword = text
             rule.save()
+            # 规则已变更，事务提交后清除积分规则缓存
+            transaction.on_commit(lambda: invalidate_group_rule(chat_id))
             
             logger.info(f"群组 {group.group_title} (ID: {chat_id}) 的签到文字已从 '{old_keyword}' 更新为 '{text}'")
             return True, group.group_title
@@ -460,6 +467,8 @@ async def handle_points_input(update: Update, context: ContextTypes.DEFAULT_TYPE
             # 更新积分值
             rule.checkin_points = points
             rule.save()
+            # 规则已变更，事务提交后清除积分规则缓存
+            transaction.on_commit(lambda: invalidate_group_rule(chat_id))
             
             logger.info(f"群组 {group.group_title} (ID: {chat_id}) 的签到积分已从 {old_points} 更新为 {points}")
             return True, group.group_title
@@ -616,32 +625,36 @@ async def process_group_message(update: Update, context: ContextTypes.DEFAULT_TY
     user = update.effective_user
     chat_id = chat.id
     
-    logger.info(f"处理群组 {chat_id} 中用户 {user.id} ({user.full_name}) 的消息: {text}")
+    logger.debug("处理群组 %s 中用户 %s 的消息", chat_id, user.id)
     
     try:
         # 检查是否为签到关键词
-        @sync_to_async
+        @db_sync_to_async
         def check_checkin_keyword(chat_id, user_id, text):
             try:
-                # 获取群组对象
-                group = Group.objects.get(group_id=chat_id, is_active=True)
+                # 从缓存获取群组及其签到规则
+                entry = get_group_rule(chat_id)
+                if not entry:
+                    logger.debug("群组 %s 不存在或非活跃", chat_id)
+                    return None, None, None
                 
-                # 获取该群组的签到规则
-                rule = PointRule.objects.filter(group=group).first()
+                group = entry.group_ref()
+                rule = entry.rule
                 if not rule or not rule.points_enabled:
-                    logger.debug(f"群组 {chat_id} 未设置签到规则或积分功能已关闭")
+                    logger.debug("群组 %s 未设置签到规则或积分功能已关闭", chat_id)
                     return None, None, None
                 
                 # 检查消息是否与签到关键词匹配
                 if text != rule.checkin_keyword:
-                    logger.debug(f"消息 '{text}' 与签到关键词 '{rule.checkin_keyword}' 不匹配")
+                    logger.debug("群组 %s 的消息与签到关键词不匹配", chat_id)
                     return None, None, None
                 
-                # 获取用户对象
-                user_obj = User.objects.filter(telegram_id=user_id, group=group, is_active=True).first()
-                if not user_obj:
-                    logger.warning(f"用户 {user_id} 在群组 {chat_id} 中不存在或非活跃")
+                # 从成员缓存获取用户
+                member = get_member(user_id, group.id)
+                if not member or not member.is_active:
+                    logger.debug("用户 %s 在群组 %s 中不存在或非活跃", user_id, chat_id)
                     return None, None, None
+                user_obj = member.user_ref()
                 
                 # 检查今天是否已经签到过
                 today = timezone.now().date()
@@ -652,7 +665,7 @@ async def process_group_message(update: Update, context: ContextTypes.DEFAULT_TY
                 ).first()
                 
                 if existing_checkin:
-                    logger.info(f"用户 {user_id} 今天已经在群组 {chat_id} 中签到过了")
+                    logger.info("用户 %s 今天已经在群组 %s 中签到过了", user_id, chat_id)
                     return group, user_obj, None
                 
                 # 创建签到记录并更新用户积分
@@ -665,9 +678,9 @@ async def process_group_message(update: Update, context: ContextTypes.DEFAULT_TY
                         checkin_date=today
                     )
                     
-                    # 更新用户积分
-                    user_obj.points += rule.checkin_points
-                    user_obj.save()
+                    # 更新用户积分，使用 F() 原子累加
+                    User.objects.filter(pk=user_obj.pk).update(points=F('points') + rule.checkin_points)
+                    transaction.on_commit(lambda: apply_points_delta(group.id, user_obj.pk, rule.checkin_points))
                     
                     # 创建积分变动记录
                     PointTransaction.objects.create(
@@ -679,7 +692,7 @@ async def process_group_message(update: Update, context: ContextTypes.DEFAULT_TY
                         transaction_date=today
                     )
                     
-                    logger.info(f"用户 {user_id} 在群组 {chat_id} 签到成功，获得 {rule.checkin_points} 积分")
+                    logger.info("用户 %s 在群组 %s 签到成功，获得 %s 积分", user_id, chat_id, rule.checkin_points)
                     return group, user_obj, rule.checkin_points
             except Exception as e:
                 logger.error(f"处理签到消息时出错: {e}", exc_info=True)
@@ -694,7 +707,7 @@ async def process_group_message(update: Update, context: ContextTypes.DEFAULT_TY
             await update.message.reply_text(
                 f"@{user.username if user.username else user.full_name} 已签到，获得 {points_awarded} 积分"
             )
-            logger.info(f"向用户 {user.id} 发送了签到成功消息")
+            logger.debug("向用户 %s 发送了签到成功消息", user.id)
             return True
         # 如果已经签到过
         elif group and user_obj:
@@ -702,7 +715,7 @@ async def process_group_message(update: Update, context: ContextTypes.DEFAULT_TY
             await update.message.reply_text(
                 f"@{user.username if user.username else user.full_name} 今天已签到，请明天再来"
             )
-            logger.info(f"向用户 {user.id} 发送了已签到过消息")
+            logger.debug("向用户 %s 发送了已签到过消息", user.id)
             return True
         
         # 如果不是签到消息，返回False继续处理
@@ -0,0 +1,134 @@
+"""
+数据库专用线程池
+
+sync_to_async 默认 thread_sensitive=True，所有处理器、开奖器和邀请逻辑的数据库操作
+都排队在同一个线程中执行，一条慢查询会拖住整个机器人。热点路径改用 db_sync_to_async：
+- 固定数量的工作线程（DB_EXECUTOR_WORKERS），每个线程持有自己的持久连接（受 CONN_MAX_AGE 控制）
+- 每次调用前清理出错或超龄的连接；连接空闲超过 DB_EXECUTOR_HEALTH_CHECK_INTERVAL 秒时先 ping，
+  连接已断开（例如 "MySQL server has gone away"）则关闭，由 Django 在下一条查询时自动重连
+- 出现连接类错误的调用不会自动重试（调用中可能已有写入），异常照常抛给调用方
+- SQLite 不支持多个线程同时写入，使用 SQLite 时线程数固定为 1
+- stats() 返回线程数、忙碌线程数、排队任务数等指标，由 /metrics 输出
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+
+class DBExecutor:
+    """数据库操作线程池"""
+
+    def __init__(self, workers=8, health_check_interval=60):
+        self.workers = workers
+        self.health_check_interval = health_check_interval
+        self._executor = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.reconnects = 0
+        self.wait_seconds = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                workers = self.workers
+                if connection.vendor == 'sqlite' and workers > 1:
+                    logger.info("SQLite 不支持多线程并发写入，数据库线程池使用 1 个线程")
+                    workers = 1
+                self.workers = workers
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='db-executor')
+                logger.info(f"数据库线程池已启动，线程数 {workers}")
+            return self._executor
+
+    def _ensure_connection(self):
+        """调用前检查当前线程的连接：清理出错或超龄的连接，空闲过久时 ping 一次"""
+        close_old_connections()
+        now = time.monotonic()
+        last_used = getattr(self._local, 'last_used', None)
+        if (connection.connection is not None and last_used is not None
+                and now - last_used > self.health_check_interval):
+            if not connection.is_usable():
+                logger.warning("数据库连接已断开，将在下一次查询时重新连接")
+                connection.close()
+                with self._lock:
+                    self.reconnects += 1
+        self._local.last_used = now
+
+    def _run(self, submitted_at, func, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_seconds += time.monotonic() - submitted_at
+        try:
+            self._ensure_connection()
+            return func(*args, **kwargs)
+        except Exception:
+            # 连接类错误会被 Django 标记为 errors_occurred，下一次调用前由 close_old_connections 检查并关闭
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            self._local.last_used = time.monotonic()
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, func, *args, **kwargs):
+        """在数据库线程池中执行同步函数"""
+        executor = self._get_executor()
+        with self._lock:
+            self.queued += 1
+        # 复制 contextvars，使运行指标等上下文在线程中可见
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, self._run, time.monotonic(), func, args, kwargs)
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+    def stats(self):
+        """返回线程池运行统计"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'active': self.active,
+                'queued': self.queued,
+                'completed': self.completed,
+                'failed': self.failed,
+                'reconnects': self.reconnects,
+                'wait_seconds': round(self.wait_seconds, 6),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+db_executor = DBExecutor(
+    workers=getattr(settings, 'DB_EXECUTOR_WORKERS', 8),
+    health_check_interval=getattr(settings, 'DB_EXECUTOR_HEALTH_CHECK_INTERVAL', 60),
+)
+
+
+def db_sync_to_async(func):
+    """
+    把同步的数据库函数包装成在数据库线程池中执行的异步函数，用法与 @sync_to_async 相同
+
+    注意：不同调用可能在不同线程中执行，跨调用共享的事务或未提交的数据不可用
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await db_executor.run(func, *args, **kwargs)
+
+    return wrapper
@@ -3,9 +3,16 @@ from telegram import Update, Chat, ChatMember, ChatMemberUpdated
 from telegram.ext import ContextTypes
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import F
 from asgiref.sync import sync_to_async
 from .models import Group, User, PointRule, Invite, DailyInviteStat, PointTransaction
-from datetime import datetime
+from .rule_cache import get_group_rule, invalidate_group_rule
+from .db_executor import db_sync_to_async
+from .member_cache import remember_member, forget_member, forget_group_members
+from .send_queue import submit_message
+from .invite_registry import invite_registry, extract_link_core
+from .leaderboard import apply_points_delta, leaderboard
+from choujiang.requirement_checker import record_chat_member, forget_chat as forget_requirement_chat
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -73,6 +80,8 @@ def save_group_to_db(chat_id, chat_title, chat_type, member_count, is_admin):
                 'joined_at': timezone.now()
             }
         )
+        # 群组状态变化，提交后清除积分规则缓存
+        transaction.on_commit(lambda: invalidate_group_rule(chat_id))
     return group, created
 
 @sync_to_async
@@ -101,6 +110,8 @@ def save_user_to_group(telegram_id, username, first_name, last_name, group_obj,
                 'is_active': True
             }
         )
+        # 提交后预热成员缓存
+        transaction.on_commit(lambda: remember_member(user))
         return user, created
 
 @sync_to_async
@@ -111,6 +122,8 @@ def mark_group_inactive(chat_id):
         if group:
             group.is_active = False
             group.save()
+            transaction.on_commit(lambda: invalidate_group_rule(chat_id))
+            transaction.on_commit(lambda: forget_group_members(group.id))
             return True
     return False
 
@@ -144,6 +157,10 @@ async def handle_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TY
     # 检查管理员状态是否发生变化
     admin_status_changed = old_is_admin != new_is_admin
     
+    # 机器人不再是管理员后收不到该聊天的 chat_member 更新，清除参与条件缓存
+    if old_is_admin and not new_is_admin:
+        forget_requirement_chat(chat)
+    
     # 检查成员状态变化
     result = extract_status_change(update.my_chat_member)
     
@@ -344,33 +361,17 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user = chat_member_updated.new_chat_member.user
     from_user = chat_member_updated.from_user
     
+    # 刷新抽奖参与条件缓存（频道和群组都会收到此更新）
+    record_chat_member(chat, user.id, chat_member_updated.new_chat_member.status)
+    
     # 只处理群组消息
     if chat.type not in ["group", "supergroup"]:
         return
     
     # 检查是否是新加入的成员
     if chat_member_updated.old_chat_member.status in ['left', 'kicked'] and chat_member_updated.new_chat_member.status in ['member', 'restricted']:
-        logger.info(f"用户 {user.id} ({user.full_name}) 加入了群组 {chat.id} ({chat.title})")
-        logger.info(f"加入详情: 由用户 {from_user.id} ({from_user.full_name}) 操作, old_status={chat_member_updated.old_chat_member.status}, new_status={chat_member_updated.new_chat_member.status}")
-        
-        # 调试: 显示所有当前的pending_invites，帮助诊断问题
-        if "pending_invites" in context.bot_data:
-            active_invites = {code: invite for code, invite in context.bot_data["pending_invites"].items() 
-                             if not invite.get('completed', False) and 
-                                timezone.datetime.fromisoformat(invite.get('created_at', timezone.now().isoformat())).date() >= (timezone.now().date() - timezone.timedelta(days=2))}
-            
-            if active_invites:
-                logger.info(f"当前有 {len(active_invites)} 个活跃的邀请记录:")
-                for code, invite in active_invites.items():
-                    logger.info(f"邀请码: {code}, 邀请人: {invite.get('inviter_id')} ({invite.get('inviter_name')}), "
-                               f"群组: {invite.get('group_id')} ({invite.get('group_title')}), "
-                               f"创建时间: {invite.get('created_at')}, "
-                               f"链接: {invite.get('link_url', '无链接')}, "
-                               f"官方标记: {invite.get('is_official_invite', False)}")
-            else:
-                logger.info("当前没有活跃的邀请记录")
-        else:
-            logger.info("上下文中没有pending_invites记录")
+        logger.info("用户 %s (%s) 加入了群组 %s (%s)", user.id, user.full_name, chat.id, chat.title)
+        logger.debug("加入详情: 由用户 %s (%s) 操作, old_status=%s, new_status=%s", from_user.id, from_user.full_name, chat_member_updated.old_chat_member.status, chat_member_updated.new_chat_member.status)
         
         # 记录邀请链接信息（如果有）
         invite_link_obj = getattr(chat_member_updated, 'invite_link', None)
@@ -383,9 +384,9 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 creator_id = getattr(invite_link_creator, 'id', 'unknown') if invite_link_creator else 'unknown'
                 creator_name = getattr(invite_link_creator, 'full_name', 'unknown') if invite_link_creator else 'unknown'
                 
-                logger.info(f"完整邀请链接对象: {invite_link_str}")
-                logger.info(f"邀请链接URL: {invite_link_url}")
-                logger.info(f"邀请链接创建者: {creator_id} ({creator_name})")
+                logger.debug("完整邀请链接对象: %s", invite_link_str)
+                logger.debug("邀请链接URL: %s", invite_link_url)
+                logger.debug("邀请链接创建者: %s (%s)", creator_id, creator_name)
                 
                 # 设置link_url供后续使用
                 link_url = invite_link_url
@@ -396,7 +397,7 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # 检查积分规则
         # 首先检查群组是否存在
-        @sync_to_async
+        @db_sync_to_async
         def check_or_create_group():
             from .models import Group
             try:
@@ -412,9 +413,8 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 logger.error(f"检查或创建群组时出错: {e}")
                 return None
         
-        @sync_to_async
+        @db_sync_to_async
         def get_point_rule(group):
-            from .models import PointRule
             try:
                 rule, created = PointRule.objects.get_or_create(
                     group=group,
@@ -434,253 +434,58 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # 优先级1: 检查是不是通过官方邀请链接加入的
         if from_user.id != user.id:
-            logger.info(f"用户 {user.id} 由 {from_user.id} ({from_user.full_name}) 直接邀请加入群组 {chat.id}")
+            logger.debug("用户 %s 由 %s (%s) 直接邀请加入群组 %s", user.id, from_user.id, from_user.full_name, chat.id)
             # 不再自动将from_user设为邀请人，而是检查这个from_user是否创建过邀请链接
-            # 检查pending_invites中是否有此用户创建的针对此群组的链接
-            if "pending_invites" in context.bot_data:
-                for code, invite in context.bot_data["pending_invites"].items():
-                    if 'inviter_id' in invite and invite['inviter_id'] == from_user.id and 'group_id' in invite and invite['group_id'] == chat.id:
-                        logger.info(f"找到匹配: 用户 {from_user.id} 之前创建过群组 {chat.id} 的邀请链接")
-                        inviter_id = from_user.id
-                        inviter_name = from_user.full_name
-                        break
-                
-                if not inviter_id:
-                    logger.info(f"用户 {from_user.id} 没有创建过此群组的邀请链接，不认为是邀请人")
+            if await db_sync_to_async(invite_registry.find_by_inviter)(from_user.id, chat.id):
+                logger.debug("找到匹配: 用户 %s 之前创建过群组 %s 的邀请链接", from_user.id, chat.id)
+                inviter_id = from_user.id
+                inviter_name = from_user.full_name
             else:
-                logger.info("没有pending_invites记录，不能确认邀请人身份")
+                logger.debug("用户 %s 没有创建过此群组的邀请链接，不认为是邀请人", from_user.id)
         
-        # 优先级2: 检查是否通过之前生成的邀请链接加入
-        link_match_found = False
-        if "pending_invites" in context.bot_data:
-            logger.info(f"检查用户 {user.id} 是否通过跟踪的邀请链接加入")
-            
-            # 不再重复获取邀请链接信息，使用上面已经获取的link_url
+        # 优先级2: 检查是否通过之前生成的邀请链接加入，其次按群组最近创建的正式邀请匹配
+        @db_sync_to_async
+        def match_invite_by_link_or_group():
             if link_url:
-                logger.info(f"用户使用链接 {link_url} 加入群组")
-                # 记录链接信息以便调试
-                try:
-                    if "+" in link_url:
-                        link_core = link_url.split("+")[1] if "+" in link_url else ""
-                        logger.info(f"用户链接核心部分: +{link_core}")
-                    elif "/c/" in link_url:
-                        link_core = link_url.split("/c/")[1] if len(link_url.split("/c/")) > 1 else ""
-                        logger.info(f"用户链接核心部分: /c/{link_core}")
-                except Exception as e:
-                    logger.warning(f"提取用户链接核心部分时出错: {e}")
-            else:
-                logger.info("用户加入时没有提供邀请链接信息")
-            
-            # 记录所有候选邀请信息用于调试
-            candidates = []
-            for code, invite in context.bot_data["pending_invites"].items():
-                if 'group_id' in invite and invite['group_id'] == chat.id:
-                    candidates.append({
-                        'code': code,
-                        'inviter_id': invite.get('inviter_id'),
-                        'inviter_name': invite.get('inviter_name'),
-                        'created_at': invite.get('created_at'),
-                        'completed': invite.get('completed', False),
-                        'is_official_invite': invite.get('is_official_invite', False)
-                    })
-            
-            if candidates:
-                logger.info(f"找到 {len(candidates)} 个该群组的邀请记录: {candidates}")
-            else:
-                logger.info(f"没有找到针对群组 {chat.id} 的邀请记录")
-            
-            # 优先查找基于链接URL的匹配
-            if link_url:  # 当有链接URL时进行链接匹配
-                for code, invite in context.bot_data["pending_invites"].items():
-                    if 'link_url' not in invite or 'group_id' not in invite:
-                        continue
-                        
-                    if invite['group_id'] == chat.id:
-                        invite_saved_url = invite.get('link_url', '')
-                        logger.info(f"检查邀请记录 {code}: link_url={invite_saved_url}, 邀请人={invite.get('inviter_name')}")
-                        
-                        # 检查链接是否匹配当前加入链接
-                        link_matched = False
-                        
-                        # 首先检查是否有官方标记
-                        if invite.get('is_official_invite', False):
-                            logger.info(f"发现官方邀请记录标记，比较链接是否匹配")
-                            
-                            # 提取链接的核心部分进行比较
-                            # Telegram链接格式一般为https://t.me/+XXXX或https://t.me/c/XXXX
-                            def extract_core_link(url):
-                                if not url:
-                                    return ""
-                                try:
-                                    # 提取+号或/c/后面的ID部分
-                                    if "+" in url:  # 提取+后面的部分作为核心ID
-                                        return url.split("+")[1] if "+" in url else url
-                                    elif "/c/" in url:
-                                        parts = url.split("/c/")
-                                        return parts[1] if len(parts) > 1 else url
-                                    return url
-                                except Exception as e:
-                                    logger.warning(f"提取链接核心部分时出错: {e}, url={url}")
-                                    return url
-                            
-                            saved_core = extract_core_link(invite_saved_url)
-                            current_core = extract_core_link(link_url)
-                            
-                            logger.info(f"链接核心部分比较: 存储={saved_core}, 当前={current_core}")
-                            
-                            if saved_core and current_core and saved_core == current_core:
-                                link_matched = True
-                                logger.info(f"链接核心完全匹配: {saved_core}")
-                            elif saved_core and current_core and (saved_core in current_core or current_core in saved_core):
-                                link_matched = True
-                                logger.info(f"链接核心部分匹配: 存储={saved_core}, 当前={current_core}")
-                            elif invite_saved_url and link_url == invite_saved_url:
-                                link_matched = True
-                                logger.info(f"链接完全匹配: {link_url}")
-                            elif invite_saved_url and (link_url in invite_saved_url or invite_saved_url in link_url):
-                                link_matched = True
-                                logger.info(f"链接部分匹配: 用户链接={link_url}, 存储链接={invite_saved_url}")
-                        else:
-                            # 旧版本记录没有官方标记，使用普通匹配
-                            if invite_saved_url and link_url == invite_saved_url:
-                                link_matched = True
-                                logger.info(f"链接完全匹配(旧版本): {link_url}")
-                            elif invite_saved_url and (link_url in invite_saved_url or invite_saved_url in link_url):
-                                link_matched = True
-                                logger.info(f"链接部分匹配(旧版本): 用户链接={link_url}, 存储链接={invite_saved_url}")
-                                
-                        if link_matched:
-                            logger.info(f"发现链接匹配! 用户 {user.id} 通过由 {invite.get('inviter_id')} ({invite.get('inviter_name')}) 创建的链接加入")
-                            logger.info(f"邀请记录详情: {invite}")
-                            
-                            # 更新邀请人信息 - 这里覆盖之前可能设置的inviter_id
-                            inviter_id = invite.get('inviter_id')
-                            inviter_name = invite.get('inviter_name')
-                            link_match_found = True
-                            
-                            # 不再将邀请记录标记为已完成，而是保留未完成状态使其可以被再次使用
-                            # 只记录最近的被邀请人信息，但不影响下次使用
-                            invite["last_invitee_id"] = user.id
-                            invite["last_invitee_name"] = user.full_name
-                            invite["last_used_at"] = timezone.now().isoformat()
-                            context.bot_data["pending_invites"][code] = invite
-                            
-                            logger.info(f"已更新邀请记录 {code}，记录最近使用，但保持链接可重复使用，邀请者: {inviter_name}, 被邀请者: {user.full_name}")
-                            break
-            
-            # 如果没有找到基于链接的匹配，尝试基于群组的匹配
-            if not link_match_found:
-                logger.info("没有找到链接URL匹配，尝试基于群组ID和时间的智能匹配")
-                
-                # 查找最近创建的、针对该群组的、带官方标记的邀请 (不再要求未完成)
-                current_time = timezone.now()
-                best_invite_code = None
-                best_invite = None
-                best_time_diff = float('inf')
-                
-                for code, invite in context.bot_data["pending_invites"].items():
-                    if not (invite.get('group_id') == chat.id and 
-                          invite.get('is_official_invite', False)):
-                        continue
-                    
-                    # 计算创建时间与当前时间的差距
-                    try:
-                        if 'created_at' in invite:
-                            created_time = timezone.datetime.fromisoformat(invite['created_at'])
-                            time_diff = (current_time - created_time).total_seconds() / 60  # 转换为分钟
-                            
-                            # 只考虑48小时内创建的邀请
-                            if time_diff <= 48 * 60:  # 48小时 = 2880分钟
-                                if time_diff < best_time_diff:
-                                    best_time_diff = time_diff
-                                    best_invite_code = code
-                                    best_invite = invite
-                    except Exception as e:
-                        logger.error(f"计算邀请时间差异时出错: {e}")
-                
-                # 使用找到的最佳匹配
-                if best_invite:
-                    logger.info(f"智能匹配: 找到最近的邀请记录，创建于 {best_time_diff:.1f} 分钟前")
-                    logger.info(f"邀请记录详情: {best_invite}")
-                    
-                    # 更新邀请人信息
-                    inviter_id = best_invite.get('inviter_id')
-                    inviter_name = best_invite.get('inviter_name')
-                    link_match_found = True
-                    
-                    # 更新邀请记录但不标记为completed
-                    best_invite["last_invitee_id"] = user.id
-                    best_invite["last_invitee_name"] = user.full_name
-                    best_invite["last_used_at"] = timezone.now().isoformat()
-                    best_invite["matched_by"] = "group_time_match"  # 标记匹配方式
-                    context.bot_data["pending_invites"][best_invite_code] = best_invite
-                    
-                    logger.info(f"已通过群组时间匹配更新邀请记录 {best_invite_code}，记录最近使用，但保持链接可重复使用")
-                    logger.info(f"邀请者: {inviter_name}, 被邀请者: {user.full_name}")
-            
-            # 如果找到了邀请链接匹配，记录日志
-            if link_match_found:
-                logger.info(f"已找到邀请链接匹配，使用邀请人 {inviter_id} ({inviter_name})")
+                record = invite_registry.find_by_link(chat.id, link_url)
+                if record:
+                    return record, 'link_match'
+            record = invite_registry.find_latest_official(chat.id)
+            if record:
+                return record, 'group_time_match'
+            return None, None
+        
+        if link_url:
+            logger.debug("用户使用链接 %s 加入群组，链接核心部分: %s", link_url, extract_link_core(link_url))
+        else:
+            logger.info("用户加入时没有提供邀请链接信息")
+        
+        matched_invite, matched_by = await match_invite_by_link_or_group()
+        if matched_invite:
+            logger.info("发现邀请匹配(%s)! 用户 %s 通过由 %s (%s) 创建的邀请加入，邀请码=%s", matched_by, user.id, matched_invite.inviter_id, matched_invite.inviter_name, matched_invite.code)
+            # 覆盖之前可能设置的inviter_id
+            inviter_id = matched_invite.inviter_id
+            inviter_name = matched_invite.inviter_name
         
         # 如果没有找到邀请链接匹配，且用户是自己加入的，尝试检查之前通过bot私聊点击链接的记录
         if not inviter_id and from_user.id == user.id:
-            logger.info(f"用户 {user.id} 自己加入群组，检查是否通过bot私聊中的跟踪链接")
-            
-            if "pending_invites" in context.bot_data:
-                # 寻找匹配的邀请记录
-                found_perfect_match = False
-                matched_invite_code = None
-                
-                # 遍历所有邀请记录，寻找用户ID和群组ID匹配的记录
-                for code, invite in context.bot_data["pending_invites"].items():
-                    if 'user_id' in invite and invite['user_id'] == user.id and 'group_id' in invite:
-                        invite_group_id = invite['group_id']
-                        # 确保群组ID格式一致进行比较
-                        if isinstance(invite_group_id, str) and invite_group_id.isdigit():
-                            invite_group_id = int(invite_group_id)
-                        
-                        if invite_group_id == chat.id:
-                            logger.info(f"找到完美匹配的邀请记录: 用户ID={user.id}, 群组ID={chat.id}")
-                            inviter_id = invite['inviter_id']
-                            inviter_name = invite['inviter_name']
-                            found_perfect_match = True
-                            matched_invite_code = code
-                            break
-                
-                # 如果没有完美匹配，尝试通过时间窗口匹配
-                if not found_perfect_match:
-                    logger.info("没有找到精确匹配，尝试通过时间窗口匹配")
-                    current_time = timezone.now()
-                    time_window_minutes = 30  # 设置30分钟的时间窗口
-                    
-                    for code, invite in context.bot_data["pending_invites"].items():
-                        if 'user_id' in invite and invite['user_id'] == user.id:
-                            # 检查加入时间是否在最近的时间窗口内
-                            if 'joined_at' in invite:
-                                try:
-                                    joined_time = timezone.datetime.fromisoformat(invite['joined_at'])
-                                    time_diff = (current_time - joined_time).total_seconds() / 60
-                                    
-                                    if time_diff <= time_window_minutes:
-                                        logger.info(f"找到时间窗口内的邀请记录: {time_diff}分钟前")
-                                        inviter_id = invite['inviter_id']
-                                        inviter_name = invite['inviter_name']
-                                        matched_invite_code = code
-                                        break
-                                except Exception as e:
-                                    logger.error(f"解析加入时间出错: {e}")
-                
-                # 如果找到了匹配，更新邀请记录，但不标记为已完成
-                if matched_invite_code:
-                    # 只记录最近使用
-                    context.bot_data["pending_invites"][matched_invite_code]["last_used_at"] = timezone.now().isoformat()
-                    context.bot_data["pending_invites"][matched_invite_code]["last_invitee_id"] = user.id
-                    context.bot_data["pending_invites"][matched_invite_code]["last_invitee_name"] = user.full_name
-                    logger.info(f"已更新邀请记录 {matched_invite_code}，记录最近使用，但保持链接可重复使用")
+            logger.debug("用户 %s 自己加入群组，检查是否通过bot私聊中的跟踪链接", user.id)
+            matched_invite, matched_by = await db_sync_to_async(invite_registry.find_by_invitee)(user.id, chat.id)
+            if matched_invite:
+                logger.debug("找到通过跟踪链接启动的邀请记录(%s): 用户ID=%s, 邀请码=%s", matched_by, user.id, matched_invite.code)
+                inviter_id = matched_invite.inviter_id
+                inviter_name = matched_invite.inviter_name
+        
+        # 记录邀请链接最近一次使用，但保持链接可重复使用
+        if inviter_id and matched_invite:
+            try:
+                await db_sync_to_async(invite_registry.record_use)(matched_invite.code, user.id, user.full_name, matched_by)
+            except Exception as e:
+                logger.error(f"更新邀请记录 {matched_invite.code} 使用情况时出错: {e}")
         
         # 如果到这里还没有找到邀请人，记录日志并且不分配积分
         if not inviter_id:
-            logger.info(f"未找到有效的邀请匹配记录，用户 {user.id} ({user.full_name}) 加入群组不会给任何人分配积分")
+            logger.debug("未找到有效的邀请匹配记录，用户 %s (%s) 加入群组不会给任何人分配积分", user.id, user.full_name)
         
         # 处理积分奖励 - 只有在找到有效邀请人的情况下才执行
         if inviter_id:
@@ -689,27 +494,19 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 rule = await get_point_rule(group)
                 if rule and rule.invite_points > 0:
                     # 检查是否达到每日限制
-                    @sync_to_async
+                    @db_sync_to_async
                     def check_daily_limit_and_add_points():
-                        from .models import User, PointTransaction, Invite, DailyInviteStat
-                        from django.db.models import Sum, Count
-                        from django.utils import timezone
-                        import datetime
-                        
                         try:
                             # 获取今天的日期
                             today = timezone.now().date()
-                            tomorrow = today + datetime.timedelta(days=1)
-                            today_start = timezone.make_aware(datetime.datetime.combine(today, datetime.time.min))
-                            today_end = timezone.make_aware(datetime.datetime.combine(tomorrow, datetime.time.min))
                             
                             # 查找邀请人在数据库中的记录
-                            logger.info(f"开始处理邀请奖励: 邀请人={inviter_id} ({inviter_name}), 被邀请人={user.id} ({user.full_name}), 群组ID={chat.id}")
+                            logger.debug("开始处理邀请奖励: 邀请人=%s (%s), 被邀请人=%s (%s), 群组ID=%s", inviter_id, inviter_name, user.id, user.full_name, chat.id)
                             inviter_user = User.objects.filter(telegram_id=inviter_id, group__group_id=chat.id).first()
                             if not inviter_user:
                                 # 如果不存在，创建用户记录
                                 group_obj = Group.objects.get(group_id=chat.id)
-                                logger.info(f"邀请人 {inviter_id} 在数据库中不存在，创建新记录")
+                                logger.debug("邀请人 %s 在数据库中不存在，创建新记录", inviter_id)
                                 inviter_user = User.objects.create(
                                     telegram_id=inviter_id,
                                     username=None,  # 没有这个信息
@@ -718,16 +515,16 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                                     group=group_obj,
                                     points=0
                                 )
-                                logger.info(f"为用户 {inviter_id} 创建了新记录，ID={inviter_user.id}")
+                                logger.debug("为用户 %s 创建了新记录，ID=%s", inviter_id, inviter_user.id)
                             else:
-                                logger.info(f"找到邀请人记录: ID={inviter_user.id}, 当前积分={inviter_user.points}")
+                                logger.debug("找到邀请人记录: ID=%s, 当前积分=%s", inviter_user.id, inviter_user.points)
                             
                             # 找到被邀请人的用户记录
                             invitee_user = User.objects.filter(telegram_id=user.id, group__group_id=chat.id).first()
                             if not invitee_user:
                                 # 如果不存在，创建用户记录
                                 group_obj = Group.objects.get(group_id=chat.id)
-                                logger.info(f"被邀请人 {user.id} 在数据库中不存在，创建新记录")
+                                logger.debug("被邀请人 %s 在数据库中不存在，创建新记录", user.id)
                                 invitee_user = User.objects.create(
                                     telegram_id=user.id,
                                     username=user.username,
@@ -736,9 +533,9 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                                     group=group_obj,
                                     points=0
                                 )
-                                logger.info(f"为用户 {user.id} 创建了新记录，ID={invitee_user.id}")
+                                logger.debug("为用户 %s 创建了新记录，ID=%s", user.id, invitee_user.id)
                             else:
-                                logger.info(f"找到被邀请人记录: ID={invitee_user.id}, 当前积分={invitee_user.points}")
+                                logger.debug("找到被邀请人记录: ID=%s, 当前积分=%s", invitee_user.id, invitee_user.points)
                             
                             # 检查今日邀请数量而不是积分
                             today_invite_count = Invite.objects.filter(
@@ -746,25 +543,26 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                                 invite_date=today
                             ).count()
                             
-                            logger.info(f"用户 {inviter_id} 今日已邀请 {today_invite_count} 人，奖励规则积分={rule.invite_points}, 每日限制={rule.invite_daily_limit}")
+                            logger.debug("用户 %s 今日已邀请 %s 人，奖励规则积分=%s, 每日限制=%s", inviter_id, today_invite_count, rule.invite_points, rule.invite_daily_limit)
                             
                             # 检查是否达到每日限制
                             if rule.invite_daily_limit > 0 and today_invite_count >= rule.invite_daily_limit:
-                                logger.info(f"用户 {inviter_id} 今天已达到邀请人数上限 {rule.invite_daily_limit} 人")
+                                logger.debug("用户 %s 今天已达到邀请人数上限 %s 人", inviter_id, rule.invite_daily_limit)
                                 return False, today_invite_count, rule.invite_daily_limit
                             
                             # 检查是否已经存在邀请记录
                             existing_invite = Invite.objects.filter(inviter=inviter_user, invitee=invitee_user).first()
                             if existing_invite:
-                                logger.info(f"已存在邀请记录：{inviter_id} 邀请 {user.id}，创建于 {existing_invite.created_at}")
-                                logger.info(f"⚠️ 不给予积分：用户 {user.full_name} (ID: {user.id}) 已被 {inviter_name} (ID: {inviter_id}) 邀请过此群组，重复邀请不计分")
+                                logger.debug("已存在邀请记录：%s 邀请 %s，创建于 %s", inviter_id, user.id, existing_invite.created_at)
+                                logger.debug("⚠️ 不给予积分：用户 %s (ID: %s) 已被 %s (ID: %s) 邀请过此群组，重复邀请不计分", user.full_name, user.id, inviter_name, inviter_id)
                                 return False, today_invite_count, rule.invite_daily_limit
                             
-                            # 增加积分
+                            # 增加积分（F() 原子累加）
                             previous_points = inviter_user.points
+                            User.objects.filter(pk=inviter_user.pk).update(points=F('points') + rule.invite_points)
+                            apply_points_delta(group.id, inviter_user.pk, rule.invite_points)
                             inviter_user.points += rule.invite_points
-                            inviter_user.save()
-                            logger.info(f"用户 {inviter_id} 积分已更新: {previous_points} -> {inviter_user.points} (+{rule.invite_points})")
+                            logger.debug("用户 %s 积分已更新: %s -> %s (+%s)", inviter_id, previous_points, inviter_user.points, rule.invite_points)
                             
                             # 记录积分变动
                             transaction = PointTransaction.objects.create(
@@ -775,7 +573,7 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                                 description=f"邀请用户 {user.full_name} 加入群组",
                                 transaction_date=today
                             )
-                            logger.info(f"创建积分交易记录 ID: {transaction.id}, 数量: {rule.invite_points}, 描述: {transaction.description}")
+                            logger.debug("创建积分交易记录 ID: %s, 数量: %s, 描述: %s", transaction.id, rule.invite_points, transaction.description)
                             
                             # 创建邀请记录
                             invite = Invite.objects.create(
@@ -785,7 +583,7 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                                 points_awarded=rule.invite_points,
                                 invite_date=today
                             )
-                            logger.info(f"创建了邀请记录: {inviter_name} 邀请 {user.full_name}, 记录ID: {invite.id}")
+                            logger.debug("创建了邀请记录: %s 邀请 %s, 记录ID: %s", inviter_name, user.full_name, invite.id)
                             
                             # 更新每日邀请统计
                             daily_stat, created = DailyInviteStat.objects.get_or_create(
@@ -803,7 +601,7 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                                 daily_stat.points_awarded += rule.invite_points
                                 daily_stat.save()
                                 
-                            logger.info(f"更新了每日邀请统计: {inviter_name} 今日已邀请 {daily_stat.invite_count} 人，获得 {daily_stat.points_awarded} 积分")
+                            logger.debug("更新了每日邀请统计: %s 今日已邀请 %s 人，获得 %s 积分", inviter_name, daily_stat.invite_count, daily_stat.points_awarded)
                             
                             return True, today_invite_count + 1, rule.invite_daily_limit
                         except Exception as e:
@@ -812,39 +610,28 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     
                     success, today_points, daily_limit = await check_daily_limit_and_add_points()
                     if success:
-                        logger.info(f"用户 {inviter_id} ({inviter_name}) 成功获得 {rule.invite_points} 积分，今日总计: {today_points}")
+                        logger.info("用户 %s (%s) 成功获得 %s 积分，今日总计: %s", inviter_id, inviter_name, rule.invite_points, today_points)
                         
                         # 发送通知
                         try:
+                            # 通知经由发送队列异步发送，不等待发送完成（群组限速时可能排队较久），失败由队列记录日志
                             # 给邀请人发送私聊通知
                             limit_text = f"，今日已获得 {today_points}/{daily_limit}" if daily_limit > 0 else ""
                             notification = f"🎉 恭喜！你邀请 {user.full_name} 加入群组 {chat.title} 获得了 {rule.invite_points} 积分{limit_text}"
-                            try:
-                                await context.bot.send_message(chat_id=inviter_id, text=notification)
-                            except Exception as e:
-                                logger.warning(f"无法向邀请人发送私聊通知: {e}，尝试在群组内通知")
-                                # 失败时不再尝试，因为用户可能已经在群组欢迎消息中看到相关信息
+                            submit_message(context.bot, chat_id=inviter_id, text=notification)
                             
                             # 在群组中发送欢迎消息
                             welcome_message = f"👋 欢迎 {user.mention_html()} 加入！\n💎 感谢 {inviter_name} 的邀请，已获得 {rule.invite_points} 积分奖励。"
-                            try:
-                                await context.bot.send_message(
-                                    chat_id=chat.id,
-                                    text=welcome_message,
-                                    parse_mode='HTML'
-                                )
-                                logger.info(f"已在群组 {chat.id} 发送欢迎消息")
-                            except Exception as e:
-                                logger.error(f"在群组中发送欢迎消息时出错: {e}")
+                            submit_message(context.bot, chat_id=chat.id, text=welcome_message, parse_mode='HTML')
+                            logger.debug("已提交群组 %s 的欢迎消息", chat.id)
                         except Exception as e:
                             logger.error(f"发送邀请积分通知时出错: {e}")
                     else:
-                        logger.info(f"用户 {inviter_id} 未能获得邀请积分，可能已达到每日限制")
+                        logger.debug("用户 %s 未能获得邀请积分，可能已达到每日限制", inviter_id)
                     
                     # 检查是否是因为重复邀请而未给积分
-                    @sync_to_async
+                    @db_sync_to_async
                     def check_invite_reason():
-                        from .models import User, Invite
                         inviter_user = User.objects.filter(telegram_id=inviter_id, group__group_id=chat.id).first()
                         invitee_user = User.objects.filter(telegram_id=user.id, group__group_id=chat.id).first()
                         if inviter_user and invitee_user:
@@ -869,39 +656,43 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                         if reason == "duplicate":
                             formatted_date = detail.strftime("%Y-%m-%d %H:%M:%S") if detail else "之前"
                             notification = f"⚠️ 提示：你已经在 {formatted_date} 邀请过用户 {user.full_name} 加入群组 {chat.title}，重复邀请不会获得额外积分。"
-                            try:
-                                await context.bot.send_message(chat_id=inviter_id, text=notification)
-                                logger.info(f"已向用户 {inviter_id} 发送重复邀请提示")
-                            except Exception as e:
-                                logger.warning(f"无法向邀请人发送重复邀请提示: {e}")
+                            submit_message(context.bot, chat_id=inviter_id, text=notification)
+                            logger.debug("已提交用户 %s 的重复邀请提示", inviter_id)
                         elif reason == "limit":
                             notification = f"⚠️ 提示：你今日已达到邀请上限 ({rule.invite_daily_limit} 人)，无法获得更多邀请积分。"
-                            try:
-                                await context.bot.send_message(chat_id=inviter_id, text=notification)
-                                logger.info(f"已向用户 {inviter_id} 发送达到邀请上限提示")
-                            except Exception as e:
-                                logger.warning(f"无法向邀请人发送达到邀请上限提示: {e}")
+                            submit_message(context.bot, chat_id=inviter_id, text=notification)
+                            logger.debug("已提交用户 %s 的达到邀请上限提示", inviter_id)
                         
                         # 无论如何都在群组中发送欢迎消息，但不提及积分
                         welcome_message = f"👋 欢迎 {user.mention_html()} 加入群组！"
-                        await context.bot.send_message(
-                            chat_id=chat.id,
-                            text=welcome_message,
-                            parse_mode='HTML'
-                        )
-                        logger.info(f"已在群组 {chat.id} 发送普通欢迎消息")
+                        submit_message(context.bot, chat_id=chat.id, text=welcome_message, parse_mode='HTML')
+                        logger.debug("已提交群组 %s 的普通欢迎消息", chat.id)
                     except Exception as e:
                         logger.error(f"发送邀请失败提示时出错: {e}")
     
     # 处理成员离开事件
     elif chat_member_updated.old_chat_member.status in ['member', 'restricted'] and chat_member_updated.new_chat_member.status in ['left', 'kicked']:
-        logger.info(f"用户 {user.id} ({user.full_name}) 离开了群组 {chat.id} ({chat.title})")
+        logger.info("用户 %s (%s) 离开了群组 %s (%s)", user.id, user.full_name, chat.id, chat.title)
+        
+        # 标记成员为非活跃（不能再参与抽奖），清除缓存并从排行榜移除
+        @db_sync_to_async
+        def deactivate_member():
+            entry = get_group_rule(chat.id)
+            if not entry:
+                return None, None
+            member_pks = list(User.objects.filter(telegram_id=user.id, group_id=entry.group_pk).values_list('id', flat=True))
+            User.objects.filter(id__in=member_pks).update(is_active=False)
+            return entry.group_pk, member_pks
         
-        # 这里可以添加处理成员离开的逻辑 
+        group_pk, member_pks = await deactivate_member()
+        if group_pk:
+            forget_member(user.id, group_pk)
+            for member_pk in member_pks:
+                leaderboard.forget_user(group_pk, member_pk)
     
     # 确保所有加入群组的用户都在数据库中有记录
     if chat_member_updated.new_chat_member.status in ['member', 'restricted']:
-        @sync_to_async
+        @db_sync_to_async
         def ensure_user_record():
             from .models import User, Group
             
@@ -918,7 +709,7 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                             group_title=chat.title,
                             is_active=True
                         )
-                        logger.info(f"为群组 {chat.id} ({chat.title}) 创建了新记录")
+                        logger.debug("为群组 %s (%s) 创建了新记录", chat.id, chat.title)
                     
                     # 创建用户记录
                     user_record = User.objects.create(
@@ -929,8 +720,16 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                         group=group_obj,
                         points=0
                     )
-                    logger.info(f"【通用记录创建】为用户 {user.id} ({user.full_name}) 在群组 {chat.id} ({chat.title}) 创建了新记录")
+                    logger.debug("【通用记录创建】为用户 %s (%s) 在群组 %s (%s) 创建了新记录", user.id, user.full_name, chat.id, chat.title)
+                    remember_member(user_record)
+                    leaderboard.add_user(group_obj.id, user_record.id, user_record.points)
                     return True
+                if not user_record.is_active:
+                    # 离开后重新加入
+                    user_record.is_active = True
+                    user_record.save(update_fields=['is_active'])
+                remember_member(user_record)
+                leaderboard.add_user(user_record.group_id, user_record.id, user_record.points)
                 return False
             except Exception as e:
                 logger.error(f"确保用户记录存在时出错: {e}", exc_info=True)
@@ -938,4 +737,4 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         created = await ensure_user_record()
         if created:
-            logger.info(f"已为用户 {user.id} 创建群组 {chat.id} 的记录") 
\ No newline at end of file
+            logger.debug("已为用户 %s 创建群组 %s 的记录", user.id, chat.id) 
\ No newline at end of file
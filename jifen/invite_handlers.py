@@ -1,12 +1,13 @@
 import logging
-import uuid
 import random
 import string
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
-from django.utils import timezone
 from asgiref.sync import sync_to_async
 from .models import Group, PointRule
+from django.db import transaction
+from .rule_cache import invalidate_group_rule
+from .invite_registry import invite_registry
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -292,6 +293,8 @@ async def handle_invite_points_input(update: Update, context: ContextTypes.DEFAU
             # 更新积分值
             rule.invite_points = points
             rule.save()
+            # 规则已变更，事务提交后清除积分规则缓存
+            transaction.on_commit(lambda: invalidate_group_rule(chat_id))
             
             logger.info(f"群组 {group.group_title} (ID: {chat_id}) 的邀请积分已从 {old_points} 更新为 {points}")
             return True, group.group_title
@@ -506,6 +509,8 @@ async def handle_invite_daily_limit_input(update: Update, context: ContextTypes.
                 # 更新每日上限值
                 rule.invite_daily_limit = limit
                 rule.save()
+                # 规则已变更，事务提交后清除积分规则缓存
+                transaction.on_commit(lambda: invalidate_group_rule(chat_id))
                 
                 new_limit_text = "无限制" if limit == 0 else str(limit)
                 logger.info(f"群组 {group.group_title} (ID: {chat_id}) 的每日邀请上限已从 {old_limit_text} 更新为 {new_limit_text}")
@@ -709,26 +714,19 @@ async def create_group_invite_link(update: Update, context: ContextTypes.DEFAULT
         bot_username = (await context.bot.get_me()).username
         tracked_url = f"https://t.me/{bot_username}?start=invite_{invite_code}"
         
-        # 初始化bot_data的pending_invites字典
-        if "pending_invites" not in context.bot_data:
-            context.bot_data["pending_invites"] = {}
-        
-        # 保存邀请信息，确保group_id保持原始格式
-        invite_data = {
-            "inviter_id": user.id,
-            "inviter_name": user.full_name,
-            "group_id": group_id,
-            "group_title": group_title,
-            "created_at": timezone.now().isoformat(),
-            "link_url": link_url,
-            "is_official_invite": True,  # 标记这是正式的邀请链接，加入时该用户肯定应该获得邀请积分
-        }
-        
-        context.bot_data["pending_invites"][invite_code] = invite_data
+        # 保存邀请信息到邀请链接登记表（标记为正式邀请链接，加入时该用户肯定应该获得邀请积分）
+        invite_record = await sync_to_async(invite_registry.create)(
+            code=invite_code,
+            inviter_id=user.id,
+            inviter_name=user.full_name,
+            group_id=group_id,
+            group_title=group_title,
+            link_url=link_url,
+            is_official_invite=True
+        )
         
-        logger.info(f"创建邀请链接: 邀请人={user.id} ({user.full_name}), 群组ID类型={type(group_id)}, 值={group_id}, 链接={link_url}")
+        logger.info(f"创建邀请链接: 邀请人={user.id} ({user.full_name}), 群组ID={invite_record.group_id}, 链接={link_url}")
         logger.info(f"保存邀请记录: 邀请码={invite_code}, 官方标记=True, Tracking URL={tracked_url}")
-        logger.info(f"完整邀请记录数据: {invite_data}")
         
         # 构建消息文本
         message_text = (
@@ -776,29 +774,15 @@ async def handle_invite_start_parameter(update: Update, context: ContextTypes.DE
     invite_code = context.args[0].replace("invite_", "")
     logger.info(f"用户 {user.id} ({user.full_name}) 通过邀请链接 {invite_code} 启动机器人")
     
-    # 检查邀请码是否有效
-    if "pending_invites" in context.bot_data and invite_code in context.bot_data["pending_invites"]:
-        invite_data = context.bot_data["pending_invites"][invite_code]
-        logger.info(f"找到邀请记录: {invite_code}, 数据: {invite_data}")
-        
-        # 记录邀请关系
-        logger.info(f"找到邀请关系: {invite_data['inviter_name']} 邀请了 {user.full_name}")
-        
-        # 确保group_id是整数格式，而不是字符串
-        group_id = invite_data['group_id']
-        if isinstance(group_id, str) and group_id.isdigit():
-            group_id = int(group_id)
-            invite_data['group_id'] = group_id
-            logger.info(f"将群组ID从字符串转换为整数: {group_id}")
-        
-        # 更新邀请数据，添加被邀请人信息
-        invite_data["user_id"] = user.id
-        invite_data["user_name"] = user.full_name
-        invite_data["joined_at"] = timezone.now().isoformat()
-        
-        # 保存更新后的数据
-        context.bot_data["pending_invites"][invite_code] = invite_data
-        logger.info(f"更新了邀请记录: {invite_code}, 新数据: {invite_data}")
+    # 检查邀请码是否有效，并记录被邀请人信息
+    invite_record = await sync_to_async(invite_registry.mark_started)(invite_code, user.id, user.full_name)
+    if invite_record:
+        logger.info(f"找到邀请关系: {invite_record.inviter_name} 邀请了 {user.full_name}, 邀请码={invite_code}, 群组ID={invite_record.group_id}")
+        invite_data = {
+            "group_id": invite_record.group_id,
+            "group_title": invite_record.group_title,
+            "inviter_name": invite_record.inviter_name,
+        }
         
         # 尝试获取群组信息以提供更好的用户体验
         try:
@@ -855,12 +839,9 @@ async def handle_invite_start_parameter(update: Update, context: ContextTypes.DE
             "3. 如果按钮无法使用，请复制这个链接加入群组: " + invite_link
         )
         
-        # 将邀请记录设置为持久化，确保不被清理
-        logger.info(f"已将邀请记录 {invite_code} 持久化保存")
-        
         return True
     else:
-        logger.warning(f"未找到有效的邀请码: {invite_code}, pending_invites存在: {('pending_invites' in context.bot_data)}")
+        logger.warning(f"未找到有效的邀请码: {invite_code}")
         
         # 给用户一个友好的错误提示
         await update.message.reply_text(
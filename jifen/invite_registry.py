@@ -0,0 +1,369 @@
+"""
+邀请链接登记
+
+邀请链接保存在 InviteLink 表中（重启不丢失），同时在内存中维护几个二级索引，
+成员加入时按以下方式直接定位邀请记录，不再遍历全部邀请：
+- (群组ID, 链接核心部分) -> 邀请码，被截断的链接按前缀在有序列表中二分查找
+- (邀请人ID, 群组ID) -> 邀请码
+- 群组ID -> 最近创建的正式邀请码
+- (被邀请人ID, 群组ID) -> 邀请码，被邀请人ID -> 最近启动的邀请码
+
+内存中只保存有限的记录：
+- 启动时只加载匹配窗口内的邀请（48 小时内创建，或 30 分钟内有被邀请人启动机器人），
+  更早的邀请链接在按邀请码/链接/邀请人查找未命中时再从数据库读取
+- 记录按最近使用做 LRU 淘汰，最多保留 INVITE_REGISTRY_CACHE_SIZE 条，淘汰时同时清除各个二级索引
+
+回查数据库只在内存索引未命中时进行，同一查询在 INVITE_REGISTRY_RECHECK_INTERVAL 秒内只回查一次。
+按群组/被邀请人的时间窗口匹配在单进程运行时完全使用内存索引（本进程是唯一的写入方）；
+分片模式下（set_shared(True)）邀请链接可能由其他进程创建或更新（例如在私聊所在的分片中生成链接、
+记录被邀请人启动机器人，而成员加入由群组所在的分片处理），此时这两类匹配也按上述间隔回查数据库。
+
+所有函数都是同步函数（首次使用时会从数据库加载），需在线程中调用。
+"""
+import bisect
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import InviteLink
+
+logger = logging.getLogger(__name__)
+
+# 基于群组和创建时间的兜底匹配只考虑该时间内创建的邀请
+GROUP_MATCH_WINDOW = datetime.timedelta(hours=48)
+# 通过机器人跟踪链接启动后，在该时间内加入任意群组都视为该邀请
+USER_MATCH_WINDOW = datetime.timedelta(minutes=30)
+
+
+def extract_link_core(url):
+    """提取邀请链接的核心部分（https://t.me/+XXXX 或 https://t.me/c/XXXX 中的 XXXX）"""
+    if not url:
+        return ""
+    if "+" in url:
+        return url.split("+", 1)[1]
+    if "/c/" in url:
+        return url.split("/c/", 1)[1]
+    return url
+
+
+def _strip_truncation(core):
+    """非本机器人创建的链接会被 Telegram 截断并以省略号结尾，返回 (前缀, 是否被截断)"""
+    for suffix in ("…", "..."):
+        if core.endswith(suffix):
+            return core[:-len(suffix)], True
+    return core, False
+
+
+@dataclass
+class InviteRecord:
+    """InviteLink 的内存副本"""
+    code: str
+    inviter_id: int
+    inviter_name: Optional[str]
+    group_id: int
+    group_title: Optional[str]
+    link_url: Optional[str]
+    link_core: Optional[str]
+    is_official_invite: bool
+    created_at: datetime.datetime
+    user_id: Optional[int] = None
+    user_name: Optional[str] = None
+    joined_at: Optional[datetime.datetime] = None
+    last_invitee_id: Optional[int] = None
+    last_invitee_name: Optional[str] = None
+    last_used_at: Optional[datetime.datetime] = None
+    matched_by: Optional[str] = None
+
+
+_RECORD_FIELDS = [f.name for f in fields(InviteRecord)]
+
+
+class InviteRegistry:
+    """邀请链接的内存索引（有界 LRU），数据以 InviteLink 表为准，线程安全"""
+
+    def __init__(self, max_size=20000, recheck_interval=10):
+        self.max_size = max_size
+        self.recheck_interval = recheck_interval
+        self.evictions = 0
+        # 是否有其他进程同时写入邀请链接（分片模式）
+        self._shared = False
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._by_code: 'OrderedDict[str, InviteRecord]' = OrderedDict()
+        self._by_group_core: Dict[Tuple[int, str], str] = {}
+        self._group_cores: Dict[int, List[str]] = {}
+        self._by_inviter_group: Dict[Tuple[int, int], str] = {}
+        self._latest_official: Dict[int, str] = {}
+        self._by_user_group: Dict[Tuple[int, int], str] = {}
+        self._latest_by_user: Dict[int, str] = {}
+        # 查询键 -> 下次允许回查数据库的时间
+        self._next_check: Dict[tuple, float] = {}
+
+    def set_shared(self, shared: bool) -> None:
+        """分片模式下由工作进程调用：其他进程也会创建或更新邀请链接"""
+        self._shared = shared
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            now = timezone.now()
+            # 只加载时间窗口匹配可能用到的邀请，最多 max_size 条（优先最新的）
+            rows = list(InviteLink.objects.filter(
+                Q(created_at__gte=now - GROUP_MATCH_WINDOW) | Q(joined_at__gte=now - USER_MATCH_WINDOW)
+            ).order_by('-created_at', '-id').values(*_RECORD_FIELDS)[:self.max_size])
+            for row in reversed(rows):
+                self._index(InviteRecord(**row))
+            self._loaded = True
+            logger.info(f"[邀请登记] 已从数据库加载 {len(rows)} 条匹配窗口内的邀请链接")
+
+    def _db_check_due(self, key) -> bool:
+        """内存未命中时是否回查数据库：同一查询在 recheck_interval 秒内只回查一次"""
+        now = time.monotonic()
+        with self._lock:
+            if self._next_check.get(key, 0) > now:
+                return False
+            if len(self._next_check) >= self.max_size:
+                self._next_check = {k: t for k, t in self._next_check.items() if t > now}
+            self._next_check[key] = now + self.recheck_interval
+            return True
+
+    def _window_check_due(self, key) -> bool:
+        """
+        时间窗口匹配是否需要回查数据库：只有其他进程也会写入，或内存记录被淘汰过
+        （启动加载已覆盖匹配窗口，单进程且未淘汰时内存索引即是完整的）
+        """
+        return (self._shared or self.evictions > 0) and self._db_check_due(key)
+
+    def _lookup(self, code) -> Optional[InviteRecord]:
+        """按邀请码取出记录并标记为最近使用（调用方持有锁）"""
+        record = self._by_code.get(code)
+        if record is not None:
+            self._by_code.move_to_end(code)
+        return record
+
+    def _index(self, record: InviteRecord):
+        """把记录加入各个索引，超出容量时淘汰最久未使用的记录（调用方持有锁）"""
+        self._by_code[record.code] = record
+        self._by_code.move_to_end(record.code)
+        group_id = record.group_id
+        if record.link_core:
+            key = (group_id, record.link_core)
+            if key not in self._by_group_core:
+                bisect.insort(self._group_cores.setdefault(group_id, []), record.link_core)
+            self._by_group_core[key] = record.code
+        self._by_inviter_group[(record.inviter_id, group_id)] = record.code
+        if record.is_official_invite:
+            latest = self._by_code.get(self._latest_official.get(group_id))
+            if latest is None or latest.created_at <= record.created_at:
+                self._latest_official[group_id] = record.code
+        self._index_user(record)
+        while len(self._by_code) > self.max_size:
+            code, evicted = self._by_code.popitem(last=False)
+            self._unindex(code, evicted)
+            self.evictions += 1
+
+    def _unindex(self, code, record: InviteRecord):
+        """从二级索引中移除被淘汰的记录（调用方持有锁）"""
+        group_id = record.group_id
+        if record.link_core and self._by_group_core.get((group_id, record.link_core)) == code:
+            del self._by_group_core[(group_id, record.link_core)]
+            cores = self._group_cores.get(group_id, [])
+            index = bisect.bisect_left(cores, record.link_core)
+            if index < len(cores) and cores[index] == record.link_core:
+                del cores[index]
+            if not cores:
+                self._group_cores.pop(group_id, None)
+        for mapping, key in (
+                (self._by_inviter_group, (record.inviter_id, group_id)),
+                (self._latest_official, group_id),
+                (self._by_user_group, (record.user_id, group_id)),
+                (self._latest_by_user, record.user_id)):
+            if mapping.get(key) == code:
+                del mapping[key]
+
+    def _index_user(self, record: InviteRecord):
+        if record.user_id is None:
+            return
+        self._by_user_group[(record.user_id, record.group_id)] = record.code
+        latest = self._by_code.get(self._latest_by_user.get(record.user_id))
+        if latest is None or latest.joined_at is None or (
+                record.joined_at is not None and latest.joined_at <= record.joined_at):
+            self._latest_by_user[record.user_id] = record.code
+
+    def _load_from_db(self, queryset, limit=None):
+        """从数据库补充记录到索引（其他进程新建或更新的邀请链接），返回加载的记录数"""
+        rows = queryset.values(*_RECORD_FIELDS)
+        if limit is not None:
+            rows = rows[:limit]
+        records = [InviteRecord(**row) for row in rows]
+        with self._lock:
+            for record in records:
+                self._index(record)
+        return len(records)
+
+    def size(self) -> int:
+        self._ensure_loaded()
+        return len(self._by_code)
+
+    def create(self, code, inviter_id, inviter_name, group_id, group_title, link_url,
+               is_official_invite=True) -> InviteRecord:
+        """登记新生成的邀请链接"""
+        self._ensure_loaded()
+        link = InviteLink.objects.create(
+            code=code,
+            inviter_id=inviter_id,
+            inviter_name=inviter_name,
+            group_id=int(group_id),
+            group_title=group_title,
+            link_url=link_url,
+            link_core=extract_link_core(link_url) or None,
+            is_official_invite=is_official_invite,
+        )
+        record = InviteRecord(**{name: getattr(link, name) for name in _RECORD_FIELDS})
+        with self._lock:
+            self._index(record)
+        return record
+
+    def get(self, code) -> Optional[InviteRecord]:
+        """按跟踪邀请码获取邀请记录"""
+        self._ensure_loaded()
+        with self._lock:
+            record = self._lookup(code)
+        if record is None and self._db_check_due(('code', code)) and self._load_from_db(
+                InviteLink.objects.filter(code=code)):
+            with self._lock:
+                record = self._lookup(code)
+        return record
+
+    def mark_started(self, code, user_id, user_name) -> Optional[InviteRecord]:
+        """用户通过跟踪链接启动机器人，记录被邀请人"""
+        self._ensure_loaded()
+        now = timezone.now()
+        if not InviteLink.objects.filter(code=code).update(user_id=user_id, user_name=user_name, joined_at=now):
+            return None
+        if self.get(code) is None:
+            return None
+        with self._lock:
+            record = self._by_code.get(code)
+            if record is None:
+                return None
+            record.user_id = user_id
+            record.user_name = user_name
+            record.joined_at = now
+            self._index_user(record)
+            return record
+
+    def record_use(self, code, invitee_id, invitee_name, matched_by) -> None:
+        """记录邀请链接最近一次被使用（链接可重复使用，不标记为完成）"""
+        now = timezone.now()
+        InviteLink.objects.filter(code=code).update(
+            last_invitee_id=invitee_id,
+            last_invitee_name=invitee_name,
+            last_used_at=now,
+            matched_by=matched_by,
+        )
+        with self._lock:
+            record = self._by_code.get(code)
+            if record is not None:
+                record.last_invitee_id = invitee_id
+                record.last_invitee_name = invitee_name
+                record.last_used_at = now
+                record.matched_by = matched_by
+
+    def find_by_inviter(self, inviter_id, group_id) -> Optional[InviteRecord]:
+        """查找邀请人为该群组创建的邀请链接"""
+        self._ensure_loaded()
+        with self._lock:
+            record = self._lookup(self._by_inviter_group.get((inviter_id, group_id)))
+        if record is None and self._db_check_due(('inviter', inviter_id, group_id)) and self._load_from_db(
+                InviteLink.objects.filter(inviter_id=inviter_id, group_id=group_id).order_by('-created_at'), 1):
+            with self._lock:
+                record = self._lookup(self._by_inviter_group.get((inviter_id, group_id)))
+        return record
+
+    def find_by_link(self, group_id, link_url) -> Optional[InviteRecord]:
+        """按成员加入时使用的邀请链接查找邀请记录"""
+        self._ensure_loaded()
+        core, truncated = _strip_truncation(extract_link_core(link_url))
+        if not core:
+            return None
+        record = self._find_by_core(group_id, core, truncated)
+        if record is None and self._db_check_due(('link', group_id, core, truncated)):
+            links = InviteLink.objects.filter(group_id=group_id)
+            if truncated:
+                links = links.filter(link_core__startswith=core).order_by('link_core')
+            else:
+                links = links.filter(link_core=core)
+            if self._load_from_db(links, 1):
+                record = self._find_by_core(group_id, core, truncated)
+        return record
+
+    def _find_by_core(self, group_id, core, truncated) -> Optional[InviteRecord]:
+        with self._lock:
+            code = self._by_group_core.get((group_id, core))
+            if code is None and truncated:
+                cores = self._group_cores.get(group_id, [])
+                index = bisect.bisect_left(cores, core)
+                if index < len(cores) and cores[index].startswith(core):
+                    code = self._by_group_core[(group_id, cores[index])]
+            return self._lookup(code)
+
+    def find_latest_official(self, group_id) -> Optional[InviteRecord]:
+        """查找该群组最近创建的正式邀请（48小时内）"""
+        self._ensure_loaded()
+        now = timezone.now()
+        with self._lock:
+            record = self._lookup(self._latest_official.get(group_id))
+        if self._window_check_due(('official', group_id)):
+            # 其他进程可能创建了更新的正式邀请
+            newer = InviteLink.objects.filter(
+                group_id=group_id,
+                is_official_invite=True,
+                created_at__gt=max(record.created_at, now - GROUP_MATCH_WINDOW) if record else now - GROUP_MATCH_WINDOW,
+            ).order_by('-created_at')
+            if self._load_from_db(newer, 1):
+                with self._lock:
+                    record = self._lookup(self._latest_official.get(group_id))
+        if record and now - record.created_at <= GROUP_MATCH_WINDOW:
+            return record
+        return None
+
+    def find_by_invitee(self, user_id, group_id) -> Tuple[Optional[InviteRecord], Optional[str]]:
+        """
+        查找用户通过机器人跟踪链接对应的邀请记录
+
+        返回 (邀请记录, 匹配方式)，匹配方式为 'user_group_match' 或 'user_time_match'
+        """
+        self._ensure_loaded()
+        with self._lock:
+            record = self._lookup(self._by_user_group.get((user_id, group_id)))
+        if record is None and self._window_check_due(('invitee', user_id)):
+            # 被邀请人可能在其他进程中通过跟踪链接启动了机器人
+            self._load_from_db(
+                InviteLink.objects.filter(user_id=user_id, joined_at__gte=timezone.now() - USER_MATCH_WINDOW)
+            )
+        with self._lock:
+            record = self._lookup(self._by_user_group.get((user_id, group_id)))
+            if record:
+                return record, 'user_group_match'
+            record = self._lookup(self._latest_by_user.get(user_id))
+        if record and record.joined_at and timezone.now() - record.joined_at <= USER_MATCH_WINDOW:
+            return record, 'user_time_match'
+        return None, None
+
+
+invite_registry = InviteRegistry(
+    max_size=getattr(settings, 'INVITE_REGISTRY_CACHE_SIZE', 20000),
+    recheck_interval=getattr(settings, 'INVITE_REGISTRY_RECHECK_INTERVAL', 10),
+)
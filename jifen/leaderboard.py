@@ -0,0 +1,273 @@
+"""
+群组积分排行榜
+
+每个群组在内存中维护一个按积分排序的有序结构，积分变动时增量更新，
+"我的排名"和"前N名"查询无需对 users 表做 ORDER BY points DESC。
+
+- 启动时用流式查询从数据库重建所有群组的排行榜
+- 发言、签到、邀请、参与抽奖等积分变动在事务提交后调用 apply_points_delta 增量更新
+- 成员离开时从排行榜移除，重新加入时按数据库中的积分加回；查询不在排行榜中的成员时回查数据库
+- 重建期间到达的积分变动先缓冲，重建完成后在新的排行榜上重放，不会丢失
+- 多进程部署或数据库被直接修改时内存数据可能与数据库有偏差，
+  每个群组超过 LEADERBOARD_REBUILD_INTERVAL 秒后的下一次查询会从数据库重建
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+class SortedKeyList:
+    """
+    分桶有序列表：元素分布在若干个有序小列表中，插入、删除为 O(log n + 桶大小)，
+    按名次取值和求名次只需累加前面各桶的长度
+    """
+
+    BUCKET_SIZE = 512
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._buckets: List[list] = [
+            keys[i:i + self.BUCKET_SIZE] for i in range(0, len(keys), self.BUCKET_SIZE)
+        ]
+        # 每个桶的最大值，用于二分定位桶
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def _locate(self, key):
+        index = bisect.bisect_left(self._maxes, key)
+        return min(index, len(self._buckets) - 1)
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            return
+        index = self._locate(key)
+        bucket = self._buckets[index]
+        bisect.insort(bucket, key)
+        self._maxes[index] = bucket[-1]
+        self._len += 1
+        if len(bucket) > self.BUCKET_SIZE * 2:
+            half = len(bucket) // 2
+            self._buckets[index:index + 1] = [bucket[:half], bucket[half:]]
+            self._maxes[index:index + 1] = [bucket[half - 1], bucket[-1]]
+
+    def remove(self, key):
+        if not self._buckets:
+            raise ValueError(key)
+        index = self._locate(key)
+        bucket = self._buckets[index]
+        position = bisect.bisect_left(bucket, key)
+        if position >= len(bucket) or bucket[position] != key:
+            raise ValueError(key)
+        del bucket[position]
+        self._len -= 1
+        if bucket:
+            self._maxes[index] = bucket[-1]
+        else:
+            del self._buckets[index]
+            del self._maxes[index]
+
+    def index(self, key):
+        """返回元素的位置（从0开始）"""
+        index = self._locate(key)
+        bucket = self._buckets[index] if self._buckets else []
+        position = bisect.bisect_left(bucket, key)
+        if position >= len(bucket) or bucket[position] != key:
+            raise ValueError(key)
+        return sum(len(b) for b in self._buckets[:index]) + position
+
+    def head(self, count):
+        """返回前 count 个元素"""
+        result = []
+        for bucket in self._buckets:
+            if len(result) >= count:
+                break
+            result.extend(bucket[:count - len(result)])
+        return result
+
+
+class GroupBoard:
+    """单个群组的排行榜，排序键为 (-积分, 用户主键)，同分时先加入的用户在前"""
+
+    def __init__(self, scores: Dict[int, int]):
+        self.scores = scores
+        self.order = SortedKeyList((-points, user_pk) for user_pk, points in scores.items())
+        self.built_at = time.monotonic()
+
+    def set(self, user_pk, points):
+        old = self.scores.get(user_pk)
+        if old is not None:
+            self.order.remove((-old, user_pk))
+        self.scores[user_pk] = points
+        self.order.add((-points, user_pk))
+
+    def discard(self, user_pk):
+        old = self.scores.pop(user_pk, None)
+        if old is not None:
+            self.order.remove((-old, user_pk))
+
+    def rank(self, user_pk) -> Optional[Tuple[int, int]]:
+        """返回 (名次, 积分)，名次从1开始"""
+        points = self.scores.get(user_pk)
+        if points is None:
+            return None
+        return self.order.index((-points, user_pk)) + 1, points
+
+    def top(self, count) -> List[Tuple[int, int]]:
+        """返回前 count 名的 (用户主键, 积分)"""
+        return [(user_pk, -negative_points) for negative_points, user_pk in self.order.head(count)]
+
+
+class Leaderboard:
+    """所有群组的排行榜，线程安全"""
+
+    def __init__(self, rebuild_interval=3600):
+        self.rebuild_interval = rebuild_interval
+        self._boards: Dict[int, GroupBoard] = {}
+        self._lock = threading.Lock()
+        # 重建期间的积分变动缓冲：全量重建 [(group_pk, user_pk, delta)]，单个群组重建 {group_pk: [[(user_pk, delta)]]}
+        self._all_deltas: Optional[list] = None
+        self._group_deltas: Dict[int, List[list]] = {}
+
+    def _board_queryset(self):
+        return User.objects.filter(is_active=True)
+
+    def rebuild_all(self) -> int:
+        """用流式查询从数据库重建所有群组的排行榜（同步函数），返回加载的用户数"""
+        started = time.monotonic()
+        with self._lock:
+            self._all_deltas = []
+        try:
+            scores: Dict[int, Dict[int, int]] = {}
+            count = 0
+            for group_pk, user_pk, points in self._board_queryset().values_list(
+                    'group_id', 'id', 'points').iterator(chunk_size=5000):
+                scores.setdefault(group_pk, {})[user_pk] = points
+                count += 1
+            boards = {group_pk: GroupBoard(group_scores) for group_pk, group_scores in scores.items()}
+            with self._lock:
+                for group_pk, user_pk, delta in self._all_deltas:
+                    board = boards.get(group_pk)
+                    if board is not None:
+                        board.set(user_pk, board.scores.get(user_pk, 0) + delta)
+                self._boards = boards
+        finally:
+            with self._lock:
+                self._all_deltas = None
+        logger.info(f"[排行榜] 已重建 {len(boards)} 个群组的排行榜，共 {count} 名用户，"
+                    f"耗时 {time.monotonic() - started:.2f} 秒")
+        return count
+
+    def _get_board(self, group_pk) -> GroupBoard:
+        """获取群组排行榜，不存在或已过期时从数据库重建（同步函数）"""
+        with self._lock:
+            board = self._boards.get(group_pk)
+        if board is not None and time.monotonic() - board.built_at < self.rebuild_interval:
+            return board
+
+        deltas = []
+        with self._lock:
+            self._group_deltas.setdefault(group_pk, []).append(deltas)
+        try:
+            scores = dict(self._board_queryset().filter(group_id=group_pk).values_list('id', 'points'))
+            board = GroupBoard(scores)
+            with self._lock:
+                for user_pk, delta in deltas:
+                    board.set(user_pk, board.scores.get(user_pk, 0) + delta)
+                self._boards[group_pk] = board
+        finally:
+            with self._lock:
+                pending = self._group_deltas[group_pk]
+                pending.remove(deltas)
+                if not pending:
+                    del self._group_deltas[group_pk]
+        return board
+
+    def apply_delta(self, group_pk, user_pk, delta):
+        """积分变动后增量更新，排行榜尚未加载的群组跳过（加载时会读取最新积分）"""
+        if not delta:
+            return
+        with self._lock:
+            if self._all_deltas is not None:
+                self._all_deltas.append((group_pk, user_pk, delta))
+            for deltas in self._group_deltas.get(group_pk, ()):
+                deltas.append((user_pk, delta))
+            board = self._boards.get(group_pk)
+            if board is None:
+                return
+            board.set(user_pk, board.scores.get(user_pk, 0) + delta)
+
+    def add_user(self, group_pk, user_pk, points):
+        """成员加入或重新加入群组后按数据库中的积分加入排行榜"""
+        with self._lock:
+            board = self._boards.get(group_pk)
+            if board is not None:
+                board.set(user_pk, points)
+
+    def forget_user(self, group_pk, user_pk):
+        """用户离开群组后从排行榜中移除"""
+        with self._lock:
+            board = self._boards.get(group_pk)
+            if board is not None:
+                board.discard(user_pk)
+
+    def rank(self, group_pk, user_pk) -> Optional[Tuple[int, int, int]]:
+        """返回 (名次, 积分, 群组总人数)，用户不在排行榜中时返回 None（同步函数）"""
+        board = self._get_board(group_pk)
+        with self._lock:
+            result = board.rank(user_pk)
+            if result is not None:
+                return result[0], result[1], len(board.order)
+
+        # 不在排行榜中（如刚加入、尚未获得积分的成员），回查数据库
+        points = self._board_queryset().filter(pk=user_pk, group_id=group_pk).values_list('points', flat=True).first()
+        if points is None:
+            return None
+        with self._lock:
+            if user_pk not in board.scores:
+                board.set(user_pk, points)
+            result = board.rank(user_pk)
+            return result[0], result[1], len(board.order)
+
+    def top(self, group_pk, count) -> List[Tuple[int, int]]:
+        """返回前 count 名的 (用户主键, 积分)（同步函数）"""
+        board = self._get_board(group_pk)
+        with self._lock:
+            return board.top(count)
+
+
+leaderboard = Leaderboard(rebuild_interval=getattr(settings, 'LEADERBOARD_REBUILD_INTERVAL', 3600))
+
+
+def apply_points_delta(group_pk, user_pk, delta):
+    """积分变动后更新排行榜，应在事务提交后调用（例如放在 transaction.on_commit 中）"""
+    try:
+        leaderboard.apply_delta(group_pk, user_pk, delta)
+    except Exception as e:
+        logger.error(f"[排行榜] 更新排行榜时出错: {e}", exc_info=True)
+
+
+async def start_leaderboard():
+    """在后台线程中从数据库重建排行榜（需在事件循环中调用）"""
+    async def rebuild():
+        try:
+            await sync_to_async(leaderboard.rebuild_all, thread_sensitive=False)()
+        except Exception as e:
+            logger.error(f"[排行榜] 重建排行榜时出错: {e}", exc_info=True)
+
+    asyncio.get_running_loop().create_task(rebuild())
@@ -0,0 +1,136 @@
+import asyncio
+import html
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes
+from .db_executor import db_sync_to_async
+from .models import User
+from .rule_cache import get_group_rule
+from .member_cache import get_member
+from .leaderboard import leaderboard
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 排行榜默认显示人数和最大显示人数
+DEFAULT_TOP_COUNT = 20
+MAX_TOP_COUNT = 50
+# 排行榜消息自动删除的等待时间（秒）
+RANK_MESSAGE_TTL = 30
+
+
+def _display_name(row):
+    """排行榜中显示的用户名称"""
+    if row.get('username'):
+        return f"@{row['username']}"
+    name = f"{row.get('first_name') or ''} {row.get('last_name') or ''}".strip()
+    return name or str(row.get('telegram_id'))
+
+
+async def _reply_and_delete_later(message, text):
+    """回复排行榜消息，一段时间后连同用户的命令消息一起删除"""
+    sent_message = await message.reply_text(text, parse_mode="HTML", reply_to_message_id=message.message_id)
+
+    async def delete_later():
+        try:
+            await asyncio.sleep(RANK_MESSAGE_TTL)
+            await sent_message.delete()
+            try:
+                await message.delete()
+            except Exception as e:
+                logger.debug(f"删除用户排行榜查询消息时出错: {e}")
+        except Exception as e:
+            logger.error(f"删除排行榜消息时出错: {e}")
+
+    asyncio.create_task(delete_later())
+
+
+async def rank_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    处理 /rank 命令：回复用户在本群的积分排名
+    """
+    chat = update.effective_chat
+    message = update.message
+    user = update.effective_user
+    if not chat or chat.type not in ["group", "supergroup"] or not message or not user:
+        return
+
+    logger.info(f"用户 {user.id} ({user.full_name}) 在群组 {chat.id} 查询积分排名")
+
+    @db_sync_to_async
+    def get_rank():
+        entry = get_group_rule(chat.id)
+        if not entry:
+            return None
+        member = get_member(user.id, entry.group_pk)
+        if not member or not member.is_active:
+            return None
+        return leaderboard.rank(entry.group_pk, member.pk)
+
+    try:
+        result = await get_rank()
+        if not result:
+            await _reply_and_delete_later(message, "❌ 查询失败，请确保您已在系统中注册。")
+            return
+
+        position, points, total = result
+        await _reply_and_delete_later(
+            message,
+            f"🏅 <b>{html.escape(user.full_name)}</b> 的积分排名：\n\n"
+            f"当前积分：<b>{points}</b> 分\n"
+            f"群内排名：第 <b>{position}</b> 名 / 共 {total} 人"
+        )
+    except Exception as e:
+        logger.error(f"查询积分排名时出错: {e}", exc_info=True)
+
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    处理 /top [人数] 命令和群内"排行榜"消息：回复本群积分前N名
+    """
+    chat = update.effective_chat
+    message = update.message
+    if not chat or chat.type not in ["group", "supergroup"] or not message:
+        return
+
+    count = DEFAULT_TOP_COUNT
+    if context.args:
+        try:
+            count = max(1, min(MAX_TOP_COUNT, int(context.args[0])))
+        except ValueError:
+            pass
+
+    @db_sync_to_async
+    def get_top():
+        entry = get_group_rule(chat.id)
+        if not entry:
+            return None
+        top = leaderboard.top(entry.group_pk, count)
+        names = {
+            row['id']: _display_name(row)
+            for row in User.objects.filter(id__in=[user_pk for user_pk, _ in top]).values(
+                'id', 'telegram_id', 'username', 'first_name', 'last_name'
+            )
+        }
+        return [(names.get(user_pk, str(user_pk)), points) for user_pk, points in top]
+
+    try:
+        top = await get_top()
+        if top is None:
+            await _reply_and_delete_later(message, "❌ 本群尚未启用积分功能。")
+            return
+        if not top:
+            await _reply_and_delete_later(message, "📊 本群暂无积分记录。")
+            return
+
+        medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+        lines = [
+            f"{medals.get(position, f'{position}.')} {html.escape(name)}：<b>{points}</b> 分"
+            for position, (name, points) in enumerate(top, start=1)
+        ]
+        await _reply_and_delete_later(
+            message,
+            f"📊 <b>{html.escape(chat.title or '本群')}</b> 积分排行榜（前 {len(top)} 名）：\n\n" + "\n".join(lines)
+        )
+    except Exception as e:
+        logger.error(f"查询积分排行榜时出错: {e}", exc_info=True)
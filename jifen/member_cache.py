@@ -0,0 +1,164 @@
+"""
+群组成员缓存
+
+发言、签到等高频路径每次都要按 (telegram_id, 群组) 查询 jifen.User。
+这里用有界 LRU 缓存保存 (telegram_id, Group 主键) -> 用户精简记录 (主键, 是否活跃, 是否管理员)，
+由 group_handlers 在成员加入、更新和群组失效时预热或清除。
+缓存中不保存积分，需要积分的地方仍应读取数据库或使用 F() 表达式更新。
+
+分片模式下成员加入和离开由群组所在的进程处理，而私聊中的操作在用户所在的进程中读取缓存，
+因此成员变化通过 cache_invalidation 广播给所有进程（'member' / 'member_group'）；
+条目另有 MEMBERSHIP_CACHE_TTL 秒的过期时间，失效消息丢失时也只会短时间不一致。
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+from . import cache_invalidation
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MemberRecord:
+    """jifen.User 的精简记录"""
+    pk: int
+    telegram_id: int
+    group_pk: int
+    is_active: bool
+    is_admin: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> 'MemberRecord':
+        return cls(
+            pk=user.id,
+            telegram_id=user.telegram_id,
+            group_pk=user.group_id,
+            is_active=user.is_active,
+            is_admin=user.is_admin,
+        )
+
+    def user_ref(self) -> User:
+        """返回只带主键等基本字段的 User 实例，仅用于外键查询和创建关联记录，不要调用 save()"""
+        return User(
+            id=self.pk,
+            telegram_id=self.telegram_id,
+            group_id=self.group_pk,
+            is_active=self.is_active,
+            is_admin=self.is_admin,
+        )
+
+
+class MembershipCache:
+    """(telegram_id, Group 主键) -> MemberRecord 的有界 LRU 缓存（条目 ttl 秒后过期），线程安全"""
+
+    def __init__(self, max_size=50000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        # 键 -> (成员记录, 过期时间)
+        self._entries: 'OrderedDict[Tuple[int, int], Tuple[MemberRecord, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, telegram_id: int, group_pk: int) -> Optional[MemberRecord]:
+        """
+        获取成员记录（同步函数，需在线程中调用）
+
+        未命中时查询数据库，用户不存在时返回 None（不缓存不存在的结果）
+        """
+        key = (telegram_id, group_pk)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        row = User.objects.filter(telegram_id=telegram_id, group_id=group_pk).values(
+            'id', 'is_active', 'is_admin'
+        ).first()
+        if not row:
+            return None
+
+        record = MemberRecord(
+            pk=row['id'],
+            telegram_id=telegram_id,
+            group_pk=group_pk,
+            is_active=row['is_active'],
+            is_admin=row['is_admin'],
+        )
+        self._put(key, record)
+        return record
+
+    def remember(self, user: User) -> None:
+        """用已保存的 User 实例预热缓存"""
+        record = MemberRecord.from_user(user)
+        self._put((record.telegram_id, record.group_pk), record)
+
+    def _put(self, key: Tuple[int, int], record: MemberRecord) -> None:
+        with self._lock:
+            self._entries[key] = (record, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def forget(self, telegram_id: int, group_pk: int) -> None:
+        """清除单个成员的缓存"""
+        with self._lock:
+            self._entries.pop((telegram_id, group_pk), None)
+
+    def forget_group(self, group_pk: int) -> None:
+        """清除某个群组的全部成员缓存"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == group_pk]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        """返回缓存命中统计"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+
+membership_cache = MembershipCache(
+    max_size=getattr(settings, 'MEMBERSHIP_CACHE_SIZE', 50000),
+    ttl=getattr(settings, 'MEMBERSHIP_CACHE_TTL', 300),
+)
+
+cache_invalidation.register('member', lambda key: membership_cache.forget(*key))
+cache_invalidation.register('member_group', membership_cache.forget_group)
+
+
+def get_member(telegram_id: int, group_pk: int) -> Optional[MemberRecord]:
+    """获取成员精简记录（同步函数）"""
+    return membership_cache.get(telegram_id, group_pk)
+
+
+def remember_member(user: User) -> None:
+    """成员加入或信息更新后预热本进程缓存，并使其他进程中的旧记录失效"""
+    cache_invalidation.invalidate('member', (user.telegram_id, user.group_id))
+    membership_cache.remember(user)
+
+
+def forget_member(telegram_id: int, group_pk: int) -> None:
+    """成员离开或状态变化后清除缓存（包括其他进程）"""
+    cache_invalidation.invalidate('member', (telegram_id, group_pk))
+
+
+def forget_group_members(group_pk: int) -> None:
+    """群组失效后清除该群组的全部成员缓存（包括其他进程）"""
+    cache_invalidation.invalidate('member_group', group_pk)
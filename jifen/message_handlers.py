@@ -1,10 +1,17 @@
 import logging
+import time
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, Chat
 from telegram.ext import ContextTypes
 from django.utils import timezone
 from asgiref.sync import sync_to_async
 from .models import Group, PointRule, DailyMessageStat, MessagePoint, PointTransaction, User
+from .message_ledger import message_ledger
+from .rule_cache import get_group_rule, invalidate_group_rule
+from .db_executor import db_sync_to_async
+from .member_cache import get_member
+from .leaderboard import apply_points_delta
 from django.db import transaction
+from django.db.models import F
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -294,6 +301,8 @@ async def handle_message_points_input(update: Update, context: ContextTypes.DEFA
                 # 更新积分值
                 rule.message_points = points
                 rule.save()
+                # 规则已变更，事务提交后清除积分规则缓存
+                transaction.on_commit(lambda: invalidate_group_rule(chat_id))
                 
                 # 确认数据已保存
                 rule_check = PointRule.objects.get(id=rule.id)
@@ -488,6 +497,8 @@ async def handle_daily_limit_input(update: Update, context: ContextTypes.DEFAULT
                 # 更新每日上限值
                 rule.message_daily_limit = limit
                 rule.save()
+                # 规则已变更，事务提交后清除积分规则缓存
+                transaction.on_commit(lambda: invalidate_group_rule(chat_id))
                 
                 # 确认数据已保存
                 rule_check = PointRule.objects.get(id=rule.id)
@@ -683,6 +694,8 @@ async def handle_min_length_input(update: Update, context: ContextTypes.DEFAULT_
                 # 更新最小字数长度限制值
                 rule.message_min_length = min_length
                 rule.save()
+                # 规则已变更，事务提交后清除积分规则缓存
+                transaction.on_commit(lambda: invalidate_group_rule(chat_id))
                 
                 new_length_text = "无限制" if min_length == 0 else str(min_length)
                 logger.info(f"群组 {group.group_title} (ID: {chat_id}) 的最小字数长度限制已从 {old_length_text} 更新为 {new_length_text}")
@@ -755,7 +768,7 @@ async def process_message_points(update: Update, context: ContextTypes.DEFAULT_T
     # 跳过非群组消息
     chat = update.effective_chat
     if chat.type not in [Chat.GROUP, Chat.SUPERGROUP]:
-        logger.debug(f"跳过非群组消息，当前类型: {chat.type}")
+        logger.debug("跳过非群组消息，当前类型: %s", chat.type)
         return
     
     # 获取消息内容和发送者
@@ -764,55 +777,56 @@ async def process_message_points(update: Update, context: ContextTypes.DEFAULT_T
     chat_id = chat.id
     message_id = update.message.message_id
     
-    logger.info(f"开始处理群组 {chat_id} 中用户 {user.id} ({user.full_name}) 的发言积分, 消息ID: {message_id}, 消息内容: {text[:20]}...")
+    started = time.perf_counter()
     
     try:
         # 处理发言积分
-        @sync_to_async
+        @db_sync_to_async
         def process_message_points_for_user(chat_id, user_id, message_id, text):
             try:
-                # 获取群组对象
-                logger.info(f"尝试获取群组对象: {chat_id}")
-                group = Group.objects.get(group_id=chat_id, is_active=True)
-                logger.info(f"成功获取群组: {group.group_title} (ID: {group.id})")
+                # 从缓存获取群组及其积分规则
+                entry = get_group_rule(chat_id)
+                if not entry:
+                    logger.debug("群组 %s 不存在或非活跃", chat_id)
+                    return None, None, None
                 
-                # 获取该群组的积分规则
-                logger.info(f"尝试获取群组积分规则")
-                rule = PointRule.objects.filter(group=group).first()
-                logger.info(f"积分规则获取结果: {'成功' if rule else '失败'}")
+                group = entry.group_ref()
+                rule = entry.rule
                 
                 if not rule:
-                    logger.warning(f"群组 {chat_id} 未设置积分规则")
+                    logger.debug("群组 %s 未设置积分规则", chat_id)
                     return None, None, None
                 
-                logger.info(f"积分规则: points_enabled={rule.points_enabled}, message_points={rule.message_points}, daily_limit={rule.message_daily_limit}, min_length={rule.message_min_length}")
                 
                 if not rule.points_enabled:
-                    logger.warning(f"群组 {chat_id} 的积分功能已关闭")
+                    logger.debug("群组 %s 的积分功能已关闭", chat_id)
                     return None, None, None
                 
                 # 检查消息是否与签到关键字匹配，如果匹配则跳过长度检查
                 if text == rule.checkin_keyword:
-                    logger.info(f"消息 '{text}' 与签到关键字 '{rule.checkin_keyword}' 匹配，跳过长度检查")
+                    logger.debug("消息与签到关键字 %r 匹配，跳过长度检查", rule.checkin_keyword)
                 # 检查消息长度是否满足最小字数要求
                 elif rule.message_min_length > 0 and len(text) < rule.message_min_length:
-                    logger.debug(f"消息长度 {len(text)} 小于最小要求 {rule.message_min_length}")
+                    logger.debug("消息长度 %s 小于最小要求 %s", len(text), rule.message_min_length)
                     return None, None, None
                 
-                # 获取用户对象
-                logger.info(f"尝试获取用户对象: {user_id}")
-                user_obj = User.objects.filter(telegram_id=user_id, group=group, is_active=True).first()
-                if not user_obj:
-                    logger.warning(f"用户 {user_id} 在群组 {chat_id} 中不存在或非活跃")
+                # 从成员缓存获取用户
+                member = get_member(user_id, group.id)
+                if not member or not member.is_active:
+                    logger.debug("用户 %s 在群组 %s 中不存在或非活跃", user_id, chat_id)
                     return None, None, None
                 
-                logger.info(f"成功获取用户: {user_obj.id}, 当前积分: {user_obj.points}")
+                user_obj = member.user_ref()
                 
                 # 检查每日积分上限
                 today = timezone.now().date()
                 
+                # 写后缓冲模式：在内存中判定积分并写入缓冲区，由后台任务批量落库
+                if message_ledger.is_enabled():
+                    points_to_award = message_ledger.record(group, user_obj, rule, message_id, today)
+                    return group, user_obj, points_to_award
+                
                 # 获取用户今日已获得的发言积分
-                logger.info(f"尝试获取用户今日发言统计")
                 daily_stat = DailyMessageStat.objects.filter(
                     user=user_obj,
                     group=group,
@@ -821,7 +835,6 @@ async def process_message_points(update: Update, context: ContextTypes.DEFAULT_T
                 
                 # 如果没有今日记录，创建一个
                 if not daily_stat:
-                    logger.info(f"未找到今日发言统计，将创建新记录")
                     daily_stat = DailyMessageStat(
                         user=user_obj,
                         group=group,
@@ -830,11 +843,11 @@ async def process_message_points(update: Update, context: ContextTypes.DEFAULT_T
                         points_awarded=0
                     )
                 else:
-                    logger.info(f"今日已发言 {daily_stat.message_count} 次，已获得 {daily_stat.points_awarded} 积分")
+                    logger.debug("今日已发言 %s 次，已获得 %s 积分", daily_stat.message_count, daily_stat.points_awarded)
                 
                 # 检查是否达到每日上限
                 if rule.message_daily_limit > 0 and daily_stat.points_awarded >= rule.message_daily_limit:
-                    logger.info(f"用户 {user_id} 在群组 {chat_id} 中已达到每日发言积分上限 {rule.message_daily_limit}")
+                    logger.debug("用户 %s 在群组 %s 中已达到每日发言积分上限 %s", user_id, chat_id, rule.message_daily_limit)
                     return group, user_obj, 0
                 
                 # 计算本次可获得的积分
@@ -845,17 +858,14 @@ async def process_message_points(update: Update, context: ContextTypes.DEFAULT_T
                     remaining_points = rule.message_daily_limit - daily_stat.points_awarded
                     if points_to_award > remaining_points:
                         points_to_award = remaining_points
-                    logger.info(f"今日剩余可获得积分: {remaining_points}, 本次将获得: {points_to_award}")
                 
                 # 如果没有积分可获得，直接返回
                 if points_to_award <= 0:
-                    logger.info(f"没有积分可获得，跳过积分更新")
                     return group, user_obj, 0
                 
                 # 创建消息积分记录并更新用户积分
                 with transaction.atomic():
                     try:
-                        logger.info(f"开始事务处理: 创建消息积分记录并更新用户积分")
                         # 创建消息积分记录
                         MessagePoint.objects.create(
                             user=user_obj,
@@ -864,19 +874,15 @@ async def process_message_points(update: Update, context: ContextTypes.DEFAULT_T
                             points_awarded=points_to_award,
                             message_date=today
                         )
-                        logger.info(f"已创建消息积分记录")
                         
-                        # 更新用户积分
-                        old_points = user_obj.points
-                        user_obj.points += points_to_award
-                        user_obj.save()
-                        logger.info(f"已更新用户积分: {old_points} → {user_obj.points}")
+                        # 更新用户积分，使用 F() 原子累加
+                        User.objects.filter(pk=user_obj.pk).update(points=F('points') + points_to_award)
+                        transaction.on_commit(lambda: apply_points_delta(group.id, user_obj.pk, points_to_award))
                         
                         # 更新每日统计
                         daily_stat.message_count += 1
                         daily_stat.points_awarded += points_to_award
                         daily_stat.save()
-                        logger.info(f"已更新每日统计: message_count={daily_stat.message_count}, points_awarded={daily_stat.points_awarded}")
                         
                         # 创建积分变动记录
                         PointTransaction.objects.create(
@@ -887,27 +893,31 @@ async def process_message_points(update: Update, context: ContextTypes.DEFAULT_T
                             description=f"发言获得 {points_to_award} 积分",
                             transaction_date=today
                         )
-                        logger.info(f"已创建积分变动记录")
                         
-                        logger.info(f"用户 {user_id} 在群组 {chat_id} 发言获得 {points_to_award} 积分，当前总积分: {user_obj.points}")
                         return group, user_obj, points_to_award
                     except Exception as e:
                         # 记录具体的错误信息
-                        logger.error(f"创建发言积分记录或更新积分时出错: {e}", exc_info=True)
+                        logger.error("创建发言积分记录或更新积分时出错: %s", e, exc_info=True)
                         # 事务回滚，确保数据一致性
                         raise
-            except Group.DoesNotExist:
-                logger.error(f"群组 {chat_id} 不存在或非活跃")
-                return None, None, None
             except Exception as e:
-                logger.error(f"处理发言积分时出错: {e}", exc_info=True)
+                logger.error("处理发言积分时出错: %s", e, exc_info=True)
                 return None, None, None
         
         # 执行发言积分处理
-        logger.info(f"调用async处理用户 {user.id} 的发言积分")
         group, user_obj, points_awarded = await process_message_points_for_user(chat_id, user.id, message_id, text)
-        logger.info(f"发言积分处理结果: group={group is not None}, user_obj={user_obj is not None}, points_awarded={points_awarded}")
+        # 每条消息只输出一条结构化日志（高频 logger 按 LOG_SAMPLE_RATES 抽样）
+        logger.info(
+            "message_points chat=%s user=%s message=%s outcome=%s points=%s elapsed_ms=%.1f",
+            chat_id, user.id, message_id,
+            'skipped' if points_awarded is None else ('awarded' if points_awarded > 0 else 'limit_reached'),
+            points_awarded or 0, (time.perf_counter() - started) * 1000
+        )
+        
+        # 缓冲区达到批量阈值时立即唤醒刷新任务
+        if points_awarded and message_ledger.is_enabled():
+            message_ledger.notify()
         
         # 不需要发送通知消息，静默增加积分
     except Exception as e:
-        logger.error(f"处理发言积分时出现未捕获异常: {e}", exc_info=True) 
\ No newline at end of file
+        logger.error("处理发言积分时出现未捕获异常: %s", e, exc_info=True)
@@ -0,0 +1,319 @@
+"""
+发言积分写后缓冲账本 (write-behind ledger)
+
+群组发言是最高频的积分来源，逐条同步写库会让每条消息产生多次远程 MySQL 往返。
+开启写后缓冲后，发言积分在内存中按 (群组, 用户, 日期) 判定并累计，
+由后台刷新任务每隔 N 毫秒或累计 M 条事件后批量落库：
+- MessagePoint / PointTransaction 使用 bulk_create 批量插入
+- User.points / DailyMessageStat 使用 F() 表达式原子累加。缓冲区在后台异步写入积分，
+  因此其他地方（签到、邀请、参与抽奖）修改 User.points 时也必须使用 F() 表达式，不能读出后 save() 覆盖
+- 只有 MessagePoint 实际插入成功的事件才会发放积分：重复投递的更新（如 webhook 返回 503 后
+  Telegram 重发）或与已有记录消息ID冲突的事件被丢弃，与逐条同步写库时 IntegrityError 的处理一致
+
+刷新失败的事件会放回缓冲区等待下次重试，机器人退出时会做最后一次同步刷新，
+保证至少一次 (at-least-once) 落库。
+通过 settings.MESSAGE_POINTS_WRITE_BEHIND = False 可回退到原有的逐条同步写库。
+"""
+import asyncio
+import atexit
+import logging
+import threading
+
+from .db_executor import db_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .leaderboard import apply_points_delta
+from .models import DailyMessageStat, MessagePoint, PointTransaction, User
+
+logger = logging.getLogger(__name__)
+
+
+class MessagePointsLedger:
+    """发言积分写后缓冲账本"""
+
+    def __init__(self, flush_interval_ms=1000, flush_max_events=200):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_max_events = flush_max_events
+        # 待落库的发言积分事件
+        self._events = []
+        # 每日发言统计的内存视图: {(group_pk, user_pk, date): {'message_count': n, 'points_awarded': n}}
+        # 已包含尚未落库的部分，用于在内存中判定每日上限
+        self._daily = {}
+        self._lock = threading.Lock()
+        # 防止多个线程同时执行刷新
+        self._flush_lock = threading.Lock()
+        self._wakeup = None
+        self._task = None
+        self._running = False
+
+    def is_enabled(self):
+        """写后缓冲是否生效（需要开关打开且后台刷新任务已启动）"""
+        return getattr(settings, 'MESSAGE_POINTS_WRITE_BEHIND', True) and self._running
+
+    def pending_count(self):
+        """当前缓冲区中待落库的事件数量"""
+        with self._lock:
+            return len(self._events)
+
+    def _load_daily_state(self, group, user_obj, day):
+        """从数据库加载某用户当日的发言统计，作为内存视图的初始值"""
+        daily_stat = DailyMessageStat.objects.filter(
+            user=user_obj,
+            group=group,
+            message_date=day
+        ).first()
+        if daily_stat:
+            return {'message_count': daily_stat.message_count, 'points_awarded': daily_stat.points_awarded}
+        return {'message_count': 0, 'points_awarded': 0}
+
+    def record(self, group, user_obj, rule, message_id, day):
+        """
+        在内存中判定本条消息可获得的积分并写入缓冲区（同步函数，需在线程中调用）
+
+        返回本次获得的积分数，0 表示已达到每日上限
+        """
+        key = (group.id, user_obj.id, day)
+
+        with self._lock:
+            state = self._daily.get(key)
+
+        if state is None:
+            # 首次遇到该用户当天的消息，从数据库加载已有统计
+            loaded = self._load_daily_state(group, user_obj, day)
+            with self._lock:
+                state = self._daily.setdefault(key, loaded)
+
+        with self._lock:
+            # 检查是否达到每日上限
+            if rule.message_daily_limit > 0 and state['points_awarded'] >= rule.message_daily_limit:
+                logger.debug("用户 %s 在群组 %s 中已达到每日发言积分上限 %s", user_obj.telegram_id, group.group_id, rule.message_daily_limit)
+                return 0
+
+            # 计算本次可获得的积分，确保不超过每日上限
+            points_to_award = rule.message_points
+            if rule.message_daily_limit > 0:
+                remaining_points = rule.message_daily_limit - state['points_awarded']
+                points_to_award = min(points_to_award, remaining_points)
+
+            if points_to_award <= 0:
+                return 0
+
+            state['message_count'] += 1
+            state['points_awarded'] += points_to_award
+            self._events.append({
+                'group_id': group.id,
+                'user_id': user_obj.id,
+                'message_id': message_id,
+                'points': points_to_award,
+                'date': day,
+            })
+
+        logger.debug("用户 %s 在群组 %s 的发言积分 %s 已写入缓冲区", user_obj.telegram_id, group.group_id, points_to_award)
+        return points_to_award
+
+    def notify(self):
+        """缓冲区达到批量阈值时唤醒后台刷新任务（需在事件循环中调用）"""
+        if self._wakeup is not None and self.pending_count() >= self.flush_max_events:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        将缓冲区中的事件批量写入数据库（同步函数）
+
+        返回成功落库的事件数量；失败时事件会放回缓冲区等待下次重试
+        """
+        with self._flush_lock:
+            with self._lock:
+                events = self._events
+                self._events = []
+
+            if not events:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    accepted = self._insert_message_points(events)
+
+                    # 按用户、按每日统计聚合增量（只统计实际插入了发言记录的事件）
+                    user_deltas = {}
+                    daily_deltas = {}
+                    for event in accepted:
+                        user_key = (event['group_id'], event['user_id'])
+                        user_deltas[user_key] = user_deltas.get(user_key, 0) + event['points']
+                        daily_key = (event['group_id'], event['user_id'], event['date'])
+                        count, points = daily_deltas.get(daily_key, (0, 0))
+                        daily_deltas[daily_key] = (count + 1, points + event['points'])
+
+                    PointTransaction.objects.bulk_create([
+                        PointTransaction(
+                            user_id=event['user_id'],
+                            group_id=event['group_id'],
+                            amount=event['points'],
+                            type='MESSAGE',
+                            description=f"发言获得 {event['points']} 积分",
+                            transaction_date=event['date']
+                        )
+                        for event in accepted
+                    ])
+
+                    for (group_pk, user_pk), points in user_deltas.items():
+                        User.objects.filter(pk=user_pk).update(points=F('points') + points)
+
+                    for (group_pk, user_pk, day), (count, points) in daily_deltas.items():
+                        self._upsert_daily_stat(group_pk, user_pk, day, count, points)
+            except Exception as e:
+                logger.error(f"批量写入发言积分时出错，{len(events)} 条事件将在下次重试: {e}", exc_info=True)
+                with self._lock:
+                    self._events = events + self._events
+                return 0
+
+            for (group_pk, user_pk), points in user_deltas.items():
+                apply_points_delta(group_pk, user_pk, points)
+
+            accepted_ids = {id(event) for event in accepted}
+            rejected = [event for event in events if id(event) not in accepted_ids]
+            if rejected:
+                self._discard_daily_state(rejected)
+                logger.info(f"丢弃 {len(rejected)} 条重复或消息ID冲突的发言积分事件")
+
+            self._prune_daily_state()
+            logger.info(f"已批量写入 {len(accepted)} 条发言积分事件，涉及 {len(user_deltas)} 个用户")
+            return len(accepted)
+
+    def _insert_message_points(self, events):
+        """
+        插入发言记录，返回实际插入了记录的事件（需在事务中调用）
+
+        同一消息（群组, 消息ID）在缓冲区中重复出现时只保留第一条；
+        消息ID已存在于数据库中（重复投递或与其他群组的消息ID冲突）的事件被丢弃
+        """
+        candidates = []
+        seen = set()
+        for event in events:
+            # message_id 在表中全局唯一，同一批中相同的消息ID只能插入一条
+            if event['message_id'] in seen:
+                continue
+            seen.add(event['message_id'])
+            candidates.append(event)
+
+        existing = set(
+            MessagePoint.objects.filter(message_id__in=seen).values_list('message_id', flat=True)
+        )
+        candidates = [event for event in candidates if event['message_id'] not in existing]
+
+        def build(event):
+            return MessagePoint(
+                user_id=event['user_id'],
+                group_id=event['group_id'],
+                message_id=event['message_id'],
+                points_awarded=event['points'],
+                message_date=event['date']
+            )
+
+        try:
+            with transaction.atomic():
+                MessagePoint.objects.bulk_create([build(event) for event in candidates])
+            return candidates
+        except IntegrityError:
+            # 其他进程同时写入了相同的消息ID，逐条插入以确定哪些事件有效
+            inserted = []
+            for event in candidates:
+                try:
+                    with transaction.atomic():
+                        build(event).save(force_insert=True)
+                    inserted.append(event)
+                except IntegrityError:
+                    pass
+            return inserted
+
+    def _discard_daily_state(self, events):
+        """从每日统计的内存视图中扣除未能落库的事件"""
+        with self._lock:
+            for event in events:
+                state = self._daily.get((event['group_id'], event['user_id'], event['date']))
+                if state is not None:
+                    state['message_count'] -= 1
+                    state['points_awarded'] -= event['points']
+
+    def _upsert_daily_stat(self, group_pk, user_pk, day, count, points):
+        """使用 F() 表达式累加每日发言统计，不存在时创建"""
+        filters = {'group_id': group_pk, 'user_id': user_pk, 'message_date': day}
+        updates = {
+            'message_count': F('message_count') + count,
+            'points_awarded': F('points_awarded') + points,
+        }
+        if DailyMessageStat.objects.filter(**filters).update(**updates):
+            return
+
+        try:
+            with transaction.atomic():
+                DailyMessageStat.objects.create(message_count=count, points_awarded=points, **filters)
+        except IntegrityError:
+            # 并发创建时退回到累加
+            DailyMessageStat.objects.filter(**filters).update(**updates)
+
+    def _prune_daily_state(self):
+        """清理非当日的内存统计，避免无限增长"""
+        today = timezone.now().date()
+        with self._lock:
+            for key in [key for key in self._daily if key[2] != today]:
+                del self._daily[key]
+
+    async def run_flusher(self):
+        """后台刷新任务：每隔 flush_interval 秒或缓冲区满时批量落库"""
+        logger.info(f"发言积分写后缓冲已启动，刷新间隔 {self.flush_interval} 秒，批量阈值 {self.flush_max_events} 条")
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+                try:
+                    await db_sync_to_async(self.flush)()
+                except Exception as e:
+                    logger.error(f"发言积分刷新任务出错: {e}", exc_info=True)
+        finally:
+            self._running = False
+
+    def start(self):
+        """在当前事件循环中启动后台刷新任务"""
+        if self._task is not None and not self._task.done():
+            return self._task
+        self._wakeup = asyncio.Event()
+        self._running = True
+        self._task = asyncio.create_task(self.run_flusher())
+        return self._task
+
+    def shutdown(self):
+        """停止写后缓冲并同步刷新剩余事件（同步函数，在事件循环结束后调用）"""
+        self._running = False
+        # 失败的事件会放回缓冲区，最多重试 3 次
+        for _ in range(3):
+            if not self.pending_count():
+                break
+            self.flush()
+        remaining = self.pending_count()
+        if remaining:
+            logger.error(f"退出时仍有 {remaining} 条发言积分事件未能写入数据库")
+
+
+message_ledger = MessagePointsLedger(
+    flush_interval_ms=getattr(settings, 'MESSAGE_POINTS_FLUSH_INTERVAL_MS', 1000),
+    flush_max_events=getattr(settings, 'MESSAGE_POINTS_FLUSH_MAX_EVENTS', 200),
+)
+
+# 进程退出时兜底刷新
+atexit.register(message_ledger.shutdown)
+
+
+async def start_message_ledger():
+    """启动发言积分写后缓冲（开关关闭时不启动，沿用同步写库）"""
+    if not getattr(settings, 'MESSAGE_POINTS_WRITE_BEHIND', True):
+        logger.info("发言积分写后缓冲未开启，使用同步写库模式")
+        return None
+    return message_ledger.start()
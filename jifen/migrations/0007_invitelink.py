@@ -0,0 +1,56 @@
+# Generated by Django 3.2.24 on 2026-10-18 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jifen', '0006_auto_20250323_1656'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InviteLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(help_text='跟踪邀请码', max_length=32, unique=True)),
+                ('inviter_id', models.BigIntegerField(help_text='邀请人Telegram ID')),
+                ('inviter_name', models.CharField(blank=True, help_text='邀请人名称', max_length=255, null=True)),
+                ('group_id', models.BigIntegerField(help_text='Telegram群组ID')),
+                ('group_title', models.CharField(blank=True, help_text='群组名称', max_length=255, null=True)),
+                ('link_url', models.CharField(blank=True, help_text='群组邀请链接', max_length=255, null=True)),
+                ('link_core', models.CharField(blank=True, help_text='邀请链接核心部分', max_length=128, null=True)),
+                ('is_official_invite', models.BooleanField(default=True, help_text='是否为正式邀请链接')),
+                ('user_id', models.BigIntegerField(blank=True, help_text='通过跟踪链接启动机器人的用户Telegram ID', null=True)),
+                ('user_name', models.CharField(blank=True, help_text='通过跟踪链接启动机器人的用户名称', max_length=255, null=True)),
+                ('joined_at', models.DateTimeField(blank=True, help_text='通过跟踪链接启动机器人的时间', null=True)),
+                ('last_invitee_id', models.BigIntegerField(blank=True, help_text='最近一次被邀请人Telegram ID', null=True)),
+                ('last_invitee_name', models.CharField(blank=True, help_text='最近一次被邀请人名称', max_length=255, null=True)),
+                ('last_used_at', models.DateTimeField(blank=True, help_text='最近一次使用时间', null=True)),
+                ('matched_by', models.CharField(blank=True, help_text='最近一次匹配方式', max_length=32, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='创建时间')),
+            ],
+            options={
+                'verbose_name': '邀请链接',
+                'verbose_name_plural': '邀请链接',
+                'db_table': 'invite_links',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='invitelink',
+            index=models.Index(fields=['group_id', 'link_core'], name='invite_link_group_i_7aab72_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invitelink',
+            index=models.Index(fields=['inviter_id', 'group_id'], name='invite_link_inviter_06f536_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invitelink',
+            index=models.Index(fields=['user_id', 'group_id', 'joined_at'], name='invite_link_user_id_0b7c1a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invitelink',
+            index=models.Index(fields=['group_id', 'created_at'], name='invite_link_group_i_15d98a_idx'),
+        ),
+    ]
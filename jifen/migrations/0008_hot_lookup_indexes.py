@@ -0,0 +1,21 @@
+# Generated by Django 3.2.24 on 2026-10-18 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jifen', '0007_invitelink'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pointtransaction',
+            index=models.Index(fields=['user', 'group', 'transaction_date', 'type', 'amount'], name='point_trans_user_id_142d24_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['telegram_id', 'group', 'is_active', 'is_admin'], name='users_telegra_7d8375_idx'),
+        ),
+    ]
@@ -53,6 +53,8 @@ class User(models.Model):
         indexes = [
             models.Index(fields=['telegram_id']),
             models.Index(fields=['group']),
+            # 覆盖成员查询 (telegram_id, 群组) -> 是否活跃/是否管理员
+            models.Index(fields=['telegram_id', 'group', 'is_active', 'is_admin']),
         ]
         
     def __str__(self):
@@ -221,6 +223,8 @@ class PointTransaction(models.Model):
             models.Index(fields=['group']),
             models.Index(fields=['type']),
             models.Index(fields=['transaction_date']),
+            # 覆盖按用户、群组、日期和类型统计积分（包含 amount，统计时无需回表）
+            models.Index(fields=['user', 'group', 'transaction_date', 'type', 'amount']),
         ]
         
     def __str__(self):
@@ -351,4 +355,38 @@ class DailyInviteStat(models.Model):
         ]
         
     def __str__(self):
-        return f"{self.user} - {self.invite_date} - {self.invite_count}人" 
\ No newline at end of file
+        return f"{self.user} - {self.invite_date} - {self.invite_count}人" 
+
+class InviteLink(models.Model):
+    """邀请链接登记表（替代 bot_data 中的 pending_invites）"""
+    
+    code = models.CharField(max_length=32, unique=True, help_text="跟踪邀请码")
+    inviter_id = models.BigIntegerField(help_text="邀请人Telegram ID")
+    inviter_name = models.CharField(max_length=255, null=True, blank=True, help_text="邀请人名称")
+    group_id = models.BigIntegerField(help_text="Telegram群组ID")
+    group_title = models.CharField(max_length=255, null=True, blank=True, help_text="群组名称")
+    link_url = models.CharField(max_length=255, null=True, blank=True, help_text="群组邀请链接")
+    link_core = models.CharField(max_length=128, null=True, blank=True, help_text="邀请链接核心部分")
+    is_official_invite = models.BooleanField(default=True, help_text="是否为正式邀请链接")
+    user_id = models.BigIntegerField(null=True, blank=True, help_text="通过跟踪链接启动机器人的用户Telegram ID")
+    user_name = models.CharField(max_length=255, null=True, blank=True, help_text="通过跟踪链接启动机器人的用户名称")
+    joined_at = models.DateTimeField(null=True, blank=True, help_text="通过跟踪链接启动机器人的时间")
+    last_invitee_id = models.BigIntegerField(null=True, blank=True, help_text="最近一次被邀请人Telegram ID")
+    last_invitee_name = models.CharField(max_length=255, null=True, blank=True, help_text="最近一次被邀请人名称")
+    last_used_at = models.DateTimeField(null=True, blank=True, help_text="最近一次使用时间")
+    matched_by = models.CharField(max_length=32, null=True, blank=True, help_text="最近一次匹配方式")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="创建时间")
+    
+    class Meta:
+        db_table = 'invite_links'
+        verbose_name = '邀请链接'
+        verbose_name_plural = '邀请链接'
+        indexes = [
+            models.Index(fields=['group_id', 'link_core']),
+            models.Index(fields=['inviter_id', 'group_id']),
+            models.Index(fields=['user_id', 'group_id', 'joined_at']),
+            models.Index(fields=['group_id', 'created_at']),
+        ]
+        
+    def __str__(self):
+        return f"{self.inviter_name}({self.inviter_id}) - {self.group_id} - {self.code}"
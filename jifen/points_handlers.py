@@ -3,6 +3,8 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 from asgiref.sync import sync_to_async
 from .models import Group, PointRule
+from django.db import transaction
+from .rule_cache import invalidate_group_rule
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -177,6 +179,8 @@ async def enable_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # 更新启用状态
             rule.points_enabled = enabled
             rule.save()
+            # 规则已变更，事务提交后清除积分规则缓存
+            transaction.on_commit(lambda: invalidate_group_rule(chat_id))
             
             logger.info(f"群组 {group.group_title} (ID: {chat_id}) 的积分功能已{'启用' if enabled else '关闭'}")
             return True
@@ -241,6 +245,8 @@ async def disable_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # 更新启用状态
             rule.points_enabled = enabled
             rule.save()
+            # 规则已变更，事务提交后清除积分规则缓存
+            transaction.on_commit(lambda: invalidate_group_rule(chat_id))
             
             logger.info(f"群组 {group.group_title} (ID: {chat_id}) 的积分功能已{'启用' if enabled else '关闭'}")
             return True
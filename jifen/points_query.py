@@ -1,15 +1,38 @@
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from asgiref.sync import sync_to_async
+from .db_executor import db_sync_to_async
 from django.utils import timezone
-from django.db import models
+from django.db.models import FilteredRelation, Q, Sum
 import asyncio
-from .models import User, Group, PointTransaction
+from .models import User
+from .rule_cache import get_group_rule
 
 # 设置日志
 logger = logging.getLogger(__name__)
 
+def daily_points_summary_queryset(telegram_id, group_pk, day):
+    """
+    用户总积分和某天签到、发言、邀请积分的汇总查询
+
+    积分变动记录通过带条件的关联（用户、群组、日期）连接，只读取当天的记录，
+    由 (user, group, transaction_date, type, amount) 覆盖索引完成统计
+    """
+    return User.objects.filter(
+        telegram_id=telegram_id,
+        group_id=group_pk,
+        is_active=True
+    ).annotate(
+        day_transactions=FilteredRelation(
+            'pointtransaction',
+            condition=Q(pointtransaction__group_id=group_pk, pointtransaction__transaction_date=day)
+        )
+    ).values('id', 'points').annotate(
+        today_checkin=Sum('day_transactions__amount', filter=Q(day_transactions__type='CHECKIN')),
+        today_message=Sum('day_transactions__amount', filter=Q(day_transactions__type='MESSAGE')),
+        today_invite=Sum('day_transactions__amount', filter=Q(day_transactions__type='INVITE')),
+    )
+
 async def query_user_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     处理用户在群组中发送"积分"时的积分查询请求
@@ -31,55 +54,35 @@ async def query_user_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 检查消息文本是否为"积分"
     text = message.text.strip() if message.text else ""
     if text != "积分":
-        logger.debug(f"消息文本不是'积分'，不处理: {text}")
+        logger.debug("消息文本不是'积分'，不处理")
         return False
     
-    logger.info(f"用户 {user.id} ({user.full_name}) 在群组 {chat.id} ({chat.title}) 查询积分")
+    logger.debug("用户 %s 在群组 %s 查询积分", user.id, chat.id)
     
     # 从数据库查询用户积分
-    @sync_to_async
+    @db_sync_to_async
     def get_user_points():
         try:
-            group = Group.objects.filter(group_id=chat.id, is_active=True).first()
-            if not group:
-                logger.warning(f"群组 {chat.id} 不存在或非活跃")
+            entry = get_group_rule(chat.id)
+            if not entry:
+                logger.debug("群组 %s 不存在或非活跃", chat.id)
                 return None, 0, 0, 0, 0
+            group = entry.group_ref()
             
-            user_obj = User.objects.filter(telegram_id=user.id, group=group, is_active=True).first()
-            if not user_obj:
-                logger.warning(f"用户 {user.id} 在群组 {chat.id} 中不存在或非活跃")
-                return group, 0, 0, 0, 0
-            
-            # 获取用户总积分
-            total_points = user_obj.points
-            
-            # 获取今日签到积分
+            # 一次查询读取总积分和今日各类积分
             today = timezone.now().date()
-            today_checkin_points = PointTransaction.objects.filter(
-                user=user_obj,
-                group=group,
-                type='CHECKIN',
-                transaction_date=today
-            ).values_list('amount', flat=True).first() or 0
-            
-            # 获取今日发言积分
-            today_message_points = PointTransaction.objects.filter(
-                user=user_obj,
-                group=group,
-                type='MESSAGE',
-                transaction_date=today
-            ).aggregate(total=models.Sum('amount'))['total'] or 0
+            summary = daily_points_summary_queryset(user.id, group.id, today).first()
+            if not summary:
+                logger.debug("用户 %s 在群组 %s 中不存在或非活跃", user.id, chat.id)
+                return group, 0, 0, 0, 0
             
-            # 获取今日邀请积分
-            today_invite_points = PointTransaction.objects.filter(
-                user=user_obj,
-                group=group,
-                type='INVITE',
-                transaction_date=today
-            ).aggregate(total=models.Sum('amount'))['total'] or 0
+            total_points = summary['points']
+            today_checkin_points = summary['today_checkin'] or 0
+            today_message_points = summary['today_message'] or 0
+            today_invite_points = summary['today_invite'] or 0
             
-            logger.info(f"用户 {user.id} 积分信息: 总积分={total_points}, 今日签到={today_checkin_points}, "
-                       f"今日发言={today_message_points}, 今日邀请={today_invite_points}")
+            logger.debug("用户 %s 积分信息: 总积分=%s, 今日签到=%s, 今日发言=%s, 今日邀请=%s",
+                         user.id, total_points, today_checkin_points, today_message_points, today_invite_points)
             
             return group, total_points, today_checkin_points, today_message_points, today_invite_points
         
@@ -103,12 +106,12 @@ async def query_user_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await asyncio.sleep(10)  # 等待10秒
                 # 删除错误消息
                 await error_message.delete()
-                logger.info(f"已删除用户 {user.id} 的查询失败消息")
+                logger.debug("已删除用户 %s 的查询失败消息", user.id)
                 
                 # 删除用户的原始查询消息
                 try:
                     await message.delete()
-                    logger.info(f"已删除用户 {user.id} 的原始积分查询消息")
+                    logger.debug("已删除用户 %s 的原始积分查询消息", user.id)
                 except Exception as e:
                     logger.error(f"删除用户原始积分查询消息时出错: {e}")
             except Exception as e:
@@ -147,7 +150,7 @@ async def query_user_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode="HTML",
             reply_to_message_id=message.message_id
         )
-        logger.info(f"已向用户 {user.id} 发送积分查询结果，10秒后将自动删除")
+        logger.debug("已向用户 %s 发送积分查询结果，10秒后将自动删除", user.id)
         
         # 创建定时删除任务
         async def delete_message_later():
@@ -155,12 +158,12 @@ async def query_user_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await asyncio.sleep(10)  # 等待10秒
                 # 删除机器人的回复消息
                 await sent_message.delete()
-                logger.info(f"已删除用户 {user.id} 的积分查询结果消息")
+                logger.debug("已删除用户 %s 的积分查询结果消息", user.id)
                 
                 # 删除用户的原始查询消息
                 try:
                     await message.delete()
-                    logger.info(f"已删除用户 {user.id} 的原始积分查询消息")
+                    logger.debug("已删除用户 %s 的原始积分查询消息", user.id)
                 except Exception as e:
                     logger.error(f"删除用户原始积分查询消息时出错: {e}")
             except Exception as e:
@@ -185,12 +188,12 @@ async def query_user_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     await asyncio.sleep(10)  # 等待10秒
                     # 删除简化版回复消息
                     await sent_message.delete()
-                    logger.info(f"已删除简化版积分查询结果消息")
+                    logger.debug("已删除简化版积分查询结果消息")
                     
                     # 删除用户的原始查询消息
                     try:
                         await message.delete()
-                        logger.info(f"已删除用户 {user.id} 的原始积分查询消息")
+                        logger.debug("已删除用户 %s 的原始积分查询消息", user.id)
                     except Exception as e:
                         logger.error(f"删除用户原始积分查询消息时出错: {e}")
                 except Exception as e:
@@ -0,0 +1,152 @@
+"""
+群组积分规则缓存
+
+群组消息、签到和积分查询每次都要读取 Group 和 PointRule，而这些数据只在管理员修改设置时才会变化。
+这里按 Telegram 群组ID 缓存 (Group 主键, PointRule 快照)，过期时间由 settings.POINT_RULE_CACHE_TTL 控制，
+管理员修改规则或群组状态变化时会主动失效对应的缓存（分片模式下同时通知其他工作进程，见 cache_invalidation）。
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+from . import cache_invalidation
+from .models import Group, PointRule
+
+logger = logging.getLogger(__name__)
+
+# 群组不存在或未设置规则时的缓存时间（秒），避免新建规则后长时间读到旧结果
+NEGATIVE_CACHE_TTL = 10
+
+
+@dataclass(frozen=True)
+class PointRuleSnapshot:
+    """PointRule 的只读快照，字段名与模型保持一致"""
+    points_enabled: bool
+    checkin_keyword: str
+    checkin_points: int
+    message_points: int
+    message_daily_limit: int
+    message_min_length: int
+    invite_points: int
+    invite_daily_limit: int
+
+    @classmethod
+    def from_rule(cls, rule: PointRule) -> 'PointRuleSnapshot':
+        return cls(
+            points_enabled=rule.points_enabled,
+            checkin_keyword=rule.checkin_keyword,
+            checkin_points=rule.checkin_points,
+            message_points=rule.message_points,
+            message_daily_limit=rule.message_daily_limit,
+            message_min_length=rule.message_min_length,
+            invite_points=rule.invite_points,
+            invite_daily_limit=rule.invite_daily_limit,
+        )
+
+
+@dataclass(frozen=True)
+class GroupRuleEntry:
+    """缓存条目：活跃群组的主键、标题及其积分规则快照（未设置规则时为 None）"""
+    group_pk: int
+    chat_id: int
+    group_title: str
+    rule: Optional[PointRuleSnapshot]
+
+    def group_ref(self) -> Group:
+        """返回只带主键等基本字段的 Group 实例，仅用于外键查询和创建关联记录，不要调用 save()"""
+        return Group(id=self.group_pk, group_id=self.chat_id, group_title=self.group_title, is_active=True)
+
+
+class GroupRuleCache:
+    """按 Telegram 群组ID 缓存群组与积分规则，线程安全"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        # 格式: {chat_id: (过期时间, GroupRuleEntry 或 None)}
+        self._entries: Dict[int, Tuple[float, Optional[GroupRuleEntry]]] = {}
+        # 每个群组的失效代数，加载期间发生失效时丢弃加载结果，避免把旧规则写回缓存
+        self._generations: Dict[int, int] = {}
+        # clear() 的代数，作用于所有群组
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, chat_id: int) -> Optional[GroupRuleEntry]:
+        """
+        获取活跃群组及其积分规则（同步函数，需在线程中调用）
+
+        群组不存在或非活跃时返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(chat_id)
+            if cached and cached[0] > now:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(chat_id, 0))
+
+        entry = self._load(chat_id)
+        ttl = self.ttl if entry and entry.rule else NEGATIVE_CACHE_TTL
+        with self._lock:
+            if (self._epoch, self._generations.get(chat_id, 0)) == generation:
+                self._entries[chat_id] = (now + ttl, entry)
+        return entry
+
+    def _load(self, chat_id: int) -> Optional[GroupRuleEntry]:
+        """从数据库加载群组和积分规则"""
+        group = Group.objects.filter(group_id=chat_id, is_active=True).first()
+        if not group:
+            return None
+        rule = PointRule.objects.filter(group=group).first()
+        return GroupRuleEntry(
+            group_pk=group.id,
+            chat_id=group.group_id,
+            group_title=group.group_title,
+            rule=PointRuleSnapshot.from_rule(rule) if rule else None,
+        )
+
+    def invalidate(self, chat_id: int) -> None:
+        """使指定群组的缓存失效"""
+        with self._lock:
+            self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+            if self._entries.pop(chat_id, None) is not None:
+                self.invalidations += 1
+                logger.debug(f"已清除群组 {chat_id} 的积分规则缓存")
+
+    def clear(self) -> None:
+        """清空全部缓存"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """返回缓存命中统计"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+            }
+
+
+group_rule_cache = GroupRuleCache(ttl=getattr(settings, 'POINT_RULE_CACHE_TTL', 300))
+cache_invalidation.register('group_rule', group_rule_cache.invalidate)
+
+
+def get_group_rule(chat_id: int) -> Optional[GroupRuleEntry]:
+    """获取活跃群组及其积分规则快照（同步函数）"""
+    return group_rule_cache.get(chat_id)
+
+
+def invalidate_group_rule(chat_id: int) -> None:
+    """管理员修改积分规则或群组状态变化后调用，使缓存失效"""
+    cache_invalidation.invalidate('group_rule', chat_id)
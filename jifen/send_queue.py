@@ -0,0 +1,294 @@
+"""
+出站消息发送队列
+
+所有批量或非即时的消息（开奖结果、中奖私信、邀请欢迎、群内提示）统一经由此队列发送：
+- 全局令牌桶和按聊天划分的令牌桶，匹配 Telegram 的限速（全局约 30 条/秒，单个私聊 1 条/秒，单个群组 20 条/分钟）
+- 按聊天限速的消息不占用发送协程：预约该聊天的下一个发送时间后放回队列，到时间再发送，
+  一个群组的大量消息不会阻塞其他聊天；只有全局限速会让发送协程等待
+- 收到 429 (RetryAfter) 时整个队列暂停 retry_after 秒后重试，网络错误按指数退避重试
+- 优先级通道：开奖结果优先于普通通知，普通通知优先于临时提示
+- 固定数量的发送协程，限制并发
+- 每条消息的发送结果通过 DeliveryResult 返回给调用方
+"""
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from django.conf import settings
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# 优先级通道，数值越小越优先
+PRIORITY_HIGH = 0    # 开奖结果、中奖通知
+PRIORITY_NORMAL = 1  # 邀请通知、欢迎消息
+PRIORITY_LOW = 2     # 会自动删除的临时提示
+
+
+@dataclass
+class DeliveryResult:
+    """单条消息的发送结果"""
+    ok: bool
+    chat_id: int
+    message: Any = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+
+
+class TokenBucket:
+    """令牌桶，reserve() 预占一个令牌并返回需要等待的秒数，保证先到先发"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def is_idle(self):
+        """令牌已满，说明近期没有发送，可以回收"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class _SendJob:
+    factory: Callable[[], Awaitable[Any]]
+    chat_id: int
+    priority: int
+    future: asyncio.Future
+    description: str = ''
+    attempts: int = 0
+    # 已预约按聊天限速的发送时间（放回队列等待期间为 True）
+    chat_slot_reserved: bool = False
+
+
+class SendQueue:
+    """绑定在单个事件循环上的出站消息队列"""
+
+    # 按聊天划分的令牌桶超过该数量时回收空闲的桶
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, workers=8, global_rate=30, private_chat_rate=1.0,
+                 group_chat_rate_per_minute=20, max_attempts=5):
+        self.workers = workers
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate_per_minute / 60.0
+        self.max_attempts = max_attempts
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        # 收到 429 后整个队列暂停到该时间点
+        self._paused_until = 0.0
+        self._tasks = []
+        self.stats = {'delivered': 0, 'failed': 0, 'retried': 0, 'rate_limited': 0}
+
+    def start(self):
+        """启动发送协程（需在事件循环中调用）"""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"[发送队列] 已启动 {self.workers} 个发送协程")
+
+    def pending_count(self):
+        return self._queue.qsize()
+
+    def submit(self, factory, chat_id, priority=PRIORITY_NORMAL, description=''):
+        """
+        提交一个发送任务，返回可等待的 Future，结果为 DeliveryResult
+
+        参数:
+        factory: 无参协程函数，每次调用执行一次实际发送（重试时会再次调用）
+        chat_id: 目标聊天ID，用于按聊天限速
+        priority: 优先级通道
+        description: 日志中显示的描述
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        job = _SendJob(factory=factory, chat_id=chat_id, priority=priority, future=future, description=description)
+        self._put(job)
+        return future
+
+    def _put(self, job):
+        self._queue.put_nowait((job.priority, next(self._seq), job))
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                for idle_chat_id in [cid for cid, b in self._chat_buckets.items() if b.is_idle()]:
+                    del self._chat_buckets[idle_chat_id]
+            # 私聊ID为正数，群组和频道ID为负数
+            if chat_id > 0:
+                bucket = TokenBucket(self.private_chat_rate, 1)
+            else:
+                bucket = TokenBucket(self.group_chat_rate, 3)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"[发送队列] 处理发送任务时出错: {e}", exc_info=True)
+                self._finish(job, DeliveryResult(False, job.chat_id, error=e, attempts=job.attempts))
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job):
+        # 按聊天限速：预约发送时间，未到时间时放回队列，不占用发送协程
+        if not job.chat_slot_reserved:
+            delay = self._chat_bucket(job.chat_id).reserve()
+            if delay > 0:
+                job.chat_slot_reserved = True
+                asyncio.get_running_loop().call_later(delay, self._put, job)
+                return
+        job.chat_slot_reserved = False
+
+        # 全局限速和 429 暂停：等待后再次检查暂停（等待期间可能收到新的 429）
+        await self._wait_paused()
+        delay = self._global_bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            await self._wait_paused()
+
+        job.attempts += 1
+        try:
+            message = await job.factory()
+        except RetryAfter as e:
+            self.stats['rate_limited'] += 1
+            retry_after = float(getattr(e.retry_after, 'total_seconds', lambda: e.retry_after)())
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            logger.warning(f"[发送队列] 触发限速，暂停 {retry_after} 秒: {job.description or job.chat_id}")
+            self._retry(job, e, 0)
+            return
+        except (Forbidden, BadRequest, ChatMigrated) as e:
+            # 用户屏蔽机器人、聊天不存在等，重试无意义
+            logger.warning(f"[发送队列] 发送失败，不再重试: {job.description or job.chat_id}: {e}")
+            self._finish(job, DeliveryResult(False, job.chat_id, error=e, attempts=job.attempts))
+            return
+        except NetworkError as e:
+            self._retry(job, e, min(30, 2 ** job.attempts))
+            return
+
+        self._finish(job, DeliveryResult(True, job.chat_id, message=message, attempts=job.attempts))
+
+    async def _wait_paused(self):
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause <= 0:
+                return
+            await asyncio.sleep(pause)
+
+    def _retry(self, job, error, backoff):
+        if job.attempts >= self.max_attempts:
+            logger.error(f"[发送队列] 重试 {job.attempts} 次后仍然失败: {job.description or job.chat_id}: {error}")
+            self._finish(job, DeliveryResult(False, job.chat_id, error=error, attempts=job.attempts))
+            return
+        self.stats['retried'] += 1
+        if backoff > 0:
+            asyncio.get_running_loop().call_later(backoff, self._put, job)
+        else:
+            self._put(job)
+
+    def _finish(self, job, result):
+        self.stats['delivered' if result.ok else 'failed'] += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+
+# 共享 Telegram 全局限速的发送进程数（分片模式下为工作进程数），全局速率按进程数平分
+_sender_processes = 1
+
+
+def set_sender_process_count(count):
+    """分片模式下每个工作进程启动时调用，之后创建的发送队列只使用 1/count 的全局速率"""
+    global _sender_processes
+    _sender_processes = max(1, count)
+
+
+# 每个事件循环一个队列（独立运行的机器人和 Django 内嵌的开奖器可能使用不同的事件循环）
+_queues: Dict[asyncio.AbstractEventLoop, SendQueue] = {}
+
+
+def get_send_queue() -> SendQueue:
+    """获取当前事件循环的发送队列（需在事件循环中调用）"""
+    loop = asyncio.get_running_loop()
+    queue = _queues.get(loop)
+    if queue is None:
+        for closed_loop in [l for l in _queues if l.is_closed()]:
+            del _queues[closed_loop]
+        queue = SendQueue(
+            workers=getattr(settings, 'SEND_QUEUE_WORKERS', 8),
+            global_rate=getattr(settings, 'SEND_QUEUE_GLOBAL_RATE', 30) / _sender_processes,
+            private_chat_rate=getattr(settings, 'SEND_QUEUE_PRIVATE_CHAT_RATE', 1.0),
+            group_chat_rate_per_minute=getattr(settings, 'SEND_QUEUE_GROUP_CHAT_RATE_PER_MINUTE', 20),
+            max_attempts=getattr(settings, 'SEND_QUEUE_MAX_ATTEMPTS', 5),
+        )
+        _queues[loop] = queue
+    return queue
+
+
+def submit_message(bot, chat_id, text, priority=PRIORITY_NORMAL, **kwargs) -> asyncio.Future:
+    """提交一条文本消息，返回结果为 DeliveryResult 的 Future"""
+    return get_send_queue().submit(
+        lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs),
+        chat_id,
+        priority=priority,
+        description=f"send_message -> {chat_id}"
+    )
+
+
+async def queued_send_message(bot, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+    """
+    通过发送队列发送文本消息，用法与 bot.send_message 相同
+
+    返回发送成功的 Message，最终失败时抛出最后一次的异常
+    """
+    result = await submit_message(bot, chat_id, text, priority=priority, **kwargs)
+    if not result.ok:
+        raise result.error
+    return result.message
+
+
+def submit_temporary_message(bot, chat_id, text, delete_after, **kwargs) -> asyncio.Future:
+    """
+    以低优先级提交一条临时提示，发送成功 delete_after 秒后自动删除
+
+    返回结果为 DeliveryResult 的 Future，调用方通常不需要等待
+    """
+    future = submit_message(bot, chat_id, text, priority=PRIORITY_LOW, **kwargs)
+    loop = asyncio.get_running_loop()
+
+    async def delete_later(message):
+        await asyncio.sleep(delete_after)
+        try:
+            await message.delete()
+        except Exception as e:
+            logger.warning(f"[发送队列] 自动删除临时提示失败: {chat_id}: {e}")
+
+    def on_done(done):
+        result = done.result()
+        if result.ok:
+            loop.create_task(delete_later(result.message))
+
+    future.add_done_callback(on_done)
+    return future
@@ -1,3 +1,62 @@
+from datetime import timedelta
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from jifen.invite_registry import InviteRegistry
+from jifen.models import InviteLink
+
+
+class InviteRegistryTests(TestCase):
+    """邀请链接登记：有界加载、LRU 淘汰与数据库回查限频"""
+
+    def _link(self, code, group_id=-1, official=True, **kwargs):
+        return InviteLink.objects.create(
+            code=code, inviter_id=1, inviter_name='tester',
+            group_id=group_id, group_title='测试群组', link_url=f'https://t.me/+{code}core',
+            link_core=f'{code}core', is_official_invite=official, **kwargs,
+        )
+
+    def test_startup_load_is_limited_to_match_windows(self):
+        self._link('old')
+        InviteLink.objects.filter(code='old').update(created_at=timezone.now() - timedelta(days=5))
+        self._link('new')
+        registry = InviteRegistry()
+        self.assertEqual(registry.size(), 1)
+        # 窗口外的邀请在按邀请码查找时从数据库读取
+        self.assertEqual(registry.get('old').code, 'old')
+
+    def test_repeated_miss_queries_database_once(self):
+        registry = InviteRegistry(recheck_interval=60)
+        registry.size()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(registry.get('missing'))
+            self.assertIsNone(registry.get('missing'))
+        self.assertEqual(len(queries.captured_queries), 1)
+
+    def test_window_matching_uses_memory_in_single_process(self):
+        self._link('official')
+        registry = InviteRegistry()
+        registry.size()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(registry.find_latest_official(-1).code, 'official')
+            self.assertEqual(registry.find_by_invitee(42, -1), (None, None))
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_shared_registry_sees_links_from_other_processes(self):
+        registry = InviteRegistry()
+        registry.set_shared(True)
+        registry.size()
+        self._link('other', group_id=-3)
+        self.assertEqual(registry.find_latest_official(-3).code, 'other')
 
-# Create your tests here.
+    def test_eviction_cleans_secondary_indexes(self):
+        registry = InviteRegistry(max_size=2)
+        for index in range(4):
+            registry.create(f'c{index}', index, 'tester', -2, '测试群组', f'https://t.me/+core{index}')
+        self.assertEqual(registry.size(), 2)
+        self.assertEqual(registry.evictions, 2)
+        self.assertEqual(registry._group_cores[-2], ['core2', 'core3'])
+        self.assertEqual(len(registry._by_inviter_group), 2)
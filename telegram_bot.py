@@ -9,6 +9,7 @@ from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandle
 from asgiref.sync import sync_to_async
 from django.db import transaction
 from django.db.models import Q
+from django.conf import settings
 
 # 只有在非Django环境中才需要设置Django环境
 if 'DJANGO_SETTINGS_MODULE' not in os.environ:
@@ -71,6 +72,8 @@ from jifen.points_handlers import (
 
 # 导入积分查询功能
 from jifen.points_query import query_user_points
+from jifen.leaderboard import start_leaderboard
+from jifen.leaderboard_handlers import rank_command, top_command
 
 # 导入抽奖处理模块
 from choujiang.lottery_handlers import lottery_setup_handler, get_lottery_handlers, direct_check_lottery, view_lottery
@@ -78,20 +81,31 @@ from choujiang.lottery_handlers import lottery_setup_handler, get_lottery_handle
 # 导入抽奖复制功能
 from choujiang.lottery_copy import get_lottery_copy_handlers
 
+# 导入发言积分写后缓冲
+from jifen.message_ledger import message_ledger, start_message_ledger
+
+# 导入数据库线程池
+from jifen.db_executor import db_executor
+
 # 导入抽奖自动开奖功能
 from choujiang.lottery_drawer import start_lottery_drawer
+from choujiang.requirement_checker import start_requirement_revalidator
 
 # 导入抽奖模型
 from choujiang.models import Lottery
 
+# 导入运行指标统计
+from telegram_lottery_bot.metrics import InstrumentedRequest, install_query_counter, instrument_application, start_metrics_server
+
+# 导入 webhook 模式
+from telegram_lottery_bot.webhook import start_webhook, stop_webhook
+
+# 导入并发更新处理器
+from telegram_lottery_bot.update_processor import create_update_processor
+
 # 其他模块将在需要时导入
 # from choujiang.list_lotteries import view_group_lotteries
 
-# 设置日志
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # 设置机器人token
@@ -309,7 +323,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 获取一个活跃的抽奖ID
         @sync_to_async
         def get_active_lottery_id():
-            from choujiang.models import Lottery
             lottery = Lottery.objects.filter(status='ACTIVE').order_by('-created_at').first()
             return lottery.id if lottery else None
             
@@ -348,7 +361,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = update.effective_user
     
-    logger.info(f"用户 {user.id} ({user.full_name}) 点击了按钮，数据: {query.data}")
+    logger.debug("用户 %s 点击了按钮，数据: %s", user.id, query.data)
     
     try:
         # 先回复查询以避免Telegram超时错误
@@ -357,15 +370,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 检查是否是查看抽奖的回调
         if query.data.startswith("view_lottery_"):
             # 这是查看抽奖的回调，调用lottery_handlers.py中的view_lottery函数
-            from choujiang.lottery_handlers import view_lottery
-            logger.info(f"检测到查看抽奖回调, 调用view_lottery函数: {query.data}")
+            logger.debug("检测到查看抽奖回调, 调用view_lottery函数: %s", query.data)
             return await view_lottery(update, context)
         
         # 检查是否是抽奖复制相关的回调，如果是则由专门的处理器处理
         if query.data.startswith("send_to_group_") or \
            query.data.startswith("copy_lottery_to_") or \
            query.data == "cancel_copy_lottery":
-            logger.info(f"检测到抽奖复制相关回调，将由专门的处理器处理: {query.data}")
+            logger.debug("检测到抽奖复制相关回调，将由专门的处理器处理: %s", query.data)
             return
         
         # 根据回调数据分别处理其他情况
@@ -556,17 +568,23 @@ async def combined_group_message_handler(update: Update, context: ContextTypes.D
     """
     # 检查是否是"邀请链接"请求
     if update.message.text and update.message.text.strip() == "邀请链接":
-        logger.info(f"用户 {update.effective_user.id} 在群组中请求生成邀请链接")
+        logger.debug("用户 %s 在群组中请求生成邀请链接", update.effective_user.id)
         await generate_invite_link(update, context)
         return
     
     # 检查是否是"积分"查询请求
     if update.message.text and update.message.text.strip() == "积分":
-        logger.info(f"用户 {update.effective_user.id} 在群组中查询积分")
+        logger.debug("用户 %s 在群组中查询积分", update.effective_user.id)
         is_queried = await query_user_points(update, context)
         if is_queried:
             return
     
+    # 检查是否是"排行榜"查询请求
+    if update.message.text and update.message.text.strip() == "排行榜":
+        logger.debug("用户 %s 在群组中查询积分排行榜", update.effective_user.id)
+        await top_command(update, context)
+        return
+    
     # 先调用签到处理函数
     is_checkin = await process_group_message(update, context)
     
@@ -578,21 +596,21 @@ async def combined_group_message_handler(update: Update, context: ContextTypes.D
 async def combined_text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理所有文本消息，根据用户状态决定调用哪个具体的处理函数"""
     user_data = context.user_data
-    logger.info(f"收到来自用户 {update.effective_user.id} 的文本消息")
+    logger.debug("收到来自用户 %s 的文本消息", update.effective_user.id)
     
     # 检查是否是"邀请链接"请求
     if update.message.text and update.message.text.strip() == "邀请链接":
-        logger.info(f"用户 {update.effective_user.id} 在私聊中请求生成邀请链接")
+        logger.debug("用户 %s 在私聊中请求生成邀请链接", update.effective_user.id)
         await generate_invite_link(update, context)
         return
     
     # 根据用户状态决定处理方式
     if not user_data:
-        logger.debug(f"用户 {update.effective_user.id} 没有状态数据")
+        logger.debug("用户 %s 没有状态数据", update.effective_user.id)
         return
     
     if user_data.get('waiting_for_checkin_text'):
-        logger.info(f"用户处于等待输入签到文字状态，调用handle_checkin_text_input")
+        logger.debug("用户处于等待输入签到文字状态，调用handle_checkin_text_input")
         # 确保其他输入状态被清除
         user_data.pop('waiting_for_points', None)
         user_data.pop('waiting_for_message_points', None)
@@ -601,7 +619,7 @@ async def combined_text_handler(update: Update, context: ContextTypes.DEFAULT_TY
         user_data.pop('waiting_for_invite_points', None)
         await handle_checkin_text_input(update, context)
     elif user_data.get('waiting_for_points'):
-        logger.info(f"用户处于等待输入签到积分状态，调用handle_points_input")
+        logger.debug("用户处于等待输入签到积分状态，调用handle_points_input")
         # 确保其他输入状态被清除
         user_data.pop('waiting_for_checkin_text', None)
         user_data.pop('waiting_for_message_points', None)
@@ -610,7 +628,7 @@ async def combined_text_handler(update: Update, context: ContextTypes.DEFAULT_TY
         user_data.pop('waiting_for_invite_points', None)
         await handle_points_input(update, context)
     elif user_data.get('waiting_for_message_points'):
-        logger.info(f"用户处于等待输入发言积分状态，调用handle_message_points_input")
+        logger.debug("用户处于等待输入发言积分状态，调用handle_message_points_input")
         # 确保其他输入状态被清除
         user_data.pop('waiting_for_checkin_text', None)
         user_data.pop('waiting_for_points', None)
@@ -619,7 +637,7 @@ async def combined_text_handler(update: Update, context: ContextTypes.DEFAULT_TY
         user_data.pop('waiting_for_invite_points', None)
         await handle_message_points_input(update, context)
     elif user_data.get('waiting_for_daily_limit'):
-        logger.info(f"用户处于等待输入每日上限状态，调用handle_daily_limit_input")
+        logger.debug("用户处于等待输入每日上限状态，调用handle_daily_limit_input")
         # 确保其他输入状态被清除
         user_data.pop('waiting_for_checkin_text', None)
         user_data.pop('waiting_for_points', None)
@@ -628,7 +646,7 @@ async def combined_text_handler(update: Update, context: ContextTypes.DEFAULT_TY
         user_data.pop('waiting_for_invite_points', None)
         await handle_daily_limit_input(update, context)
     elif user_data.get('waiting_for_min_length'):
-        logger.info(f"用户处于等待输入最小字数长度限制状态，调用handle_min_length_input")
+        logger.debug("用户处于等待输入最小字数长度限制状态，调用handle_min_length_input")
         # 确保其他输入状态被清除
         user_data.pop('waiting_for_checkin_text', None)
         user_data.pop('waiting_for_points', None)
@@ -637,7 +655,7 @@ async def combined_text_handler(update: Update, context: ContextTypes.DEFAULT_TY
         user_data.pop('waiting_for_invite_points', None)
         await handle_min_length_input(update, context)
     elif user_data.get('waiting_for_invite_points'):
-        logger.info(f"用户处于等待输入邀请积分状态，调用handle_invite_points_input")
+        logger.debug("用户处于等待输入邀请积分状态，调用handle_invite_points_input")
         # 确保其他输入状态被清除
         user_data.pop('waiting_for_checkin_text', None)
         user_data.pop('waiting_for_points', None)
@@ -647,7 +665,7 @@ async def combined_text_handler(update: Update, context: ContextTypes.DEFAULT_TY
         user_data.pop('waiting_for_invite_daily_limit', None)
         await handle_invite_points_input(update, context)
     elif user_data.get('waiting_for_invite_daily_limit'):
-        logger.info(f"用户处于等待输入邀请每日上限状态，调用handle_invite_daily_limit_input")
+        logger.debug("用户处于等待输入邀请每日上限状态，调用handle_invite_daily_limit_input")
         # 确保其他输入状态被清除
         user_data.pop('waiting_for_checkin_text', None)
         user_data.pop('waiting_for_points', None)
@@ -661,6 +679,92 @@ async def combined_text_handler(update: Update, context: ContextTypes.DEFAULT_TY
         logger.debug(f"用户未处于特定状态，不处理消息")
         return
 
+def create_application(update_queue=None):
+    """
+    创建 Application（run_bot 和分片工作进程共用）
+
+    开启指标统计时使用可统计 API 调用次数的请求对象，连接池大小与默认值一致；
+    UPDATE_CONCURRENCY 大于 1 时并发处理不同聊天/用户的更新，同一聊天或用户的更新仍按顺序处理
+    """
+    builder = ApplicationBuilder().token(TOKEN)
+    processor = create_update_processor(
+        getattr(settings, 'UPDATE_CONCURRENCY', 64),
+        getattr(settings, 'UPDATE_MAX_PENDING', 1000),
+    )
+    if processor is not None:
+        builder = builder.concurrent_updates(processor)
+    if getattr(settings, 'METRICS_ENABLED', True):
+        builder = builder.request(InstrumentedRequest(connection_pool_size=256))
+        install_query_counter()
+    if update_queue is not None:
+        builder = builder.update_queue(update_queue)
+    return builder.build()
+
+def register_handlers(application):
+    """注册全部处理器（run_bot 和分片工作进程共用）"""
+    # 注册命令处理器
+    application.add_handler(CommandHandler("start", start))
+    logger.info("注册 /start 命令处理器")
+
+    # 注册邀请命令处理器
+    application.add_handler(CommandHandler("invite", generate_invite_link))
+    logger.info("注册 /invite 命令处理器")
+
+    # 注册积分排行榜命令处理器
+    application.add_handler(CommandHandler("rank", rank_command))
+    application.add_handler(CommandHandler("top", top_command))
+    logger.info("注册 /rank 和 /top 命令处理器")
+
+    # 注册抽奖设置处理器（放在最前面）
+    application.add_handler(lottery_setup_handler)
+    logger.info("注册抽奖设置处理器 [lottery_setup_handler]")
+
+    # 注册抽奖相关的其他处理器
+    lottery_handlers = get_lottery_handlers()
+    logger.info(f"获取到 {len(lottery_handlers)} 个抽奖相关处理器")
+    for handler in lottery_handlers:
+        # 排除另一个CommandHandler("start")处理器，确保只有一个start命令处理器
+        if handler.__class__.__name__ == "CommandHandler" and getattr(handler, 'command', None) == ['start']:
+            logger.info(f"跳过重复的start命令处理器")
+            continue
+            
+        if handler != lottery_setup_handler:  # 避免重复注册
+            application.add_handler(handler)
+            logger.info(f"注册抽奖相关处理器: {handler.__class__.__name__}, Pattern: {getattr(handler, 'pattern', 'None')}")
+
+    # 注册抽奖复制功能的处理器
+    lottery_copy_handlers = get_lottery_copy_handlers()
+    logger.info(f"获取到 {len(lottery_copy_handlers)} 个抽奖复制相关处理器")
+    for handler_info in lottery_copy_handlers:
+        pattern = handler_info['callback_pattern']
+        callback = handler_info['callback_handler']
+        copy_handler = CallbackQueryHandler(callback, pattern=pattern)
+        application.add_handler(copy_handler)
+        logger.info(f"注册抽奖复制相关处理器: {callback.__name__}, Pattern: {pattern}")
+
+    # 注册回调查询处理器
+    application.add_handler(CallbackQueryHandler(button_callback))
+    logger.info("注册按钮回调处理器")
+
+    # 使用组合处理器处理群组消息（同时处理签到和发言积分）
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS, 
+        combined_group_message_handler
+    ))
+    logger.info("注册组合群组消息处理器（签到+发言积分）")
+
+    # 注册私聊消息处理器（移到最后）
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & ~filters.ChatType.GROUPS, 
+        combined_text_handler
+    ))
+    logger.info("注册私聊消息处理器")
+
+    # 注册聊天成员处理器
+    application.add_handler(ChatMemberHandler(handle_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+    application.add_handler(ChatMemberHandler(handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
+    logger.info("注册成员状态变化处理器")
+
 def run_bot():
     """运行机器人，线程安全的方式"""
     global bot_running
@@ -684,8 +788,16 @@ def run_bot():
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         
-        # 创建应用
-        application = ApplicationBuilder().token(TOKEN).build()
+        # 创建应用（webhook 模式下使用有界的更新队列，队列满时 webhook 返回 503 让 Telegram 稍后重推）
+        metrics_enabled = getattr(settings, 'METRICS_ENABLED', True)
+        update_mode = getattr(settings, 'BOT_UPDATE_MODE', 'polling')
+        update_queue = None
+        if update_mode == 'webhook':
+            update_queue = asyncio.Queue(maxsize=getattr(settings, 'BOT_WEBHOOK_QUEUE_SIZE', 1000))
+        application = create_application(update_queue)
+        if metrics_enabled:
+            # sync_to_async 的工作线程可能已经建立过数据库连接
+            loop.run_until_complete(sync_to_async(install_query_counter)())
         
         # 初始化bot对象
         logger.info("正在初始化bot对象...")
@@ -697,74 +809,50 @@ def run_bot():
         loop.run_until_complete(start_lottery_drawer(application.bot))
         logger.info("抽奖自动开奖功能已初始化")
         
-        # 注册命令处理器
-        application.add_handler(CommandHandler("start", start))
-        logger.info("注册 /start 命令处理器")
-
-        # 注册邀请命令处理器
-        application.add_handler(CommandHandler("invite", generate_invite_link))
-        logger.info("注册 /invite 命令处理器")
-
-        # 注册抽奖设置处理器（放在最前面）
-        application.add_handler(lottery_setup_handler)
-        logger.info("注册抽奖设置处理器 [lottery_setup_handler]")
-
-        # 注册抽奖相关的其他处理器
-        lottery_handlers = get_lottery_handlers()
-        logger.info(f"获取到 {len(lottery_handlers)} 个抽奖相关处理器")
-        for handler in lottery_handlers:
-            # 排除另一个CommandHandler("start")处理器，确保只有一个start命令处理器
-            if handler.__class__.__name__ == "CommandHandler" and getattr(handler, 'command', None) == ['start']:
-                logger.info(f"跳过重复的start命令处理器")
-                continue
-                
-            if handler != lottery_setup_handler:  # 避免重复注册
-                application.add_handler(handler)
-                logger.info(f"注册抽奖相关处理器: {handler.__class__.__name__}, Pattern: {getattr(handler, 'pattern', 'None')}")
-
-        # 注册抽奖复制功能的处理器
-        lottery_copy_handlers = get_lottery_copy_handlers()
-        logger.info(f"获取到 {len(lottery_copy_handlers)} 个抽奖复制相关处理器")
-        for handler_info in lottery_copy_handlers:
-            pattern = handler_info['callback_pattern']
-            callback = handler_info['callback_handler']
-            copy_handler = CallbackQueryHandler(callback, pattern=pattern)
-            application.add_handler(copy_handler)
-            logger.info(f"注册抽奖复制相关处理器: {callback.__name__}, Pattern: {pattern}")
-
-        # 注册回调查询处理器
-        application.add_handler(CallbackQueryHandler(button_callback))
-        logger.info("注册按钮回调处理器")
-
-        # 使用组合处理器处理群组消息（同时处理签到和发言积分）
-        application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS, 
-            combined_group_message_handler
-        ))
-        logger.info("注册组合群组消息处理器（签到+发言积分）")
-
-        # 注册私聊消息处理器（移到最后）
-        application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND & ~filters.ChatType.GROUPS, 
-            combined_text_handler
-        ))
-        logger.info("注册私聊消息处理器")
-
-        # 注册聊天成员处理器
-        application.add_handler(ChatMemberHandler(handle_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
-        application.add_handler(ChatMemberHandler(handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
-        logger.info("注册成员状态变化处理器")
+        # 定期重新解析抽奖参与条件中的频道/群组
+        loop.run_until_complete(start_requirement_revalidator(application.bot))
+        
+        # 启动发言积分写后缓冲的后台刷新任务
+        loop.run_until_complete(start_message_ledger())
+        
+        # 在后台从数据库重建积分排行榜
+        loop.run_until_complete(start_leaderboard())
+        
+        # 注册全部处理器
+        register_handlers(application)
+
+        # 为所有处理器启用耗时和查询统计（需在注册完处理器之后）
+        if metrics_enabled:
+            instrument_application(application)
+            # 轮询模式下机器人不在 Django 进程中运行，由本进程自己提供 /metrics
+            if update_mode != 'webhook' and getattr(settings, 'METRICS_PORT', None):
+                start_metrics_server(settings.METRICS_PORT)
 
         # 初始化时清除所有范围内的命令并只设置start命令
         loop.run_until_complete(clear_all_commands_and_set_start(application.bot))
         
-        logger.info("Telegram机器人已启动并等待命令...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if update_mode == 'webhook':
+            # 由 Django 的 /telegram/webhook/ 视图接收更新并放入队列
+            loop.run_until_complete(start_webhook(application, loop))
+            logger.info("Telegram机器人已以 webhook 模式启动并等待更新...")
+            try:
+                loop.run_forever()
+            finally:
+                loop.run_until_complete(stop_webhook(application))
+        else:
+            logger.info("Telegram机器人已启动并等待命令...")
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
     except KeyboardInterrupt:
         logger.info("机器人已通过键盘中断停止运行")
     except Exception as e:
         logger.error(f"启动机器人时发生错误: {e}")
     finally:
+        # 退出前将缓冲区中的发言积分全部落库
+        message_ledger.shutdown()
+        
+        # 等待数据库线程池中的任务执行完毕
+        db_executor.shutdown()
+        
         # 无论如何都重置运行状态
         with bot_lock:
             bot_running = False
@@ -8,9 +8,16 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
 import os
+import threading
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'telegram_lottery_bot.settings')
 
 application = get_asgi_application()
+
+# webhook 模式下由 ASGI 进程接收更新，需要在本进程中启动机器人（runserver 由 JifenConfig.ready 启动）
+if getattr(settings, 'BOT_UPDATE_MODE', 'polling') == 'webhook':
+    from telegram_bot import run_bot
+    threading.Thread(target=run_bot, daemon=True).start()
@@ -0,0 +1,87 @@
+"""
+日志工具
+
+由 settings.LOGGING 统一配置（各模块不再调用 logging.basicConfig）：
+- AsyncQueueHandler：业务线程（包括事件循环线程）只把日志记录放入内存队列，
+  格式化和写终端/文件在 QueueListener 的后台线程中完成，不阻塞事件循环
+- SamplingFilter：按 logger 名称前缀对高频的 INFO/DEBUG 日志抽样，WARNING 及以上级别始终保留
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按 logger 名称抽样 INFO 及以下级别的日志
+
+    参数:
+    rates: {logger 名称前缀: 保留比例}，按最长前缀匹配，未配置的 logger 全部保留
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def _rate_for(self, name):
+        rate = self._resolved.get(name)
+        if rate is not None:
+            return rate
+        rate = 1.0
+        best = -1
+        for prefix, prefix_rate in self.rates.items():
+            if (name == prefix or name.startswith(prefix + '.')) and len(prefix) > best:
+                rate, best = prefix_rate, len(prefix)
+        with self._lock:
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    把日志记录放入内存队列，由后台线程写入终端（以及可选的日志文件）
+
+    参数:
+    format: 日志格式
+    filename: 日志文件路径，为空时只输出到终端
+    max_bytes / backup_count: 日志文件轮转设置
+    """
+
+    def __init__(self, format=None, filename=None, max_bytes=50 * 1024 * 1024, backup_count=5):
+        log_queue = queue.SimpleQueue()
+        super().__init__(log_queue)
+
+        formatter = logging.Formatter(format or '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        targets = [logging.StreamHandler(sys.stderr)]
+        if filename:
+            targets.append(logging.handlers.RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            ))
+        for target in targets:
+            target.setFormatter(formatter)
+
+        self.listener = logging.handlers.QueueListener(log_queue, *targets, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def prepare(self, record):
+        # 同一进程内的队列不需要序列化，格式化留给后台线程完成
+        return record
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+        super().close()
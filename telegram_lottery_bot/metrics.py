@@ -0,0 +1,345 @@
+"""
+机器人运行指标
+
+- instrument_application：包装所有已注册处理器（包括 ConversationHandler 内部的处理器）的回调，
+  按处理器名称记录耗时、数据库查询次数和 Telegram API 调用次数
+- 数据库查询通过安装在每个数据库连接上的 execute_wrapper 统计，
+  sync_to_async 会复制 contextvars，因此线程中执行的查询也能归属到当前更新
+- InstrumentedRequest：统计 Bot API 调用（按方法名累计，并计入当前更新）
+- render_metrics：以 Prometheus 文本格式输出，由 telegram_lottery_bot/urls.py 中的 /metrics 视图提供
+
+指标保存在运行机器人的进程内存中。Django 的 /metrics 视图只能输出同一进程中的数据（webhook 模式下
+机器人运行在 Django 进程中）；轮询模式的 run_bot 和 run_sharded_bot 的各个工作进程在配置了 METRICS_PORT 时
+通过 start_metrics_server 各自提供 /metrics（工作进程 i 使用 METRICS_PORT + 1 + i），由 Prometheus 分别抓取。
+"""
+import asyncio
+import contextvars
+import functools
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# 直方图分桶
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+API_CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+class UpdateStats:
+    """单次处理器调用的统计"""
+    __slots__ = ('queries', 'api_calls')
+
+    def __init__(self):
+        self.queries = 0
+        self.api_calls = 0
+
+
+# 当前正在处理的更新的统计，未在处理器中时为 None
+_current_update = contextvars.ContextVar('current_update_stats', default=None)
+
+
+class Histogram:
+    """按标签值分组的直方图，线程安全"""
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        # 格式: {标签值: [各分桶计数..., 总和, 总数]}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {label_value: list(series) for label_value, series in self._series.items()}
+        for label_value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{label}}} {series[-1]}')
+        return lines
+
+
+class LabeledCounter:
+    """按标签值累计的计数器，线程安全"""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for label_values, value in sorted(snapshot.items()):
+            labels = ','.join(f'{label}="{_escape(value_)}"' for label, value_ in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+handler_duration = Histogram(
+    'bot_handler_duration_seconds', '处理器处理一次更新的耗时', 'handler', DURATION_BUCKETS)
+handler_db_queries = Histogram(
+    'bot_handler_db_queries', '处理器处理一次更新执行的数据库查询次数', 'handler', QUERY_BUCKETS)
+handler_api_calls = Histogram(
+    'bot_handler_api_calls', '处理器处理一次更新调用 Telegram API 的次数', 'handler', API_CALL_BUCKETS)
+handler_updates = LabeledCounter(
+    'bot_handler_updates_total', '处理器处理的更新数', ('handler', 'outcome'))
+api_requests = LabeledCounter(
+    'bot_api_requests_total', 'Telegram API 调用次数（包括后台任务）', ('method',))
+
+
+# ---------- 数据库查询统计 ----------
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current_update.get()
+    if stats is not None:
+        stats.queries += 1
+    return execute(sql, params, many, context)
+
+
+def _install_on_connection(sender=None, connection=None, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install_query_counter():
+    """
+    在当前线程的所有数据库连接上安装查询计数器，之后新建的连接通过信号自动安装
+
+    已建立连接的其他线程（例如 sync_to_async 的工作线程）需要在该线程中再调用一次
+    """
+    connection_created.connect(_install_on_connection, dispatch_uid='metrics_query_counter')
+    for connection in connections.all():
+        _install_on_connection(connection=connection)
+
+
+# ---------- Telegram API 调用统计 ----------
+
+class InstrumentedRequest(HTTPXRequest):
+    """统计 Bot API 调用次数的 HTTPXRequest"""
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_requests.inc(url.rsplit('/', 1)[-1])
+        stats = _current_update.get()
+        if stats is not None:
+            stats.api_calls += 1
+        return await super().do_request(
+            url, method, request_data=request_data, read_timeout=read_timeout,
+            write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout
+        )
+
+
+# ---------- 处理器包装 ----------
+
+def _handler_name(callback):
+    return getattr(callback, '__qualname__', None) or getattr(callback, '__name__', repr(callback))
+
+
+def instrument_callback(callback, name=None):
+    """包装异步处理器回调，记录耗时、数据库查询次数和 API 调用次数"""
+    if getattr(callback, '__instrumented__', False) or not asyncio.iscoroutinefunction(callback):
+        return callback
+    name = name or _handler_name(callback)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        stats = UpdateStats()
+        token = _current_update.set(stats)
+        outcome = 'ok'
+        started = time.perf_counter()
+        try:
+            return await callback(update, context, *args, **kwargs)
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_update.reset(token)
+            handler_duration.observe(name, elapsed)
+            handler_db_queries.observe(name, stats.queries)
+            handler_api_calls.observe(name, stats.api_calls)
+            handler_updates.inc(name, outcome)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def _instrument_handler(handler):
+    if isinstance(handler, ConversationHandler):
+        count = 0
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for nested_handler in nested:
+            count += _instrument_handler(nested_handler)
+        return count
+    callback = getattr(handler, 'callback', None)
+    if callback is None:
+        return 0
+    handler.callback = instrument_callback(callback)
+    return 1
+
+
+def instrument_application(application):
+    """包装 application 中已注册的全部处理器，需在注册完处理器之后调用"""
+    count = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            count += _instrument_handler(handler)
+    logger.info(f"已为 {count} 个处理器启用耗时和查询统计")
+    return count
+
+
+# ---------- 输出 ----------
+
+def _runtime_gauges():
+    """缓存、发送队列、数据库线程池、更新处理器和 webhook 的运行统计"""
+    from choujiang.render_cache import lottery_render_cache
+    from choujiang.requirement_checker import requirement_cache
+    from jifen.db_executor import db_executor
+    from jifen.member_cache import membership_cache
+    from jifen.rule_cache import group_rule_cache
+    from jifen.send_queue import _queues
+    from telegram_lottery_bot.update_processor import processor_stats
+    from telegram_lottery_bot.webhook import webhook_ingress
+
+    cache_metrics = defaultdict(list)
+    cache_stats = (
+        ('group_rule', group_rule_cache.stats()),
+        ('membership', membership_cache.stats()),
+        ('requirement', requirement_cache.stats()),
+        ('lottery_render', lottery_render_cache.stats()),
+    )
+    for cache_name, stats in cache_stats:
+        for key, value in stats.items():
+            cache_metrics[key].append((cache_name, value))
+
+    lines = []
+    for key, values in sorted(cache_metrics.items()):
+        metric = 'bot_cache_size' if key == 'size' else f"bot_cache_{key}_total"
+        lines.append(f"# TYPE {metric} {'gauge' if key == 'size' else 'counter'}")
+        for cache_name, value in values:
+            lines.append(f'{metric}{{cache="{cache_name}"}} {value}')
+
+    send_stats = defaultdict(int)
+    for queue in list(_queues.values()):
+        for key, value in queue.stats.items():
+            send_stats[key] += value
+    for key, value in sorted(send_stats.items()):
+        lines.append(f"# TYPE bot_send_queue_{key}_total counter")
+        lines.append(f"bot_send_queue_{key}_total {value}")
+
+    executor_stats = db_executor.stats()
+    for key in ('workers', 'active', 'queued'):
+        lines.append(f"# TYPE bot_db_executor_{key} gauge")
+        lines.append(f"bot_db_executor_{key} {executor_stats[key]}")
+    for key in ('completed', 'failed', 'reconnects', 'wait_seconds'):
+        lines.append(f"# TYPE bot_db_executor_{key}_total counter")
+        lines.append(f"bot_db_executor_{key}_total {executor_stats[key]}")
+
+    update_stats = processor_stats()
+    for key in ('concurrency', 'active', 'waiting', 'keys'):
+        lines.append(f"# TYPE bot_update_processor_{key} gauge")
+        lines.append(f"bot_update_processor_{key} {update_stats[key]}")
+    lines.append("# TYPE bot_update_processor_processed_total counter")
+    lines.append(f"bot_update_processor_processed_total {update_stats['processed']}")
+
+    lines.append("# TYPE bot_webhook_updates_total counter")
+    for key, value in sorted(webhook_ingress.stats.items()):
+        lines.append(f'bot_webhook_updates_total{{result="{key}"}} {value}')
+    lines.append("# TYPE bot_webhook_queue_depth gauge")
+    lines.append(f"bot_webhook_queue_depth {webhook_ingress.queue_depth()}")
+    return lines
+
+
+def render_metrics():
+    """以 Prometheus 文本格式输出全部指标"""
+    lines = []
+    for metric in (handler_duration, handler_db_queries, handler_api_calls, handler_updates, api_requests):
+        lines.extend(metric.render())
+    try:
+        lines.extend(_runtime_gauges())
+    except Exception as e:
+        logger.error(f"收集缓存统计时出错: {e}", exc_info=True)
+    return '\n'.join(lines) + '\n'
+
+
+# ---------- 访问控制与进程内 HTTP 服务 ----------
+
+def metrics_access_allowed(authorization, remote_addr):
+    """Bearer 令牌与 METRICS_TOKEN 一致，或来源地址在 METRICS_ALLOWED_IPS 中时允许访问，默认拒绝"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and hmac.compare_digest((authorization or '').encode('utf-8'), f"Bearer {token}".encode('utf-8')):
+        return True
+    return remote_addr in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        if not metrics_access_allowed(self.headers.get('Authorization'), self.client_address[0]):
+            logger.warning(f"拒绝未授权的 /metrics 请求，来源 {self.client_address[0]}")
+            self.send_error(403)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    """在后台线程中提供本进程的 /metrics（监听 METRICS_BIND_ADDRESS:port），返回 HTTP 服务器"""
+    server = ThreadingHTTPServer((getattr(settings, 'METRICS_BIND_ADDRESS', '127.0.0.1'), port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f'metrics-{port}', daemon=True).start()
+    logger.info(f"进程内指标服务已启动: {server.server_address[0]}:{port}/metrics")
+    return server
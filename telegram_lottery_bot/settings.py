@@ -86,7 +86,9 @@ DATABASES = {
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'charset': 'utf8mb4',
-        }
+        },
+        # 数据库线程池中的每个线程保持持久连接，超过该时间（秒）后重新连接
+        'CONN_MAX_AGE': 600,
     }
 }
 
@@ -136,3 +138,150 @@ STATIC_URL = '/static/'
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# 发言积分写后缓冲：开启后发言积分先在内存中累计，由后台任务批量落库
+# 设置为 False 可回退到逐条同步写库
+MESSAGE_POINTS_WRITE_BEHIND = True
+# 批量落库的时间间隔（毫秒）
+MESSAGE_POINTS_FLUSH_INTERVAL_MS = 1000
+# 缓冲区累计达到该事件数时立即落库
+MESSAGE_POINTS_FLUSH_MAX_EVENTS = 200
+
+# 群组积分规则缓存的过期时间（秒），管理员修改规则时会主动失效
+POINT_RULE_CACHE_TTL = 300
+
+# 群组成员缓存的最大条目数（LRU 淘汰）
+MEMBERSHIP_CACHE_SIZE = 50000
+# 群组成员缓存的过期时间（秒）。成员加入/离开时会主动失效（分片模式下广播给所有工作进程），
+# 过期时间只用于兜底（例如失效消息因队列已满未能送达）
+MEMBERSHIP_CACHE_TTL = 300
+
+# 邀请链接登记在内存中最多保留的记录数（按最近使用淘汰）。启动时只加载匹配窗口内的邀请
+INVITE_REGISTRY_CACHE_SIZE = 20000
+# 邀请链接内存索引未命中时，同一查询回查数据库的最短间隔（秒）
+INVITE_REGISTRY_RECHECK_INTERVAL = 10
+
+# 抽奖参与条件（频道/群组成员）检查结果的缓存时间（秒），未加入的结果使用较短的缓存时间
+REQUIREMENT_CACHE_TTL = 60
+REQUIREMENT_CACHE_NEGATIVE_TTL = 10
+# 参与条件缓存的最大条目数
+REQUIREMENT_CACHE_SIZE = 50000
+# 同一频道/群组同时进行的 get_chat_member 请求数上限
+REQUIREMENT_CHECK_PER_CHAT_CONCURRENCY = 5
+# 后台重新解析参与条件中频道/群组ID、类型和机器人管理员状态的间隔（秒）
+REQUIREMENT_REVALIDATE_INTERVAL = 3600
+
+# 抽奖详情/群组公告渲染结果的缓存时间（秒）和最大条目数，抽奖、奖品或参与条件修改后立即失效
+RENDER_CACHE_TTL = 300
+RENDER_CACHE_SIZE = 2000
+
+# /check_lottery 抽奖列表每页显示的抽奖数
+CHECK_LOTTERY_PAGE_SIZE = 10
+
+# 群组抽奖列表总页数使用的抽奖总数缓存时间（秒），新建或删除抽奖时立即失效
+LIST_LOTTERIES_COUNT_TTL = 300
+
+# 开奖调度器兜底全量核对的间隔（秒），正常开奖由调度器按开奖时间精确唤醒
+LOTTERY_DRAW_SWEEP_INTERVAL = 600
+# 开奖失败（如数据库暂时不可用）后首次重试的等待时间（秒），之后每次翻倍，最长为全量核对间隔
+LOTTERY_DRAW_RETRY_DELAY = 30
+# 同时进行的开奖数量上限
+LOTTERY_DRAW_CONCURRENCY = 5
+# 抽奖停留在“开奖中”状态超过该时间（秒）视为开奖进程中断，核对时恢复为进行中
+LOTTERY_DRAW_CLAIM_TIMEOUT = 600
+
+# 出站消息发送队列：并发发送协程数
+SEND_QUEUE_WORKERS = 8
+# 全局发送速率（条/秒），分片模式下由各工作进程平分
+SEND_QUEUE_GLOBAL_RATE = 30
+# 单个私聊的发送速率（条/秒）
+SEND_QUEUE_PRIVATE_CHAT_RATE = 1.0
+# 单个群组的发送速率（条/分钟）
+SEND_QUEUE_GROUP_CHAT_RATE_PER_MINUTE = 20
+# 网络错误或限速时的最大尝试次数
+SEND_QUEUE_MAX_ATTEMPTS = 5
+
+# 积分排行榜从数据库重建的间隔（秒），期间由积分变动增量更新
+LEADERBOARD_REBUILD_INTERVAL = 3600
+
+# 数据库线程池的线程数（每个线程一个持久连接，使用 SQLite 时固定为 1）
+DB_EXECUTOR_WORKERS = 8
+# 连接空闲超过该时间（秒）后，使用前先检查连接是否可用
+DB_EXECUTOR_HEALTH_CHECK_INTERVAL = 60
+
+# 同时处理的更新数上限（同一聊天、同一用户的更新始终按顺序处理），设为 1 时逐条处理
+UPDATE_CONCURRENCY = 64
+# 已接收但未处理完的更新数上限，超出后新更新等待
+UPDATE_MAX_PENDING = 1000
+
+# 接收更新的方式: 'polling' 轮询 getUpdates，'webhook' 由 Telegram 推送到 /telegram/webhook/
+BOT_UPDATE_MODE = 'polling'
+# webhook 模式下向 Telegram 注册的公网地址，例如 https://bot.example.com/telegram/webhook/
+BOT_WEBHOOK_URL = ''
+# webhook 请求头 X-Telegram-Bot-Api-Secret-Token 的值（1-256 个字符，只能包含 A-Z a-z 0-9 _ -）
+BOT_WEBHOOK_SECRET = ''
+# 待处理更新队列的容量，队列满时返回 503 让 Telegram 稍后重推
+BOT_WEBHOOK_QUEUE_SIZE = 1000
+# Telegram 向 webhook 同时发起的最大连接数
+BOT_WEBHOOK_MAX_CONNECTIONS = 40
+
+# 多进程分片运行（python manage.py run_sharded_bot）：按聊天ID把更新分发到多个工作进程
+SHARD_WORKERS = 4
+# 工作进程心跳超过该时间（秒）未更新视为卡死，强制重启
+SHARD_HEARTBEAT_TIMEOUT = 30
+# 每个工作进程待处理更新队列的容量，队列满时暂停轮询
+SHARD_QUEUE_SIZE = 1000
+# 工作进程启动（初始化 Django 和处理器）的宽限时间（秒）
+SHARD_STARTUP_GRACE = 120
+
+# 处理器耗时/数据库查询/API 调用统计，通过 /metrics 以 Prometheus 文本格式输出。
+# 统计保存在运行机器人的进程中：Django 的 /metrics 视图只包含同一进程（webhook 模式）的数据，
+# 轮询模式和分片模式需要配置 METRICS_PORT，由机器人进程自己提供 /metrics
+METRICS_ENABLED = True
+# 机器人进程自带的 /metrics 端口，为空时不启动；run_sharded_bot 的工作进程 i 使用 METRICS_PORT + 1 + i
+METRICS_PORT = None
+# 机器人进程 /metrics 的监听地址
+METRICS_BIND_ADDRESS = '127.0.0.1'
+# 访问 /metrics 需要的令牌（请求头 Authorization: Bearer <令牌>），为空且未配置 METRICS_ALLOWED_IPS 时拒绝所有请求
+METRICS_TOKEN = ''
+# 无需令牌即可访问 /metrics 的来源地址，默认为空。
+# 注意在同一台机器上的反向代理之后，所有请求的来源地址都是 127.0.0.1，此时不要把本机地址加入该列表
+METRICS_ALLOWED_IPS = []
+
+# 日志配置：各模块只需 logging.getLogger(__name__)
+# 日志先进入内存队列，由后台线程写入终端/文件；高频日志按 logger 抽样
+LOG_LEVEL = 'INFO'
+# 日志文件路径，为空时只输出到终端
+LOG_FILE = None
+# INFO 及以下级别日志的保留比例（按 logger 名称前缀匹配），WARNING 及以上级别始终保留
+LOG_SAMPLE_RATES = {
+    'jifen.message_handlers': 0.05,
+    'jifen.message_ledger': 0.2,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {
+            '()': 'telegram_lottery_bot.logging_utils.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
+    },
+    'handlers': {
+        'async_queue': {
+            '()': 'telegram_lottery_bot.logging_utils.AsyncQueueHandler',
+            'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            'filename': LOG_FILE,
+            'filters': ['sampling'],
+        },
+    },
+    'root': {
+        'handlers': ['async_queue'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        # httpx 每次请求 Telegram API 都会输出 INFO 日志
+        'httpx': {'level': 'WARNING'},
+    },
+}
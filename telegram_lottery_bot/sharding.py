@@ -0,0 +1,317 @@
+"""
+多进程分片运行机器人
+
+调度进程负责轮询 getUpdates，按聊天ID（私聊的聊天ID即用户ID）把更新分发给 N 个工作进程：
+- 使用 rendezvous 一致性哈希选择工作进程，同一聊天的更新总是进入同一个进程，保持聊天内的顺序
+- 工作进程运行与 run_bot 完全相同的处理器（create_application + register_handlers）
+- 工作进程每秒写一次心跳；进程退出或心跳超时时调度进程将其重启，
+  重启期间该进程负责的聊天按一致性哈希临时分给其他存活进程，其他聊天不受影响
+- 抽奖自动开奖和参与条件的后台解析只在 0 号工作进程中运行，避免多个进程重复调度
+- 每个进程有自己的发送队列，全局发送速率 SEND_QUEUE_GLOBAL_RATE 按工作进程数平分。
+  按聊天的限速仍按进程计算：0 号进程发送的开奖结果和中奖私信可能与该聊天所在进程的消息叠加，
+  这类消息很少，偶尔超限时由发送队列的 429 暂停重试处理
+
+注意：user_data / chat_data 保存在各进程内存中。私聊中的会话（抽奖设置等）按用户ID分片，
+始终在同一个进程中处理。进程内缓存的一致性：
+- 积分规则缓存和群组成员缓存的失效经调度进程广播给所有工作进程（jifen.cache_invalidation），
+  成员缓存另有 MEMBERSHIP_CACHE_TTL 过期时间兜底；参与抽奖时成员状态以数据库为准
+- 邀请链接登记在内存索引未命中时回查数据库（同一查询每 INVITE_REGISTRY_RECHECK_INTERVAL 秒最多一次），
+  其他进程创建或更新的邀请链接最多延迟这么久即可匹配
+- 抽奖渲染缓存以抽奖的 updated_at 为版本，其他进程的修改通过版本号发现
+- 参与条件检查结果按 REQUIREMENT_CACHE_TTL 过期；排行榜只反映本进程应用的积分变化，
+  由定期重建（LEADERBOARD_REBUILD_INTERVAL）与数据库对齐
+已分发到故障进程、尚未处理的更新会随进程一起丢失。
+运行指标保存在各工作进程中，配置 METRICS_PORT 后工作进程 i 在 METRICS_PORT + 1 + i 端口提供 /metrics。
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 依次查找的带 chat 字段的更新类型
+CHAT_UPDATE_FIELDS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'my_chat_member', 'chat_member', 'chat_join_request',
+)
+# 只带用户信息的更新类型
+USER_UPDATE_FIELDS = (
+    'inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query', 'poll_answer',
+)
+
+
+def shard_key(data):
+    """返回更新的分片键：聊天ID，没有聊天时使用用户ID"""
+    for field in CHAT_UPDATE_FIELDS:
+        obj = data.get(field)
+        if obj and obj.get('chat'):
+            return obj['chat']['id']
+    callback_query = data.get('callback_query')
+    if callback_query:
+        message = callback_query.get('message')
+        if message and message.get('chat'):
+            return message['chat']['id']
+        return callback_query['from']['id']
+    for field in USER_UPDATE_FIELDS:
+        obj = data.get(field)
+        if obj:
+            user = obj.get('from') or obj.get('user')
+            if user:
+                return user['id']
+    return data.get('update_id', 0)
+
+
+def pick_worker(key, workers):
+    """rendezvous 哈希：在候选工作进程中选出得分最高的一个，候选集合变化时只有少量键需要迁移"""
+    def score(index):
+        digest = hashlib.blake2b(f"{key}:{index}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+    return max(workers, key=score)
+
+
+# ---------- 工作进程 ----------
+
+def worker_main(index, inbox, heartbeats, run_drawer, worker_count=1, control=None):
+    """工作进程入口（spawn 方式启动，需要重新初始化 Django）"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'telegram_lottery_bot.settings')
+    import django
+    django.setup()
+
+    from telegram_bot import create_application, register_handlers
+    from choujiang.lottery_drawer import start_lottery_drawer
+    from choujiang.requirement_checker import start_requirement_revalidator
+    from jifen import cache_invalidation
+    from jifen.db_executor import db_executor
+    from jifen.invite_registry import invite_registry
+    from jifen.leaderboard import start_leaderboard
+    from jifen.message_ledger import message_ledger, start_message_ledger
+    from jifen.send_queue import set_sender_process_count
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+    from telegram_lottery_bot.metrics import install_query_counter, instrument_application, start_metrics_server
+
+    set_sender_process_count(worker_count)
+    invite_registry.set_shared(worker_count > 1)
+    if control is not None:
+        # 本进程的缓存失效经调度进程转发给其他工作进程
+        cache_invalidation.set_broadcaster(lambda kind, key: control.put((index, kind, key)))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        metrics_enabled = getattr(settings, 'METRICS_ENABLED', True)
+        application = create_application()
+        if metrics_enabled:
+            loop.run_until_complete(sync_to_async(install_query_counter)())
+        loop.run_until_complete(application.bot.initialize())
+        if run_drawer:
+            loop.run_until_complete(start_lottery_drawer(application.bot))
+            loop.run_until_complete(start_requirement_revalidator(application.bot))
+        loop.run_until_complete(start_message_ledger())
+        loop.run_until_complete(start_leaderboard())
+        register_handlers(application)
+        if metrics_enabled:
+            instrument_application(application)
+            # 各工作进程的指标保存在自己的内存中，分别通过 METRICS_PORT + 1 + 序号提供
+            if getattr(settings, 'METRICS_PORT', None):
+                start_metrics_server(settings.METRICS_PORT + 1 + index)
+        logger.info(f"[分片] 工作进程 {index} (pid={os.getpid()}) 已启动")
+        loop.run_until_complete(_consume(application, index, inbox, heartbeats))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        message_ledger.shutdown()
+        db_executor.shutdown()
+        logger.info(f"[分片] 工作进程 {index} 已退出")
+
+
+async def _consume(application, index, inbox, heartbeats):
+    """从进程间队列读取更新交给 Application 处理，收到 None 时退出"""
+    from telegram import Update
+    from jifen.cache_invalidation import apply_remote
+
+    async def beat():
+        while True:
+            heartbeats[index] = time.time()
+            await asyncio.sleep(1)
+
+    await application.initialize()
+    await application.start()
+    heartbeat_task = asyncio.create_task(beat())
+    reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shard-inbox')
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(reader, inbox.get)
+            if data is None:
+                break
+            if '_invalidate' in data:
+                apply_remote(*data['_invalidate'])
+                continue
+            update = Update.de_json(data, application.bot)
+            if update is not None:
+                await application.update_queue.put(update)
+    finally:
+        heartbeat_task.cancel()
+        reader.shutdown(wait=False)
+        await application.stop()
+        await application.shutdown()
+
+
+# ---------- 调度进程 ----------
+
+class ShardDispatcher:
+    """轮询 Telegram 更新并按聊天分发到工作进程，负责健康检查和故障重启"""
+
+    def __init__(self, token, workers=4, queue_size=1000, heartbeat_timeout=30,
+                 startup_grace=120, health_check_interval=5):
+        self.token = token
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.heartbeat_timeout = heartbeat_timeout
+        self.startup_grace = startup_grace
+        self.health_check_interval = health_check_interval
+        # spawn 启动，避免 fork 继承父进程的线程和数据库连接
+        self._ctx = multiprocessing.get_context('spawn')
+        self._heartbeats = self._ctx.Array('d', workers, lock=False)
+        self._processes = [None] * workers
+        self._inboxes = [None] * workers
+        # 工作进程发来的缓存失效 (来源进程, 类型, 键)，由转发线程广播给其他工作进程
+        self._control = self._ctx.Queue()
+        self.restarts = 0
+        self.dispatched = [0] * workers
+
+    def _spawn(self, index):
+        inbox = self._ctx.Queue(maxsize=self.queue_size)
+        # 新进程需要时间初始化 Django 和处理器，在宽限期内不检查心跳
+        self._heartbeats[index] = time.time() + self.startup_grace
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(index, inbox, self._heartbeats, index == 0, self.worker_count, self._control),
+            name=f'bot-shard-{index}',
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+        self._inboxes[index] = inbox
+        logger.info(f"[分片] 已启动工作进程 {index} (pid={process.pid})")
+
+    def is_healthy(self, index):
+        process = self._processes[index]
+        return (process is not None and process.is_alive()
+                and time.time() - self._heartbeats[index] < self.heartbeat_timeout)
+
+    def live_workers(self):
+        return [index for index in range(self.worker_count) if self.is_healthy(index)]
+
+    def check_health(self):
+        """重启已退出或心跳超时的工作进程"""
+        for index in range(self.worker_count):
+            if self.is_healthy(index):
+                continue
+            process = self._processes[index]
+            if process is not None and process.is_alive():
+                logger.error(f"[分片] 工作进程 {index} 心跳超时，强制重启")
+                process.terminate()
+            else:
+                logger.error(f"[分片] 工作进程 {index} 已退出 (exitcode={process.exitcode if process else None})，重新启动")
+            if process is not None:
+                process.join(timeout=10)
+            self.restarts += 1
+            self._spawn(index)
+
+    def dispatch(self, data):
+        """按分片键把更新放入对应工作进程的队列（队列满时阻塞，对轮询形成背压）"""
+        key = shard_key(data)
+        candidates = self.live_workers() or list(range(self.worker_count))
+        index = pick_worker(key, candidates)
+        while True:
+            try:
+                self._inboxes[index].put(data, timeout=1)
+                self.dispatched[index] += 1
+                return index
+            except queue.Full:
+                logger.warning(f"[分片] 工作进程 {index} 的队列已满，等待处理")
+                if not self.is_healthy(index):
+                    self.check_health()
+
+    def forward_invalidations(self):
+        """把工作进程发来的缓存失效转发给其他工作进程（在线程中运行，收到 None 时退出）"""
+        while True:
+            message = self._control.get()
+            if message is None:
+                return
+            origin, kind, key = message
+            for index, inbox in enumerate(self._inboxes):
+                if index == origin or inbox is None:
+                    continue
+                try:
+                    inbox.put({'_invalidate': [kind, key]}, timeout=1)
+                except queue.Full:
+                    logger.warning(f"[分片] 工作进程 {index} 的队列已满，缓存失效 {kind}:{key} 未能送达")
+
+    async def run(self):
+        from telegram import Bot, Update
+        from telegram.error import NetworkError, RetryAfter
+        from telegram_bot import clear_all_commands_and_set_start
+
+        for index in range(self.worker_count):
+            self._spawn(index)
+
+        bot = Bot(self.token)
+        await bot.initialize()
+        # 轮询前删除 webhook，否则 getUpdates 会失败
+        await bot.delete_webhook()
+        await clear_all_commands_and_set_start(bot)
+
+        loop = asyncio.get_running_loop()
+        # dispatch 在队列满时会阻塞，放到线程中执行
+        dispatcher_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shard-dispatch')
+        forwarder_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shard-invalidate')
+        forwarder_thread.submit(self.forward_invalidations)
+        offset = None
+        last_check = time.monotonic()
+        logger.info(f"[分片] 调度进程已启动，{self.worker_count} 个工作进程")
+        try:
+            while True:
+                if time.monotonic() - last_check >= self.health_check_interval:
+                    await loop.run_in_executor(dispatcher_thread, self.check_health)
+                    last_check = time.monotonic()
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset, timeout=self.health_check_interval, allowed_updates=Update.ALL_TYPES
+                    )
+                except RetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except NetworkError as e:
+                    logger.warning(f"[分片] 获取更新失败: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    await loop.run_in_executor(dispatcher_thread, self.dispatch, update.to_dict())
+                    offset = update.update_id + 1
+        finally:
+            dispatcher_thread.shutdown(wait=False)
+            self._control.put(None)
+            forwarder_thread.shutdown(wait=False)
+            await bot.shutdown()
+
+    def stop(self):
+        """通知所有工作进程处理完队列中的更新后退出"""
+        for index, inbox in enumerate(self._inboxes):
+            if inbox is not None and self._processes[index] is not None and self._processes[index].is_alive():
+                try:
+                    inbox.put(None, timeout=5)
+                except queue.Full:
+                    self._processes[index].terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=30)
+                if process.is_alive():
+                    process.terminate()
+        logger.info(f"[分片] 已停止全部工作进程，共分发 {sum(self.dispatched)} 条更新，重启 {self.restarts} 次")
@@ -0,0 +1,112 @@
+"""
+并发处理更新，按聊天和用户保持顺序
+
+默认的 Application 逐条处理更新，一个处理器里较慢的 get_chat_member 调用会阻塞所有群组的消息。
+KeyedUpdateProcessor 让不同聊天、不同用户的更新并发处理：
+- 每条更新按 effective_chat 和 effective_user 得到两个键，同一个键上的更新严格按到达顺序依次处理，
+  所以同一聊天内的消息、同一用户的操作不会乱序，ConversationHandler（按聊天+用户记录状态）的状态切换也保持顺序
+- 全局最多同时执行 UPDATE_CONCURRENCY 个更新；排队等待前序更新的更新不占用并发名额，
+  避免一个繁忙群组占满全部名额
+- 最多接收 UPDATE_MAX_PENDING 个未处理完的更新，超出时按到达顺序等待
+"""
+import asyncio
+import logging
+import weakref
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# 已创建的处理器，供 /metrics 汇总
+_processors = weakref.WeakSet()
+
+
+def update_keys(update):
+    """返回更新的排序键：聊天和用户各一个"""
+    keys = []
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            keys.append(('chat', update.effective_chat.id))
+        if update.effective_user is not None:
+            keys.append(('user', update.effective_user.id))
+    return keys
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """按键排序的并发更新处理器"""
+
+    def __init__(self, max_concurrent_updates=64, max_pending_updates=1000):
+        # 基类的信号量限制已接收但未处理完的更新数量，实际并发由 _running 控制
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.concurrency = max_concurrent_updates
+        self._running = None
+        # 每个键上最后一条更新的完成标记，后到的更新等待它完成
+        self._tails = {}
+        self.active = 0
+        self.waiting = 0
+        self.processed = 0
+        _processors.add(self)
+
+    async def initialize(self):
+        self._running = asyncio.Semaphore(self.concurrency)
+
+    async def shutdown(self):
+        self._tails.clear()
+
+    async def do_process_update(self, update, coroutine):
+        keys = update_keys(update)
+        previous = {self._tails[key] for key in keys if key in self._tails}
+        done = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._tails[key] = done
+
+        started = False
+        self.waiting += 1
+        try:
+            # shield：当前更新被取消时不影响前序更新的完成标记
+            for tail in previous:
+                await asyncio.shield(tail)
+            async with self._running:
+                self.waiting -= 1
+                self.active += 1
+                started = True
+                try:
+                    await coroutine
+                finally:
+                    self.active -= 1
+                    self.processed += 1
+        finally:
+            if not started:
+                self.waiting -= 1
+                # 更新在开始处理前被取消，关闭协程避免 "never awaited" 警告
+                coroutine.close()
+            done.set_result(None)
+            for key in keys:
+                if self._tails.get(key) is done:
+                    del self._tails[key]
+
+    def stats(self):
+        return {
+            'concurrency': self.concurrency,
+            'active': self.active,
+            'waiting': self.waiting,
+            'keys': len(self._tails),
+            'processed': self.processed,
+        }
+
+
+def processor_stats():
+    """汇总所有处理器的运行统计"""
+    totals = {'concurrency': 0, 'active': 0, 'waiting': 0, 'keys': 0, 'processed': 0}
+    for processor in list(_processors):
+        for key, value in processor.stats().items():
+            totals[key] += value
+    return totals
+
+
+def create_update_processor(concurrency, max_pending):
+    """按配置创建更新处理器，concurrency 不大于 1 时返回 None（保持逐条处理）"""
+    if concurrency <= 1:
+        return None
+    return KeyedUpdateProcessor(max_concurrent_updates=concurrency, max_pending_updates=max_pending)
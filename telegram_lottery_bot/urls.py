@@ -15,10 +15,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, Http404
 import logging
 import asyncio
 from choujiang.lottery_drawer import initialize_lottery_drawer_for_django
+from django.views.decorators.csrf import csrf_exempt
+from telegram_lottery_bot.metrics import metrics_access_allowed, render_metrics
+from telegram_lottery_bot.webhook import handle_webhook_request
 from telegram import Bot
 import threading
 
@@ -55,9 +59,29 @@ def initialize_lottery_drawer_view(request):
             logger.error(f"初始化抽奖开奖器时出错: {e}")
             return HttpResponse(f"初始化抽奖开奖器时出错: {e}")
 
+# 视图函数，以 Prometheus 文本格式输出机器人运行指标
+def metrics_view(request):
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        raise Http404("指标统计未开启")
+    if not metrics_access_allowed(request.META.get('HTTP_AUTHORIZATION', ''), request.META.get('REMOTE_ADDR')):
+        logger.warning(f"拒绝未授权的 /metrics 请求，来源 {request.META.get('REMOTE_ADDR')}")
+        return HttpResponseForbidden('forbidden')
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# 视图函数，接收 Telegram 推送的更新（BOT_UPDATE_MODE = 'webhook' 时使用）
+@csrf_exempt
+def telegram_webhook_view(request):
+    status, text = handle_webhook_request(request)
+    response = HttpResponse(text, status=status, content_type='text/plain; charset=utf-8')
+    if status == 503:
+        response['Retry-After'] = '1'
+    return response
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('init-lottery-drawer/', initialize_lottery_drawer_view, name='init_lottery_drawer'),
+    path('metrics', metrics_view, name='metrics'),
+    path('telegram/webhook/', telegram_webhook_view, name='telegram_webhook'),
 ]
 
 # 尝试在Django启动时自动初始化抽奖开奖器
@@ -0,0 +1,159 @@
+"""
+Webhook 接收更新
+
+BOT_UPDATE_MODE = 'webhook' 时，run_bot 不再轮询 getUpdates，而是向 Telegram 注册 webhook，
+由 Django（runserver 或 asgi.py）接收 Telegram 推送的更新：
+- 校验请求头 X-Telegram-Bot-Api-Secret-Token 与 BOT_WEBHOOK_SECRET 一致
+- 更新放入容量为 BOT_WEBHOOK_QUEUE_SIZE 的有界队列，由机器人事件循环中的 Application 消费
+- 队列已满时返回 503，Telegram 会稍后重新推送，起到背压作用
+- 只能运行一个接收进程：会话状态（ConversationHandler，如抽奖设置、管理员开奖）和 user_data / chat_data
+  保存在进程内存中，同一聊天/用户的处理顺序也只在单个进程内保证。不要在轮询负载均衡后面运行多个进程，
+  否则同一会话的各个步骤会落到不同进程；需要多进程时使用按聊天分片的 run_sharded_bot（轮询模式）
+"""
+import asyncio
+import concurrent.futures
+import hmac
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN'
+
+# submit 的结果
+ACCEPTED = 'accepted'
+QUEUE_FULL = 'queue_full'
+NOT_READY = 'not_ready'
+INVALID = 'invalid'
+
+
+class WebhookIngress:
+    """把 HTTP 线程收到的更新转交给机器人事件循环，线程安全"""
+
+    def __init__(self, submit_timeout=5):
+        self.submit_timeout = submit_timeout
+        self._application = None
+        self._loop = None
+        self._lock = threading.Lock()
+        self.stats = {ACCEPTED: 0, QUEUE_FULL: 0, NOT_READY: 0, INVALID: 0, 'unauthorized': 0}
+
+    def attach(self, application, loop):
+        """由 run_bot 在 Application 启动后调用"""
+        with self._lock:
+            self._application = application
+            self._loop = loop
+
+    def detach(self):
+        with self._lock:
+            self._application = None
+            self._loop = None
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    async def _enqueue(self, application, data):
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            return INVALID
+        try:
+            application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return QUEUE_FULL
+        return ACCEPTED
+
+    def submit(self, data):
+        """提交一条更新（在 HTTP 线程中调用），返回 ACCEPTED / QUEUE_FULL / NOT_READY / INVALID"""
+        with self._lock:
+            application, loop = self._application, self._loop
+        if application is None or loop is None or loop.is_closed():
+            result = NOT_READY
+        else:
+            try:
+                future = asyncio.run_coroutine_threadsafe(self._enqueue(application, data), loop)
+                result = future.result(timeout=self.submit_timeout)
+            except concurrent.futures.TimeoutError:
+                # 机器人事件循环过于繁忙，按背压处理
+                future.cancel()
+                result = NOT_READY
+            except Exception as e:
+                logger.error(f"提交 webhook 更新时出错: {e}", exc_info=True)
+                result = INVALID
+        self.count(result)
+        return result
+
+    def queue_depth(self):
+        application = self._application
+        return application.update_queue.qsize() if application is not None else 0
+
+
+webhook_ingress = WebhookIngress()
+
+
+def check_secret(request):
+    """校验 Telegram 随 webhook 请求发送的 secret token"""
+    secret = getattr(settings, 'BOT_WEBHOOK_SECRET', '')
+    if not secret:
+        return False
+    return hmac.compare_digest(request.META.get(SECRET_HEADER, '').encode('utf-8'), secret.encode('utf-8'))
+
+
+def handle_webhook_request(request):
+    """
+    处理 webhook HTTP 请求，返回 (HTTP 状态码, 响应文本)
+
+    Telegram 对非 2xx 响应会重新推送，所以只有格式错误的请求返回 400（重推也无法处理）
+    """
+    if request.method != 'POST':
+        return 405, 'method not allowed'
+    if not check_secret(request):
+        webhook_ingress.count('unauthorized')
+        logger.warning(f"拒绝 secret token 不正确的 webhook 请求，来源 {request.META.get('REMOTE_ADDR')}")
+        return 403, 'forbidden'
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        webhook_ingress.count(INVALID)
+        return 400, 'invalid json'
+
+    result = webhook_ingress.submit(data)
+    if result == ACCEPTED:
+        return 200, 'ok'
+    if result == INVALID:
+        return 400, 'invalid update'
+    if result == QUEUE_FULL:
+        logger.warning("webhook 更新队列已满，返回 503 等待 Telegram 重新推送")
+    return 503, result
+
+
+async def start_webhook(application, loop):
+    """
+    以 webhook 模式启动 Application（需在机器人事件循环中调用）
+
+    注册 webhook 后启动 Application 消费更新队列，并开始接收 Django 转交的更新
+    """
+    if not getattr(settings, 'BOT_WEBHOOK_URL', '') or not getattr(settings, 'BOT_WEBHOOK_SECRET', ''):
+        raise ImproperlyConfigured("webhook 模式需要配置 BOT_WEBHOOK_URL 和 BOT_WEBHOOK_SECRET")
+    await application.initialize()
+    await application.bot.set_webhook(
+        url=settings.BOT_WEBHOOK_URL,
+        secret_token=settings.BOT_WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+        max_connections=getattr(settings, 'BOT_WEBHOOK_MAX_CONNECTIONS', 40),
+    )
+    await application.start()
+    webhook_ingress.attach(application, loop)
+    logger.info(f"webhook 已注册: {settings.BOT_WEBHOOK_URL}")
+
+
+async def stop_webhook(application):
+    """停止接收更新并关闭 Application（队列中剩余的更新会先处理完）"""
+    webhook_ingress.detach()
+    if application.running:
+        await application.stop()
+    await application.shutdown()